@@ -1,7 +1,11 @@
 from flask import Flask, jsonify
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 from .config import config
-from .extensions import db, migrate, jwt, bcrypt, cors, limiter
+from .extensions import db, migrate, jwt, bcrypt, cors, limiter, password_hasher, user_cache, claims_revocations, count_cache, response_cache, image_pipeline, blob_store, resumable_uploads, event_hub, scheduler, provider_http, token_cache, job_queue
+from .services.password_service import PasswordHasherBusy
+from .services.image_service import ImagePipelineBusy
+from .services.event_hub import EventHubFull
 
 def create_app(config_name='default'):
     app = Flask(__name__)
@@ -9,6 +13,14 @@ def create_app(config_name='default'):
     # Load configuration
     app.config.from_object(config[config_name])
     
+    # Trust X-Forwarded-For from our own proxies so quotas see client addresses
+    if app.config.get('PROXY_FIX_X_FOR'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'], x_proto=1)
+    
+    # Id column storage has to be settled before any statement is compiled
+    from .utils.ids import GUID
+    GUID.native = app.config.get('NATIVE_UUIDS', False)
+    
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
@@ -16,11 +28,49 @@ def create_app(config_name='default'):
     bcrypt.init_app(app)
     cors.init_app(app, resources={r"/api/*": {"origins": "*"}})
     limiter.init_app(app)
+    password_hasher.init_app(app)
+    user_cache.init_app(app)
+    claims_revocations.init_app(app)
+    count_cache.init_app(app)
+    response_cache.init_app(app)
+    image_pipeline.init_app(app)
+    blob_store.init_app(app)
+    resumable_uploads.init_app(app)
+    event_hub.init_app(app)
+    scheduler.init_app(app)
+    provider_http.init_app(app)
+    token_cache.init_app(app)
+    job_queue.init_app(app)
     
     # Register blueprints
     from .routes import bp
     app.register_blueprint(bp, url_prefix='/api')
     
+    # Keep dashboard rollups current on every write
+    from .services.stats_service import register_stats_listeners
+    register_stats_listeners()
+    
+    # Keep the memorial search index current on every write
+    from .services.search_service import register_search_listeners
+    register_search_listeners()
+    
+    # Release media references when their owners are deleted
+    from .services.media_service import register_media_listeners
+    register_media_listeners()
+    
+    # Periodic sweeps: expired fundraisers and lapsed subscriptions
+    from .services.lifecycle_service import register_lifecycle_jobs
+    register_lifecycle_jobs(app)
+    
+    # Background jobs: STK pushes run on the durable job queue
+    from .services.payment_service import register_payment_jobs
+    register_payment_jobs(app)
+    scheduler.register('prune_job_queue', job_queue.prune, 3600)
+    
+    # CLI commands
+    from .commands import register_commands
+    register_commands(app)
+    
     # Create upload directory
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
@@ -32,8 +82,7 @@ def create_app(config_name='default'):
     @jwt.user_lookup_loader
     def user_lookup_callback(_jwt_header, jwt_data):
         identity = jwt_data["sub"]
-        from .models import User
-        return User.query.filter_by(id=identity).one_or_none()
+        return user_cache.lazy(identity)
     
     # Error handlers
     @app.errorhandler(404)
@@ -48,6 +97,14 @@ def create_app(config_name='default'):
     def ratelimit_handler(e):
         return jsonify({'error': 'Rate limit exceeded'}), 429
     
+    @app.errorhandler(PasswordHasherBusy)
+    @app.errorhandler(ImagePipelineBusy)
+    @app.errorhandler(EventHubFull)
+    def server_busy(e):
+        response = jsonify({'error': 'Server is busy, please try again shortly'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    
     return app
 
 def create_admin_user():
@@ -0,0 +1,173 @@
+import click
+from flask.cli import AppGroup, with_appcontext
+
+stats_cli = AppGroup('stats', help='Dashboard statistics.')
+
+@stats_cli.command('reconcile')
+def reconcile_stats():
+    """Recompute dashboard counters from the base tables"""
+    from app.services.stats_service import reconcile_dashboard_stats
+    
+    counters = reconcile_dashboard_stats()
+    click.echo(f'Reconciled {len(counters)} counters')
+
+@stats_cli.command('backfill-donations')
+@click.option('--fundraiser', 'fundraiser_ids', multiple=True, help='Fundraiser to rebuild (default: all).')
+def backfill_donation_rollups(fundraiser_ids):
+    """Rebuild per-fundraiser hourly, daily and donor rollups from the donations table"""
+    from app.extensions import db
+    from app.models import Fundraiser
+    from app.services.stats_service import rebuild_fundraiser_rollups
+    
+    fundraiser_ids = fundraiser_ids or [row.id for row in db.session.query(Fundraiser.id).order_by(Fundraiser.id)]
+    donations = 0
+    # One transaction per fundraiser keeps locks and undo bounded
+    for fundraiser_id in fundraiser_ids:
+        donations += rebuild_fundraiser_rollups(fundraiser_id)
+        db.session.commit()
+    click.echo(f'Rebuilt rollups for {len(fundraiser_ids)} fundraisers from {donations} donations')
+
+search_cli = AppGroup('search', help='Memorial search index.')
+
+@search_cli.command('reindex')
+def reindex_search():
+    """Rebuild the memorial search index from the memorials table"""
+    from app.extensions import db
+    from app.services.search_service import reindex
+    
+    with db.engine.begin() as connection:
+        count = reindex(connection)
+    click.echo(f'Indexed {count} memorials')
+
+media_cli = AppGroup('media', help='Uploaded media.')
+
+@media_cli.command('gc')
+@click.option('--grace', type=int, default=None, help='Seconds an unreferenced blob is kept (default MEDIA_GC_GRACE).')
+@click.option('--scan', is_flag=True, help='Also remove files on disk that have no database row.')
+def collect_media_garbage(grace, scan):
+    """Expire abandoned uploads and delete media blobs that nothing references"""
+    from datetime import timedelta
+    from flask import current_app
+    from app.extensions import blob_store, resumable_uploads
+    from app.services.media_service import collect_garbage
+    
+    expired = resumable_uploads.expire()
+    click.echo(f'Expired {expired} upload sessions')
+    
+    grace = current_app.config['MEDIA_GC_GRACE'] if grace is None else grace
+    removed, freed = collect_garbage(blob_store, grace=timedelta(seconds=grace), scan=scan)
+    click.echo(f'Removed {removed} blobs ({freed} bytes)')
+
+payments_cli = AppGroup('payments', help='Payments and provider settlements.')
+
+@payments_cli.command('reconcile')
+@click.option('--mpesa', type=click.Path(exists=True, dir_okay=False), help='M-Pesa organisation statement (CSV).')
+@click.option('--stripe', type=click.Path(exists=True, dir_okay=False), help='Stripe payments or balance export (CSV).')
+@click.option('--report', type=click.Path(dir_okay=False, writable=True), default=None, help='Mismatch report CSV (default: stdout).')
+@click.option('--window', type=int, default=600, show_default=True, help='Seconds between payment and settlement for a match without a reference.')
+@click.option('--batch-size', type=int, default=5000, show_default=True)
+@click.option('--apply', is_flag=True, help='Overwrite fundraiser totals with the amounts actually received.')
+def reconcile_payments(mpesa, stripe, report, window, batch_size, apply):
+    """Match settlement statements against payments and donations"""
+    import contextlib
+    import os
+    import sys
+    from datetime import timedelta
+    from app.services.reconciliation_service import reconcile, StatementError
+    
+    with contextlib.ExitStack() as stack:
+        statements = {
+            provider: (os.path.basename(path), stack.enter_context(open(path, newline='', encoding='utf-8-sig')))
+            for provider, path in (('mpesa', mpesa), ('stripe', stripe)) if path
+        }
+        out = stack.enter_context(open(report, 'w', newline='')) if report else sys.stdout
+        try:
+            run = reconcile(statements, out, window=timedelta(seconds=window), batch_size=batch_size, apply=apply)
+        except StatementError as e:
+            raise click.ClickException(str(e))
+    
+    for kind, count in sorted(run.summary.items()):
+        click.echo(f'{kind}: {count}', err=True)
+    click.echo(f'Run {run.id} ' + ('applied fundraiser corrections' if apply else 'made no changes to fundraiser totals'), err=True)
+
+jobs_cli = AppGroup('jobs', help='Durable background job queue.')
+
+@jobs_cli.command('work')
+@click.option('--workers', type=int, default=4, show_default=True, help='Worker threads.')
+@click.option('--burst', is_flag=True, help='Exit once no job is ready instead of waiting for more.')
+def work_jobs(workers, burst):
+    """Run queued jobs (STK pushes) in this process until interrupted"""
+    from flask import current_app
+    from app.extensions import job_queue
+    
+    if burst:
+        ran = 0
+        while job_queue.work_once():
+            ran += 1
+        click.echo(f'Ran {ran} jobs')
+        return
+    
+    click.echo(f'Working {", ".join(job_queue.kinds)} with {workers} threads; Ctrl+C to stop')
+    job_queue.start(current_app._get_current_object(), workers=workers)
+    try:
+        job_queue.join()
+    except KeyboardInterrupt:
+        job_queue.stop()
+        job_queue.join()
+
+@jobs_cli.command('stats')
+def job_stats():
+    """Jobs per kind and status"""
+    from app.extensions import job_queue
+    
+    stats = job_queue.stats()
+    for kind, counts in sorted(stats['kinds'].items()):
+        click.echo(f'{kind}: ' + ', '.join(f'{status} {count}' for status, count in sorted(counts.items())))
+    click.echo(f'Oldest ready job waiting {stats["oldest_ready_seconds"]}s')
+
+ids_cli = AppGroup('ids', help='Primary key storage.')
+
+@ids_cli.command('convert-to-uuid')
+def convert_ids_to_uuid():
+    """Convert VARCHAR(36) id columns to native uuid (PostgreSQL only)"""
+    from app.extensions import db
+    from app.utils.ids import convert_to_native_uuids
+    
+    if db.engine.dialect.name != 'postgresql':
+        raise click.ClickException('Native uuid storage is only available on PostgreSQL')
+    
+    with db.engine.begin() as connection:
+        converted = convert_to_native_uuids(connection, db.metadata, extra_columns=[('memorial_search', 'memorial_id')])
+    click.echo(f'Converted {len(converted)} columns; set NATIVE_UUIDS=true and restart')
+
+@click.command('sweep')
+@with_appcontext
+@click.option('--job', 'jobs', multiple=True, help='Job to run (default: every scheduled job).')
+@click.option('--batch-size', type=int, default=None, help='Rows per transaction (default SWEEP_BATCH_SIZE).')
+def sweep(jobs, batch_size):
+    """Run the periodic lifecycle jobs now, e.g. from cron with SCHEDULER_ENABLED=false"""
+    from app.extensions import scheduler
+    
+    unknown = set(jobs) - set(scheduler.jobs)
+    if unknown:
+        raise click.BadParameter(f'Unknown job {", ".join(sorted(unknown))}; choose from {", ".join(scheduler.jobs)}', param_hint='--job')
+    
+    failed = False
+    for name in jobs or scheduler.jobs:
+        run = scheduler.run(name, force=True, batch_size=batch_size)
+        if run is None:
+            click.echo(f'{name}: already running elsewhere, skipped')
+            continue
+        click.echo(f'{name}: {run.rows} rows in {run.duration_ms:.0f} ms' + (f' (failed: {run.error})' if run.error else ''))
+        failed = failed or bool(run.error)
+    if failed:
+        raise click.ClickException('One or more jobs failed')
+
+def register_commands(app):
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(media_cli)
+    app.cli.add_command(payments_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(ids_cli)
+    app.cli.add_command(sweep)
@@ -4,17 +4,43 @@ from flask_jwt_extended import JWTManager
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
+from app.services.password_service import PasswordHasher
+from app.services.user_cache import UserCache
+from app.services.claims_service import ClaimsRevocations
+from app.services.count_cache import CountCache
+from app.services.response_cache import ResponseCache
+from app.services.image_service import ImagePipeline
+from app.services.blob_store import BlobStore
+from app.services.upload_service import ResumableUploads
+from app.services.event_hub import EventHub
+from app.services.scheduler import Scheduler
+from app.services.http_client import ProviderHTTP
+from app.services.token_cache import TokenCache
+from app.services.job_queue import JobQueue
+from app.services import rate_limit_storage  # noqa: F401 - registers the sqlite:// limiter storage
+from app.services.quota_service import rate_limit_key
 
 db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
 bcrypt = Bcrypt()
 cors = CORS()
+password_hasher = PasswordHasher()
+user_cache = UserCache()
+claims_revocations = ClaimsRevocations()
+count_cache = CountCache()
+response_cache = ResponseCache()
+image_pipeline = ImagePipeline()
+blob_store = BlobStore()
+resumable_uploads = ResumableUploads()
+event_hub = EventHub()
+scheduler = Scheduler()
+provider_http = ProviderHTTP()
+token_cache = TokenCache()
+job_queue = JobQueue()
 
-# Initialize rate limiter with memory storage
-limiter = Limiter(
-    key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
-)
+# Initialize rate limiter; storage and strategy come from RATELIMIT_* config.
+# Quotas are per user (or per address when anonymous), sized by
+# subscription plan, with one read and one write bucket shared by every
+# API route (applied to the blueprint in app.routes).
+limiter = Limiter(key_func=rate_limit_key)
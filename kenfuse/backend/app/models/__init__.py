@@ -4,6 +4,11 @@ from .memorial import Memorial, MemorialVisibility, Tribute, MemorialPhoto, Memo
 from .fundraiser import Fundraiser, FundraiserStatus, Donation
 from .vendor import VendorProfile, VendorCategory, VendorStatus, VendorService, VendorBooking, VendorReview
 from .payment import Payment, PaymentStatus, PaymentMethod
+from .stats import StatCounter, DailyDonationStat, FundraiserHourlyStat, FundraiserDailyStat, FundraiserDonorStat
+from .media import MediaBlob, MediaReference, UploadSession
+from .scheduler import SchedulerLease, JobRun
+from .reconciliation import ReconciliationRun, SettlementLine
+from .job_queue import QueuedJob, QueuedJobStatus
 
 __all__ = [
     'User', 'UserRole', 'SubscriptionPlan',
@@ -11,5 +16,10 @@ __all__ = [
     'Memorial', 'MemorialVisibility', 'Tribute', 'MemorialPhoto', 'MemorialVideo',
     'Fundraiser', 'FundraiserStatus', 'Donation',
     'VendorProfile', 'VendorCategory', 'VendorStatus', 'VendorService', 'VendorBooking', 'VendorReview',
-    'Payment', 'PaymentStatus', 'PaymentMethod'
+    'Payment', 'PaymentStatus', 'PaymentMethod',
+    'StatCounter', 'DailyDonationStat', 'FundraiserHourlyStat', 'FundraiserDailyStat', 'FundraiserDonorStat',
+    'MediaBlob', 'MediaReference', 'UploadSession',
+    'SchedulerLease', 'JobRun',
+    'ReconciliationRun', 'SettlementLine',
+    'QueuedJob', 'QueuedJobStatus'
 ]
\ No newline at end of file
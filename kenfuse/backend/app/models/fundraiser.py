@@ -1,6 +1,7 @@
 from app.extensions import db
+from app.utils.ids import GUID, new_id
+from app.utils.images import srcset
 from datetime import datetime
-import uuid
 import enum
 
 class FundraiserStatus(enum.Enum):
@@ -11,10 +12,14 @@ class FundraiserStatus(enum.Enum):
 
 class Fundraiser(db.Model):
     __tablename__ = 'fundraisers'
+    __table_args__ = (
+        db.Index('ix_fundraisers_status_verified_created_at', 'status', 'is_verified', 'created_at', 'id'),  # Public listing
+        db.Index('ix_fundraisers_status_end_date', 'status', 'end_date'),  # Expiry sweep
+    )
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
-    memorial_id = db.Column(db.String(36), db.ForeignKey('memorials.id'), nullable=True)
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
+    memorial_id = db.Column(GUID, db.ForeignKey('memorials.id'), nullable=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
     target_amount = db.Column(db.Float, nullable=False)
@@ -22,11 +27,14 @@ class Fundraiser(db.Model):
     currency = db.Column(db.String(3), default='KES')
     status = db.Column(db.Enum(FundraiserStatus), default=FundraiserStatus.ACTIVE)
     cover_image = db.Column(db.String(500), nullable=True)
+    cover_variants = db.Column(db.JSON, nullable=True)
     end_date = db.Column(db.DateTime, nullable=False)
     is_verified = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    donations = db.relationship('Donation', lazy='dynamic', order_by='(Donation.created_at.desc(), Donation.id.desc())', viewonly=True)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -37,6 +45,7 @@ class Fundraiser(db.Model):
             'currency': self.currency,
             'status': self.status.value,
             'cover_image': self.cover_image,
+            'cover_srcset': srcset(self.cover_variants),
             'end_date': self.end_date.isoformat() if self.end_date else None,
             'is_verified': self.is_verified,
             'progress_percentage': min(100, (self.current_amount / self.target_amount * 100)) if self.target_amount > 0 else 0,
@@ -45,10 +54,13 @@ class Fundraiser(db.Model):
 
 class Donation(db.Model):
     __tablename__ = 'donations'
+    __table_args__ = (
+        db.Index('ix_donations_fundraiser_created_at', 'fundraiser_id', 'created_at'),
+    )
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    fundraiser_id = db.Column(db.String(36), db.ForeignKey('fundraisers.id'), nullable=False)
-    donor_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=True)
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    fundraiser_id = db.Column(GUID, db.ForeignKey('fundraisers.id'), nullable=False)
+    donor_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=True)
     amount = db.Column(db.Float, nullable=False)
     currency = db.Column(db.String(3), default='KES')
     payment_method = db.Column(db.String(20), nullable=False)  # mpesa, card
@@ -72,3 +84,15 @@ class Donation(db.Model):
             'is_anonymous': self.is_anonymous,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+    
+    def to_public_dict(self):
+        """What anyone may see: no contact details, and no name on anonymous donations"""
+        return {
+            'id': self.id,
+            'amount': self.amount,
+            'currency': self.currency,
+            'donor_name': 'Anonymous' if self.is_anonymous else self.donor_name,
+            'message': self.message,
+            'is_anonymous': self.is_anonymous,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,46 @@
+from app.extensions import db
+from app.utils.ids import GUID, new_id
+from datetime import datetime
+import enum
+
+class QueuedJobStatus(enum.Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+class QueuedJob(db.Model):
+    """One unit of background work, claimed by a worker with SKIP LOCKED"""
+    __tablename__ = 'job_queue'
+    __table_args__ = (
+        db.Index('ix_job_queue_status_run_at', 'status', 'run_at'),  # Claiming
+        db.Index('ix_job_queue_reference', 'reference'),
+    )
+
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    kind = db.Column(db.String(100), nullable=False)
+    reference = db.Column(db.String(100), nullable=True)  # What the job acts on, e.g. a payment id
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.Enum(QueuedJobStatus), nullable=False, default=QueuedJobStatus.QUEUED)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Not claimed before this
+    locked_by = db.Column(db.String(150), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)  # A running job past this is claimed again
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'reference': self.reference,
+            'status': self.status.value,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_at': self.run_at.isoformat() if self.run_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -0,0 +1,69 @@
+from app.extensions import db
+from app.utils.ids import GUID, new_id
+from datetime import datetime
+
+class MediaBlob(db.Model):
+    """One stored file, named by the sha256 of its content"""
+    __tablename__ = 'media_blobs'
+    __table_args__ = (
+        db.Index('ix_media_blobs_ref_count_updated_at', 'ref_count', 'updated_at'),  # Garbage collection
+    )
+    
+    hash = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    content_type = db.Column(db.String(100), nullable=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class MediaReference(db.Model):
+    """Use of a blob by a model field, e.g. fundraiser <id> cover"""
+    __tablename__ = 'media_references'
+    __table_args__ = (
+        db.Index('ix_media_references_owner', 'owner_type', 'owner_id', 'field'),
+        db.Index('ix_media_references_blob_hash', 'blob_hash'),
+    )
+    
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    blob_hash = db.Column(db.String(64), db.ForeignKey('media_blobs.hash'), nullable=False)
+    owner_type = db.Column(db.String(30), nullable=False)  # memorial, memorial_photo, memorial_video, fundraiser, vendor
+    owner_id = db.Column(GUID, nullable=False)
+    field = db.Column(db.String(30), nullable=False)
+    memorial_id = db.Column(GUID, nullable=True)  # Memorial whose visibility applies, if any
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UploadSession(db.Model):
+    """Resumable upload in progress; bytes are appended to a part file by offset"""
+    __tablename__ = 'upload_sessions'
+    __table_args__ = (
+        db.Index('ix_upload_sessions_expires_at', 'expires_at'),  # Expiry sweep
+    )
+    
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
+    memorial_id = db.Column(GUID, db.ForeignKey('memorials.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    caption = db.Column(db.String(200), nullable=True)
+    size = db.Column(db.BigInteger, nullable=False)  # Declared total
+    offset = db.Column(db.BigInteger, nullable=False, default=0)  # Bytes received so far
+    checksum = db.Column(db.String(64), nullable=True)  # Expected sha256 of the whole file
+    video_id = db.Column(GUID, nullable=True)  # Set once completed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    @property
+    def is_complete(self):
+        return self.video_id is not None
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'memorial_id': self.memorial_id,
+            'filename': self.filename,
+            'size': self.size,
+            'offset': self.offset,
+            'video_id': self.video_id,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
@@ -1,6 +1,7 @@
 from app.extensions import db
+from app.utils.ids import GUID, new_id
+from app.utils.images import srcset
 from datetime import datetime
-import uuid
 import enum
 
 class MemorialVisibility(enum.Enum):
@@ -10,14 +11,18 @@ class MemorialVisibility(enum.Enum):
 
 class Memorial(db.Model):
     __tablename__ = 'memorials'
+    __table_args__ = (
+        db.Index('ix_memorials_visibility_created_at', 'visibility', 'created_at', 'id'),  # Public listing
+    )
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
     deceased_name = db.Column(db.String(100), nullable=False)
     date_of_birth = db.Column(db.Date, nullable=False)
     date_of_passing = db.Column(db.Date, nullable=False)
     biography = db.Column(db.Text, nullable=True)
     photo_url = db.Column(db.String(500), nullable=True)
+    photo_variants = db.Column(db.JSON, nullable=True)  # Resized renditions, see image_service
     visibility = db.Column(db.Enum(MemorialVisibility), default=MemorialVisibility.PUBLIC)
     location = db.Column(db.String(200), nullable=True)
     obituary = db.Column(db.Text, nullable=True)
@@ -26,6 +31,12 @@ class Memorial(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Read-side relationships; collections are queried with a limit, never loaded whole
+    fundraisers = db.relationship('Fundraiser', order_by='Fundraiser.created_at.desc()', viewonly=True)
+    tributes = db.relationship('Tribute', lazy='dynamic', order_by='(Tribute.created_at.desc(), Tribute.id.desc())', viewonly=True)
+    photos = db.relationship('MemorialPhoto', lazy='dynamic', order_by='(MemorialPhoto.created_at.desc(), MemorialPhoto.id.desc())', viewonly=True)
+    videos = db.relationship('MemorialVideo', lazy='dynamic', order_by='(MemorialVideo.created_at.desc(), MemorialVideo.id.desc())', viewonly=True)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -34,6 +45,7 @@ class Memorial(db.Model):
             'date_of_passing': self.date_of_passing.isoformat() if self.date_of_passing else None,
             'biography': self.biography,
             'photo_url': self.photo_url,
+            'photo_srcset': srcset(self.photo_variants),
             'visibility': self.visibility.value,
             'location': self.location,
             'obituary': self.obituary,
@@ -44,10 +56,13 @@ class Memorial(db.Model):
 
 class Tribute(db.Model):
     __tablename__ = 'tributes'
+    __table_args__ = (
+        db.Index('ix_tributes_memorial_created_at', 'memorial_id', 'created_at'),
+    )
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    memorial_id = db.Column(db.String(36), db.ForeignKey('memorials.id'), nullable=False)
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    memorial_id = db.Column(GUID, db.ForeignKey('memorials.id'), nullable=False)
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
     message = db.Column(db.Text, nullable=False)
     author_name = db.Column(db.String(100), nullable=False)
     relationship = db.Column(db.String(50), nullable=True)
@@ -67,17 +82,20 @@ class Tribute(db.Model):
 class MemorialPhoto(db.Model):
     __tablename__ = 'memorial_photos'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    memorial_id = db.Column(db.String(36), db.ForeignKey('memorials.id'), nullable=False)
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    memorial_id = db.Column(GUID, db.ForeignKey('memorials.id'), nullable=False)
     photo_url = db.Column(db.String(500), nullable=False)
+    photo_variants = db.Column(db.JSON, nullable=True)
     caption = db.Column(db.String(200), nullable=True)
-    uploaded_by = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    uploaded_by = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def to_dict(self):
         return {
             'id': self.id,
             'photo_url': self.photo_url,
+            'photo_srcset': srcset(self.photo_variants),
+            'processing': self.photo_variants is None,
             'caption': self.caption,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -85,11 +103,11 @@ class MemorialPhoto(db.Model):
 class MemorialVideo(db.Model):
     __tablename__ = 'memorial_videos'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    memorial_id = db.Column(db.String(36), db.ForeignKey('memorials.id'), nullable=False)
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    memorial_id = db.Column(GUID, db.ForeignKey('memorials.id'), nullable=False)
     video_url = db.Column(db.String(500), nullable=False)
     caption = db.Column(db.String(200), nullable=True)
-    uploaded_by = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    uploaded_by = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def to_dict(self):
@@ -1,6 +1,6 @@
 from app.extensions import db
+from app.utils.ids import GUID, new_id
 from datetime import datetime
-import uuid
 import enum
 
 class PaymentStatus(enum.Enum):
@@ -16,9 +16,15 @@ class PaymentMethod(enum.Enum):
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('ix_payments_mpesa_receipt', 'mpesa_receipt'),  # Settlement matching
+        db.Index('ix_payments_stripe_payment_intent', 'stripe_payment_intent'),
+        db.Index('ix_payments_donation_id', 'donation_id'),
+        db.Index('ix_payments_method_created_at', 'payment_method', 'created_at'),
+    )
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=True)  # None for anonymous donations
     amount = db.Column(db.Float, nullable=False)
     currency = db.Column(db.String(3), default='KES')
     payment_method = db.Column(db.Enum(PaymentMethod), nullable=False)
@@ -26,6 +32,7 @@ class Payment(db.Model):
     transaction_id = db.Column(db.String(100), unique=True, nullable=True)
     mpesa_receipt = db.Column(db.String(50), nullable=True)
     stripe_payment_intent = db.Column(db.String(100), nullable=True)
+    donation_id = db.Column(GUID, db.ForeignKey('donations.id'), nullable=True)  # Set when the payment is for a donation
     description = db.Column(db.String(500), nullable=True)
     payment_metadata = db.Column(db.JSON, nullable=True)  # Changed from 'metadata' to 'payment_metadata'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -40,6 +47,7 @@ class Payment(db.Model):
             'status': self.status.value,
             'transaction_id': self.transaction_id,
             'mpesa_receipt': self.mpesa_receipt,
+            'donation_id': self.donation_id,
             'description': self.description,
             'payment_metadata': self.payment_metadata,  # Updated here too
             'created_at': self.created_at.isoformat() if self.created_at else None
@@ -0,0 +1,41 @@
+from app.extensions import db
+from app.utils.ids import GUID, new_id
+from datetime import datetime
+
+class ReconciliationRun(db.Model):
+    """One pass matching provider settlements against payments and donations"""
+    __tablename__ = 'reconciliation_runs'
+    
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    sources = db.Column(db.JSON, nullable=False)  # provider -> statement file name
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    applied = db.Column(db.Boolean, nullable=False, default=False)  # Fundraiser totals were corrected
+    summary = db.Column(db.JSON, nullable=True)  # Counts per mismatch kind
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'sources': self.sources,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'applied': self.applied,
+            'summary': self.summary
+        }
+
+class SettlementLine(db.Model):
+    """A statement line staged for the duration of a run, with the payment it matched"""
+    __tablename__ = 'settlement_lines'
+    __table_args__ = (
+        db.Index('ix_settlement_lines_run_reference', 'run_id', 'provider', 'reference'),
+        db.Index('ix_settlement_lines_run_payment', 'run_id', 'payment_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(GUID, db.ForeignKey('reconciliation_runs.id'), nullable=False)
+    provider = db.Column(db.String(20), nullable=False)  # mpesa, stripe
+    reference = db.Column(db.String(100), nullable=False)  # M-Pesa receipt or Stripe payment intent
+    amount = db.Column(db.Float, nullable=False)
+    settled_at = db.Column(db.DateTime, nullable=True)
+    payment_id = db.Column(GUID, nullable=True)
+    match = db.Column(db.String(20), nullable=True)  # reference, window
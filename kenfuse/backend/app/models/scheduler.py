@@ -0,0 +1,38 @@
+from app.extensions import db
+from app.utils.ids import GUID, new_id
+from datetime import datetime
+
+class SchedulerLease(db.Model):
+    """Which process may run a periodic job, and when it last started"""
+    __tablename__ = 'scheduler_leases'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    holder = db.Column(db.String(100), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)  # Lease is free once this has passed
+    last_run_at = db.Column(db.DateTime, nullable=True)
+
+class JobRun(db.Model):
+    """One execution of a periodic job"""
+    __tablename__ = 'job_runs'
+    __table_args__ = (
+        db.Index('ix_job_runs_name_started_at', 'name', 'started_at'),
+    )
+    
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    name = db.Column(db.String(100), nullable=False)
+    holder = db.Column(db.String(100), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    duration_ms = db.Column(db.Float, nullable=False)
+    rows = db.Column(db.Integer, nullable=False, default=0)  # Rows the job changed
+    error = db.Column(db.Text, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'holder': self.holder,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'duration_ms': round(self.duration_ms, 3),
+            'rows': self.rows,
+            'error': self.error
+        }
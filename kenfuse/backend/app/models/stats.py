@@ -0,0 +1,65 @@
+from app.extensions import db
+from app.utils.ids import GUID
+from datetime import datetime
+
+class StatCounter(db.Model):
+    """Incrementally maintained dashboard counter, e.g. users.role.family
+
+    A counter's value is the sum of its shard rows.
+    """
+    __tablename__ = 'stat_counters'
+    
+    name = db.Column(db.String(120), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, default=0)
+    value = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DailyDonationStat(db.Model):
+    """Donation count and total per day and payment method, summed over shards"""
+    __tablename__ = 'daily_donation_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    payment_method = db.Column(db.String(20), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+
+class FundraiserHourlyStat(db.Model):
+    """Donation count and total per fundraiser, hour and payment method"""
+    __tablename__ = 'fundraiser_hourly_stats'
+    
+    fundraiser_id = db.Column(GUID, db.ForeignKey('fundraisers.id'), primary_key=True)
+    hour = db.Column(db.DateTime, primary_key=True)  # Start of the UTC hour
+    payment_method = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+
+class FundraiserDailyStat(db.Model):
+    """Donation count and total per fundraiser, day and payment method"""
+    __tablename__ = 'fundraiser_daily_stats'
+    
+    fundraiser_id = db.Column(GUID, db.ForeignKey('fundraisers.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    payment_method = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+
+class FundraiserDonorStat(db.Model):
+    """Running total per donor for a fundraiser; anonymous gifts are left out"""
+    __tablename__ = 'fundraiser_donor_stats'
+    __table_args__ = (
+        db.Index('ix_fundraiser_donor_stats_fundraiser_amount', 'fundraiser_id', 'amount'),  # Top donors
+    )
+    
+    fundraiser_id = db.Column(GUID, db.ForeignKey('fundraisers.id'), primary_key=True)
+    donor_key = db.Column(db.String(64), primary_key=True)  # user:<id> or phone:<number>
+    donor_name = db.Column(db.String(100), nullable=False)  # As given on the latest gift
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'donor_name': self.donor_name,
+            'count': self.count,
+            'amount': round(self.amount, 2)
+        }
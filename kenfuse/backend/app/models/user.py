@@ -1,8 +1,7 @@
-from app.extensions import db
-from flask_bcrypt import Bcrypt
-bcrypt = Bcrypt()
+from app.extensions import db, password_hasher
+from app.utils.ids import GUID, new_id
+from sqlalchemy import event, inspect
 from datetime import datetime
-import uuid
 import enum
 
 class UserRole(enum.Enum):
@@ -17,8 +16,12 @@ class SubscriptionPlan(enum.Enum):
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_created_at_id', 'created_at', 'id'),  # Keyset pagination
+        db.Index('ix_users_plan_expiry', 'subscription_plan', 'subscription_expiry'),  # Subscription sweep
+    )
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(GUID, primary_key=True, default=new_id)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     phone = db.Column(db.String(20), nullable=False)
     first_name = db.Column(db.String(50), nullable=False)
@@ -29,6 +32,7 @@ class User(db.Model):
     subscription_expiry = db.Column(db.DateTime, nullable=True)
     is_verified = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
+    claims_version = db.Column(db.Integer, nullable=False, default=0)  # Bumped when JWT claims go stale
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -38,14 +42,27 @@ class User(db.Model):
     
     @password.setter
     def password(self, password):
-        from flask_bcrypt import Bcrypt
-        bcrypt = Bcrypt()
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
 
     def verify_password(self, password):
-        from flask_bcrypt import Bcrypt
-        bcrypt = Bcrypt()
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return password_hasher.verify(password, self.password_hash)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
+    
+    def effective_plan(self):
+        if self.subscription_expiry and self.subscription_expiry < datetime.utcnow():
+            return SubscriptionPlan.FREE
+        return self.subscription_plan
+    
+    def token_claims(self):
+        """Claims embedded in access tokens so gated routes can skip the DB"""
+        return {
+            'role': self.role.value,
+            'plan': self.subscription_plan.value,
+            'plan_expiry': self.subscription_expiry.isoformat() if self.subscription_expiry else None,
+            'cv': self.claims_version or 0
+        }
     
     def to_dict(self):
         return {
@@ -59,3 +76,11 @@ class User(db.Model):
             'is_verified': self.is_verified,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+def _bump_claims_version(target, value, oldvalue, initiator):
+    # Only existing rows carry tokens that can go stale
+    if inspect(target).has_identity and value != oldvalue:
+        target.claims_version = (target.claims_version or 0) + 1
+
+for _attr in (User.role, User.subscription_plan, User.subscription_expiry):
+    event.listen(_attr, 'set', _bump_claims_version, active_history=True)
@@ -1,6 +1,7 @@
 from app.extensions import db
+from app.utils.ids import GUID, new_id
+from app.utils.images import srcset
 from datetime import datetime
-import uuid
 import enum
 
 class VendorCategory(enum.Enum):
@@ -22,8 +23,8 @@ class VendorStatus(enum.Enum):
 class VendorProfile(db.Model):
     __tablename__ = 'vendor_profiles'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, unique=True)
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False, unique=True)
     business_name = db.Column(db.String(200), nullable=False)
     business_registration = db.Column(db.String(100), nullable=False)  # Business registration number
     category = db.Column(db.Enum(VendorCategory), nullable=False)
@@ -36,7 +37,9 @@ class VendorProfile(db.Model):
     email = db.Column(db.String(120), nullable=False)
     website = db.Column(db.String(200), nullable=True)
     logo_url = db.Column(db.String(500), nullable=True)
+    logo_variants = db.Column(db.JSON, nullable=True)
     cover_image = db.Column(db.String(500), nullable=True)
+    cover_variants = db.Column(db.JSON, nullable=True)
     status = db.Column(db.Enum(VendorStatus), default=VendorStatus.PENDING)
     is_featured = db.Column(db.Boolean, default=False)
     rating = db.Column(db.Float, default=0.0)
@@ -59,7 +62,9 @@ class VendorProfile(db.Model):
             'email': self.email,
             'website': self.website,
             'logo_url': self.logo_url,
+            'logo_srcset': srcset(self.logo_variants),
             'cover_image': self.cover_image,
+            'cover_srcset': srcset(self.cover_variants),
             'status': self.status.value,
             'is_featured': self.is_featured,
             'rating': self.rating,
@@ -71,8 +76,8 @@ class VendorProfile(db.Model):
 class VendorService(db.Model):
     __tablename__ = 'vendor_services'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    vendor_id = db.Column(db.String(36), db.ForeignKey('vendor_profiles.id'), nullable=False)
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    vendor_id = db.Column(GUID, db.ForeignKey('vendor_profiles.id'), nullable=False)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
     price = db.Column(db.Float, nullable=False)
@@ -97,10 +102,10 @@ class VendorService(db.Model):
 class VendorBooking(db.Model):
     __tablename__ = 'vendor_bookings'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    vendor_id = db.Column(db.String(36), db.ForeignKey('vendor_profiles.id'), nullable=False)
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
-    service_id = db.Column(db.String(36), db.ForeignKey('vendor_services.id'), nullable=False)
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    vendor_id = db.Column(GUID, db.ForeignKey('vendor_profiles.id'), nullable=False)
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
+    service_id = db.Column(GUID, db.ForeignKey('vendor_services.id'), nullable=False)
     booking_date = db.Column(db.DateTime, nullable=False)
     amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, completed, cancelled
@@ -121,9 +126,9 @@ class VendorBooking(db.Model):
 class VendorReview(db.Model):
     __tablename__ = 'vendor_reviews'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    vendor_id = db.Column(db.String(36), db.ForeignKey('vendor_profiles.id'), nullable=False)
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    vendor_id = db.Column(GUID, db.ForeignKey('vendor_profiles.id'), nullable=False)
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)  # 1-5
     comment = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -1,6 +1,6 @@
 from app.extensions import db
+from app.utils.ids import GUID, new_id
 from datetime import datetime
-import uuid
 import enum
 
 class WillStatus(enum.Enum):
@@ -12,8 +12,8 @@ class WillStatus(enum.Enum):
 class Will(db.Model):
     __tablename__ = 'wills'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    id = db.Column(GUID, primary_key=True, default=new_id)
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
     status = db.Column(db.Enum(WillStatus), default=WillStatus.DRAFT)
@@ -1,10 +1,36 @@
-from flask import Blueprint, send_from_directory, current_app
+import mimetypes
+import os
+
+from flask import Blueprint, jsonify, current_app
+from werkzeug.security import safe_join
+from app.extensions import limiter
+from app.services.quota_service import quota_limit, quota_scope, is_preflight
+from app.utils.media_files import send_media_file
 
 bp = Blueprint('api', __name__)
 
+# Plan quotas: a shared scope per read/write class, so one bucket per caller
+# across all routes instead of one per endpoint; routes with their own
+# @limiter.limit (login, register) use that instead
+limiter.shared_limit(quota_limit, scope=quota_scope, exempt_when=is_preflight)(bp)
+
 # Import all routes
-from . import auth, wills, memorials, fundraisers, vendors, payments, admin
+from . import auth, wills, memorials, fundraisers, vendors, payments, admin, media
 
 @bp.route('/static/uploads/<filename>')
 def serve_uploaded_file(filename):
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+    path = safe_join(current_app.config['UPLOAD_FOLDER'], filename)
+    
+    if path is None or not os.path.isfile(path):
+        return jsonify({'error': 'Not found'}), 404
+    
+    # Names here are not content hashes, so clients revalidate every time
+    stat = os.stat(path)
+    return send_media_file(
+        path,
+        mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        etag=f'{stat.st_mtime_ns:x}-{stat.st_size:x}',
+        max_age=0,
+        public=False,
+        accel_path=current_app.config['MEDIA_ACCEL_PREFIX'] + 'uploads/' + filename
+    )
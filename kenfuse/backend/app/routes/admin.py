@@ -1,36 +1,159 @@
-from flask import request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import User, UserRole
+from flask import request, jsonify, Response, stream_with_context
+from datetime import datetime, timezone
+import csv
+import io
+import json
+from app.models import User, UserRole, SubscriptionPlan
+from app.extensions import db, password_hasher, resumable_uploads, event_hub, scheduler, provider_http, token_cache, job_queue
+from app.utils.decorators import claims_required
+from app.utils.metrics import metrics
+from app.utils.pagination import keyset_page
+from app.services.stats_service import get_dashboard_stats
 from . import bp
 
 @bp.route('/dashboard', methods=['GET'])
-@jwt_required()
+@claims_required(roles=[UserRole.ADMIN.value])
 def admin_dashboard():
-    current_user_id = get_jwt_identity()
-    
-    # Check if user is admin
-    user = User.query.get(current_user_id)
-    if not user or user.role != UserRole.ADMIN:
-        return jsonify({'error': 'Unauthorized'}), 403
+    days = min(max(request.args.get('days', 30, type=int), 1), 365)
     
     return jsonify({
-        'message': 'Admin dashboard endpoint',
-        'user': user.to_dict()
+        'stats': get_dashboard_stats(days)
     }), 200
 
 @bp.route('/users', methods=['GET'])
-@jwt_required()
+@claims_required(roles=[UserRole.ADMIN.value])
 def get_all_users():
-    current_user_id = get_jwt_identity()
+    query = User.query
+    
+    # Filters
+    if 'role' in request.args:
+        try:
+            query = query.filter_by(role=UserRole(request.args['role']))
+        except ValueError:
+            return jsonify({'error': 'Invalid role specified'}), 400
+    if 'plan' in request.args:
+        try:
+            query = query.filter_by(subscription_plan=SubscriptionPlan(request.args['plan']))
+        except ValueError:
+            return jsonify({'error': 'Invalid subscription plan'}), 400
+    if 'verified' in request.args:
+        query = query.filter_by(is_verified=request.args['verified'].lower() == 'true')
+    
+    export_format = request.args.get('format')
+    if export_format in ('ndjson', 'csv'):
+        return _export_users(query, export_format)
     
-    # Check if user is admin
-    user = User.query.get(current_user_id)
-    if not user or user.role != UserRole.ADMIN:
-        return jsonify({'error': 'Unauthorized'}), 403
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
     
-    users = User.query.all()
+    try:
+        users, next_cursor = keyset_page(query, User, request.args.get('cursor'), limit)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
     
     return jsonify({
         'users': [user.to_dict() for user in users],
-        'total': len(users)
+        'count': len(users),
+        'next_cursor': next_cursor
+    }), 200
+
+def _export_users(query, export_format):
+    """Stream every matching user from a server-side cursor in constant memory"""
+    rows = query.order_by(User.created_at, User.id).yield_per(1000)
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = None
+        for index, user in enumerate(rows, 1):
+            data = user.to_dict()
+            if export_format == 'ndjson':
+                buffer.write(json.dumps(data))
+                buffer.write('\n')
+            else:
+                if writer is None:
+                    writer = csv.DictWriter(buffer, fieldnames=list(data))
+                    writer.writeheader()
+                writer.writerow(data)
+            if index % 500 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+    filename = f"users-{datetime.utcnow().strftime('%Y%m%d')}.{export_format}"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@bp.route('/users/<user_id>', methods=['PUT'])
+@claims_required(roles=[UserRole.ADMIN.value])
+def update_user(user_id):
+    target = User.query.get(user_id)
+    
+    if not target:
+        return jsonify({'error': 'User not found'}), 404
+    
+    data = request.get_json()
+    
+    # Update allowed fields
+    if 'role' in data:
+        try:
+            target.role = UserRole(data['role'])
+        except ValueError:
+            return jsonify({'error': 'Invalid role specified'}), 400
+    if 'subscription_plan' in data:
+        try:
+            target.subscription_plan = SubscriptionPlan(data['subscription_plan'])
+        except ValueError:
+            return jsonify({'error': 'Invalid subscription plan'}), 400
+    if 'subscription_expiry' in data:
+        expiry = None
+        if data['subscription_expiry']:
+            try:
+                expiry = datetime.fromisoformat(data['subscription_expiry'].replace('Z', '+00:00'))
+            except ValueError:
+                return jsonify({'error': 'Invalid date format. Use ISO format'}), 400
+            # Stored as naive UTC like every other timestamp
+            if expiry.tzinfo:
+                expiry = expiry.astimezone(timezone.utc).replace(tzinfo=None)
+        target.subscription_expiry = expiry
+    if 'is_active' in data:
+        target.is_active = bool(data['is_active'])
+    if 'is_verified' in data:
+        target.is_verified = bool(data['is_verified'])
+    
+    # Commit also evicts the user from the identity cache and, if role or
+    # plan changed, rejects their older access tokens
+    db.session.commit()
+    
+    return jsonify({
+        'message': 'User updated successfully',
+        'user': target.to_dict()
+    }), 200
+
+@bp.route('/metrics', methods=['GET'])
+@claims_required(roles=[UserRole.ADMIN.value])
+def get_metrics():
+    return jsonify({
+        'metrics': metrics.snapshot(),
+        'password_hashing': password_hasher.stats(),
+        'uploads': resumable_uploads.stats(),
+        'event_hub': event_hub.stats(),
+        'provider_http': provider_http.stats(),
+        'provider_tokens': token_cache.stats(),
+        'job_queue': job_queue.stats()
+    }), 200
+
+@bp.route('/scheduler/runs', methods=['GET'])
+@claims_required(roles=[UserRole.ADMIN.value])
+def get_scheduler_runs():
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    runs = scheduler.recent_runs(request.args.get('job'), limit)
+    
+    return jsonify({
+        'jobs': {name: job.interval.total_seconds() for name, job in scheduler.jobs.items()},
+        'runs': [run.to_dict() for run in runs]
     }), 200
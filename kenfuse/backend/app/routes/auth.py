@@ -1,6 +1,6 @@
 from flask import request, jsonify, current_app
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
-from app.extensions import db, limiter
+from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, current_user
+from app.extensions import db, limiter, user_cache
 from app.models import User, UserRole
 from . import bp
 
@@ -47,7 +47,7 @@ def register():
     db.session.commit()
     
     # Create tokens
-    access_token = create_access_token(identity=str(user.id))
+    access_token = create_access_token(identity=str(user.id), additional_claims=user.token_claims())
     refresh_token = create_refresh_token(identity=str(user.id))
     
     return jsonify({
@@ -73,8 +73,13 @@ def login():
     if not user.is_active:
         return jsonify({'error': 'Account is disabled'}), 403
     
+    # Upgrade the stored hash if the configured work factor changed
+    if user.password_needs_rehash():
+        user.password = data['password']
+        db.session.commit()
+    
     # Create tokens
-    access_token = create_access_token(identity=str(user.id))
+    access_token = create_access_token(identity=str(user.id), additional_claims=user.token_claims())
     refresh_token = create_refresh_token(identity=str(user.id))
     
     return jsonify({
@@ -88,7 +93,13 @@ def login():
 @jwt_required(refresh=True)
 def refresh():
     current_user_id = get_jwt_identity()
-    access_token = create_access_token(identity=current_user_id)
+    
+    # Re-read role and plan so the new token carries current claims
+    user = user_cache.get(current_user_id)
+    if not user or not user.is_active:
+        return jsonify({'error': 'User not found or disabled'}), 401
+    
+    access_token = create_access_token(identity=current_user_id, additional_claims=user.token_claims())
     
     return jsonify({
         'access_token': access_token
@@ -97,8 +108,7 @@ def refresh():
 @bp.route('/me', methods=['GET'])
 @jwt_required()
 def get_current_user():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = current_user
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -110,8 +120,7 @@ def get_current_user():
 @bp.route('/update-profile', methods=['PUT'])
 @jwt_required()
 def update_profile():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = current_user
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -134,8 +143,7 @@ def update_profile():
 @bp.route('/change-password', methods=['POST'])
 @jwt_required()
 def change_password():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = current_user
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
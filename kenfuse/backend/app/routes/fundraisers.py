@@ -1,21 +1,28 @@
-from flask import request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.extensions import db
-from app.models import Fundraiser, FundraiserStatus, Donation, User, Payment, PaymentMethod, PaymentStatus
-from datetime import datetime
+from flask import request, jsonify, current_app, Response, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from sqlalchemy import func, select
+from app.extensions import db, count_cache, response_cache, event_hub
+from app.models import Fundraiser, FundraiserStatus, Donation, User, UserRole, Payment, PaymentMethod, PaymentStatus
+from datetime import datetime, timezone
+from app.utils.decorators import claims_required
+from app.utils.pagination import keyset_page
+from app.utils.http_cache import Validators
+from app.utils.ids import transaction_id
+from app.services.stats_service import watermark
+from app.services.donation_service import add_to_total, progress, FundraiserClosed
+from app.services.payment_service import enqueue_stk_push, normalize_phone
+from app.services.analytics_service import donation_series, top_donors, InvalidRange
+from app.services.event_hub import encode_event
+import math
+import time
 from . import bp
 
 @bp.route('/fundraisers', methods=['POST'])
-@jwt_required()
+@claims_required(plans=['standard', 'premium'], message='Free users cannot create fundraisers. Upgrade to Standard or Premium.')
 def create_fundraiser():
     current_user_id = get_jwt_identity()
     data = request.get_json()
     
-    # Check if user has permission
-    user = User.query.get(current_user_id)
-    if user.subscription_plan.value == 'free':
-        return jsonify({'error': 'Free users cannot create fundraisers. Upgrade to Standard or Premium.'}), 403
-    
     required_fields = ['title', 'description', 'target_amount', 'end_date']
     for field in required_fields:
         if field not in data:
@@ -48,37 +55,88 @@ def create_fundraiser():
         'fundraiser': fundraiser.to_dict()
     }), 201
 
+def _fundraisers_query(status, verified_only):
+    query = Fundraiser.query
+    
+    if status is not None:
+        query = query.filter_by(status=status)
+    
+    if verified_only:
+        query = query.filter_by(is_verified=True)
+    
+    return query
+
 @bp.route('/fundraisers', methods=['GET'])
+@response_cache.cached(tags=['fundraisers'])
 def get_fundraisers():
-    status = request.args.get('status', 'active')
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    per_page = min(max(request.args.get('per_page', 10, type=int), 1), 100)
     verified_only = request.args.get('verified', 'true').lower() == 'true'
     
-    query = Fundraiser.query
+    # Unknown statuses list everything, as before
+    try:
+        status = FundraiserStatus(request.args.get('status', 'active'))
+    except ValueError:
+        status = None
+    
+    # Any fundraiser write moves the watermark; donation totals do not, so they may lag it, hence a weak ETag
+    validators = Validators('fundraisers', watermark('watermark.fundraisers'), sorted(request.args.items()), weak=True)
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    
+    # Cached total, refreshed in the background instead of COUNT(*) per page
+    count_key = f"fundraisers:{status.value if status else 'all'}:{verified_only}"
+    total = count_cache.get(count_key, lambda: _fundraisers_query(status, verified_only).count())
     
-    if status != 'all':
+    # Cursor mode: keyset on (created_at, id), no OFFSET
+    if 'cursor' in request.args:
         try:
-            query = query.filter_by(status=FundraiserStatus(status))
+            fundraisers, next_cursor = keyset_page(
+                _fundraisers_query(status, verified_only), Fundraiser, request.args['cursor'], per_page
+            )
         except ValueError:
-            pass
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        return validators.apply(jsonify({
+            'fundraisers': [fundraiser.to_dict() for fundraiser in fundraisers],
+            'total': total,
+            'next_cursor': next_cursor
+        })), 200
     
-    if verified_only:
-        query = query.filter_by(is_verified=True)
+    page = request.args.get('page', 1, type=int)
     
-    fundraisers = query.order_by(Fundraiser.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+    fundraisers = _fundraisers_query(status, verified_only).order_by(Fundraiser.created_at.desc(), Fundraiser.id.desc()).paginate(
+        page=page, per_page=per_page, error_out=False, count=False
     )
     
-    return jsonify({
+    return validators.apply(jsonify({
         'fundraisers': [fundraiser.to_dict() for fundraiser in fundraisers.items],
-        'total': fundraisers.total,
-        'pages': fundraisers.pages,
+        'total': total,
+        'pages': math.ceil(total / per_page) if per_page > 0 else 0,
         'current_page': page
-    }), 200
+    })), 200
 
 @bp.route('/fundraisers/<fundraiser_id>', methods=['GET'])
+@response_cache.cached(tags=['fundraiser:{fundraiser_id}'])
 def get_fundraiser(fundraiser_id):
+    # Version lookup: the row's updated_at plus the newest donation, in one query
+    latest_donation = select(func.max(Donation.created_at)).where(
+        Donation.fundraiser_id == Fundraiser.id
+    ).scalar_subquery()
+    version = db.session.query(Fundraiser.updated_at, latest_donation).filter(Fundraiser.id == fundraiser_id).first()
+    
+    if not version:
+        return jsonify({'error': 'Fundraiser not found'}), 404
+    
+    updated_at, latest = version
+    validators = Validators(
+        'fundraiser', fundraiser_id, updated_at, latest,
+        last_modified=max(filter(None, (updated_at, latest)), default=None)
+    )
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    
     fundraiser = Fundraiser.query.get(fundraiser_id)
     
     if not fundraiser:
@@ -90,17 +148,19 @@ def get_fundraiser(fundraiser_id):
     response = fundraiser.to_dict()
     response['recent_donations'] = [donation.to_dict() for donation in donations]
     
-    return jsonify(response), 200
+    return validators.apply(jsonify(response)), 200
 
 @bp.route('/fundraisers/<fundraiser_id>/donate', methods=['POST'])
 @jwt_required(optional=True)
 def donate_to_fundraiser(fundraiser_id):
-    fundraiser = Fundraiser.query.get(fundraiser_id)
+    # Only what the payment needs; the total is updated atomically below
+    fundraiser = db.session.query(Fundraiser.title, Fundraiser.status, Fundraiser.end_date).filter_by(id=fundraiser_id).first()
     
     if not fundraiser:
         return jsonify({'error': 'Fundraiser not found'}), 404
     
-    if fundraiser.status != FundraiserStatus.ACTIVE:
+    # Ended fundraisers are closed by the lifecycle sweep; until then they are refused here
+    if fundraiser.status != FundraiserStatus.ACTIVE or fundraiser.end_date <= datetime.utcnow():
         return jsonify({'error': 'This fundraiser is not accepting donations'}), 400
     
     data = request.get_json()
@@ -110,15 +170,33 @@ def donate_to_fundraiser(fundraiser_id):
         if field not in data:
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
+    try:
+        amount = float(data['amount'])
+        payment_method = PaymentMethod(data['payment_method'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid amount or payment method'}), 400
+    
+    if amount <= 0:
+        return jsonify({'error': 'Amount must be greater than zero'}), 400
+    
+    if payment_method == PaymentMethod.MPESA:
+        # STK push only takes whole shillings
+        if amount < 1 or amount != int(amount):
+            return jsonify({'error': 'Amount must be a whole number of shillings'}), 400
+        try:
+            mpesa_phone = normalize_phone(data['donor_phone'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
     current_user_id = get_jwt_identity()
     
     # Create donation record
     donation = Donation(
         fundraiser_id=fundraiser_id,
         donor_id=current_user_id,
-        amount=float(data['amount']),
-        payment_method=data['payment_method'],
-        transaction_id=f"TXN{datetime.utcnow().strftime('%Y%m%d%H%M%S')}",
+        amount=amount,
+        payment_method=payment_method.value,
+        transaction_id=transaction_id(),
         donor_name=data['donor_name'],
         donor_email=data.get('donor_email'),
         donor_phone=data['donor_phone'],
@@ -126,13 +204,17 @@ def donate_to_fundraiser(fundraiser_id):
         is_anonymous=data.get('is_anonymous', False)
     )
     
+    db.session.add(donation)
+    db.session.flush()
+    
     # Create payment record
     payment = Payment(
-        user_id=current_user_id if current_user_id else None,
-        amount=float(data['amount']),
-        payment_method=PaymentMethod(data['payment_method']),
+        user_id=current_user_id,
+        amount=amount,
+        payment_method=payment_method,
         description=f"Donation to: {fundraiser.title}",
-        metadata={
+        donation_id=donation.id,
+        payment_metadata={
             'fundraiser_id': fundraiser_id,
             'donation_id': donation.id,
             'donor_name': data['donor_name'],
@@ -140,24 +222,71 @@ def donate_to_fundraiser(fundraiser_id):
         }
     )
     
-    db.session.add(donation)
     db.session.add(payment)
+    db.session.flush()
     
-    # Update fundraiser total
-    fundraiser.current_amount += float(data['amount'])
+    # The donor is prompted by a job worker once this commits, not on this request
+    if payment_method == PaymentMethod.MPESA:
+        enqueue_stk_push(payment, mpesa_phone, "Donation")
     
-    # Check if target reached
-    if fundraiser.current_amount >= fundraiser.target_amount:
-        fundraiser.status = FundraiserStatus.COMPLETED
+    # Last statement before commit, so the fundraiser row is locked briefly
+    try:
+        add_to_total(fundraiser_id, amount)
+    except FundraiserClosed:
+        db.session.rollback()
+        return jsonify({'error': 'This fundraiser is not accepting donations'}), 400
     
     db.session.commit()
     
     return jsonify({
         'message': 'Donation initiated successfully',
         'donation': donation.to_dict(),
-        'payment': payment.to_dict()
+        'payment': payment.to_dict(),
+        'status_url': url_for('api.get_payment_status', payment_id=payment.id)
     }), 201
 
+@bp.route('/fundraisers/<fundraiser_id>/stream', methods=['GET'])
+def stream_fundraiser(fundraiser_id):
+    """Server-Sent Events: progress after every donation, plus public donations
+
+    The stream closes after SSE_MAX_DURATION; browsers reconnect on
+    their own and Last-Event-ID replays anything published in between.
+    """
+    fundraiser = db.session.query(
+        Fundraiser.current_amount, Fundraiser.target_amount, Fundraiser.status
+    ).filter_by(id=fundraiser_id).first()
+    
+    if not fundraiser:
+        return jsonify({'error': 'Fundraiser not found'}), 404
+    
+    last_event_id = request.headers.get('Last-Event-ID')
+    snapshot = {'id': str(time.time_ns()), 'type': 'progress', 'data': progress(*fundraiser)}
+    heartbeat = current_app.config['SSE_HEARTBEAT']
+    deadline = time.monotonic() + current_app.config['SSE_MAX_DURATION']
+    subscription = event_hub.subscribe(f'fundraiser:{fundraiser_id}', last_event_id=last_event_id)
+    
+    # Runs after the request context is gone, so it must not touch the database
+    def generate():
+        with subscription:
+            yield 'retry: 3000\n\n'  # Reconnect delay in milliseconds
+            if not last_event_id:
+                yield encode_event(snapshot)
+            while not subscription.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                event = subscription.get(timeout=min(heartbeat, remaining))
+                yield encode_event(event) if event else ': keep-alive\n\n'
+    
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # nginx must not buffer the stream
+    })
+    # The server closes the response even when the generator never starts
+    # (HEAD, or a client gone before the first byte)
+    response.call_on_close(subscription.close)
+    return response
+
 @bp.route('/fundraisers/<fundraiser_id>/donations', methods=['GET'])
 def get_fundraiser_donations(fundraiser_id):
     fundraiser = Fundraiser.query.get(fundraiser_id)
@@ -179,6 +308,50 @@ def get_fundraiser_donations(fundraiser_id):
         'current_page': page
     }), 200
 
+def _parse_time(value):
+    """ISO 8601 query value as naive UTC, like the stored timestamps"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+@bp.route('/fundraisers/<fundraiser_id>/analytics', methods=['GET'])
+@claims_required()
+def get_fundraiser_analytics(fundraiser_id):
+    """Donation charts for the owner, read from the rollup tables only
+
+    Query: from/to (ISO 8601, default the fundraiser's lifetime so far),
+    points (at most this many buckets, default 200), bucket (force a
+    width such as 'hour' or 'day'), top (number of top donors).
+    """
+    fundraiser = db.session.query(Fundraiser.user_id, Fundraiser.created_at).filter_by(id=fundraiser_id).first()
+    
+    if not fundraiser or (fundraiser.user_id != get_jwt_identity() and get_jwt().get('role') != UserRole.ADMIN.value):
+        return jsonify({'error': 'Fundraiser not found or unauthorized'}), 404
+    
+    try:
+        end = _parse_time(request.args['to']) if 'to' in request.args else datetime.utcnow()
+        start = _parse_time(request.args['from']) if 'from' in request.args else (fundraiser.created_at or end)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use ISO format'}), 400
+    
+    if start > end:
+        return jsonify({'error': 'from must be before to'}), 400
+    
+    points = min(max(request.args.get('points', 200, type=int), 1), 1000)
+    top = min(max(request.args.get('top', 10, type=int), 0), 50)
+    
+    try:
+        analytics = donation_series(fundraiser_id, start, end, max_points=points, bucket=request.args.get('bucket'))
+    except InvalidRange as e:
+        return jsonify({'error': str(e)}), 400
+    
+    analytics['from'] = start.isoformat()
+    analytics['to'] = end.isoformat()
+    analytics['top_donors'] = top_donors(fundraiser_id, top) if top else []
+    
+    return jsonify(analytics), 200
+
 @bp.route('/fundraisers/user', methods=['GET'])
 @jwt_required()
 def get_user_fundraisers():
@@ -0,0 +1,292 @@
+import mimetypes
+import os
+
+from flask import request, jsonify, current_app, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.extensions import db, image_pipeline, blob_store, resumable_uploads
+from app.models import Memorial, MemorialVisibility, MemorialPhoto, Fundraiser, VendorProfile, MediaReference, UploadSession
+from app.services.image_service import InvalidImage, ImagePipelineBusy
+from app.services.upload_service import InvalidUpload, UploadTooLarge, UploadOffsetMismatch
+from app.utils.decorators import current_plan
+from app.utils.media_files import send_media_file
+from . import bp
+from .memorials import _visibility_error
+
+# Blob names are content hashes, so a URL's bytes never change
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Raw chunk bodies; anything else (e.g. multipart) would be written to the file as-is
+CHUNK_MIMETYPES = {'application/offset+octet-stream', 'application/octet-stream'}
+
+@bp.route('/media/<blob_hash>/<name>', methods=['GET'])
+@jwt_required(optional=True)
+def serve_media(blob_hash, name):
+    try:
+        path = blob_store.path(blob_hash)
+    except ValueError:
+        return jsonify({'error': 'Not found'}), 404
+    
+    public, error = _media_access(blob_hash, get_jwt_identity())
+    if error:
+        return error
+    
+    if not os.path.exists(path):
+        return jsonify({'error': 'Not found'}), 404
+    
+    accel_path = current_app.config['MEDIA_ACCEL_PREFIX'] + 'blobs/' + os.path.relpath(path, blob_store.root)
+    return send_media_file(
+        path,
+        mimetypes.guess_type(name)[0] or 'application/octet-stream',
+        etag=blob_hash,
+        max_age=IMMUTABLE_MAX_AGE,
+        public=public,
+        immutable=True,
+        accel_path=accel_path
+    )
+
+def _media_access(blob_hash, current_user_id):
+    """(public, None) when the blob may be served, else (False, error response)
+
+    A blob shared by several owners is public if any of them is: media
+    outside a memorial, or under a public memorial. Otherwise the caller
+    needs access to one of the memorials that use it.
+    """
+    owners = db.session.query(MediaReference.memorial_id, Memorial.visibility, Memorial.user_id).outerjoin(
+        Memorial, Memorial.id == MediaReference.memorial_id
+    ).filter(MediaReference.blob_hash == blob_hash).all()
+    
+    # Unreferenced blobs are waiting for garbage collection
+    if not owners:
+        return False, (jsonify({'error': 'Not found'}), 404)
+    
+    if any(owner.memorial_id is None or owner.visibility == MemorialVisibility.PUBLIC for owner in owners):
+        return True, None
+    
+    error = None
+    for owner in owners:
+        error = _visibility_error(owner, current_user_id)
+        if error is None:
+            return False, None
+    return False, error
+
+def _accept_upload():
+    """(incoming path, None) for a valid image upload, else (None, error response)"""
+    file = request.files.get('file')
+    
+    if not file or not file.filename:
+        return None, (jsonify({'error': 'No file uploaded'}), 400)
+    
+    try:
+        return image_pipeline.accept(file), None
+    except InvalidImage as e:
+        return None, (jsonify({'error': str(e)}), 400)
+
+@bp.route('/memorials/<memorial_id>/photos', methods=['POST'])
+@jwt_required()
+def upload_memorial_photo(memorial_id):
+    current_user_id = get_jwt_identity()
+    
+    memorial = Memorial.query.filter_by(id=memorial_id, user_id=current_user_id).first()
+    
+    if not memorial:
+        return jsonify({'error': 'Memorial not found or unauthorized'}), 404
+    
+    path, error = _accept_upload()
+    if error:
+        return error
+    
+    # URL and variants are filled in once processing finishes
+    photo = MemorialPhoto(
+        memorial_id=memorial_id,
+        photo_url='',
+        caption=request.form.get('caption'),
+        uploaded_by=current_user_id
+    )
+    
+    db.session.add(photo)
+    db.session.commit()
+    
+    try:
+        image_pipeline.submit('memorial_photo.photo', photo.id, path)
+    except ImagePipelineBusy:
+        db.session.delete(photo)
+        db.session.commit()
+        raise
+    
+    return jsonify({
+        'message': 'Photo uploaded and is being processed',
+        'photo': photo.to_dict()
+    }), 202
+
+@bp.route('/memorials/<memorial_id>/photo', methods=['PUT'])
+@jwt_required()
+def upload_memorial_cover_photo(memorial_id):
+    memorial = Memorial.query.filter_by(id=memorial_id, user_id=get_jwt_identity()).first()
+    
+    if not memorial:
+        return jsonify({'error': 'Memorial not found or unauthorized'}), 404
+    
+    path, error = _accept_upload()
+    if error:
+        return error
+    
+    image_pipeline.submit('memorial.photo', memorial.id, path)
+    
+    return jsonify({'message': 'Photo uploaded and is being processed'}), 202
+
+@bp.route('/fundraisers/<fundraiser_id>/cover', methods=['PUT'])
+@jwt_required()
+def upload_fundraiser_cover(fundraiser_id):
+    fundraiser = Fundraiser.query.filter_by(id=fundraiser_id, user_id=get_jwt_identity()).first()
+    
+    if not fundraiser:
+        return jsonify({'error': 'Fundraiser not found or unauthorized'}), 404
+    
+    path, error = _accept_upload()
+    if error:
+        return error
+    
+    image_pipeline.submit('fundraiser.cover', fundraiser.id, path)
+    
+    return jsonify({'message': 'Cover image uploaded and is being processed'}), 202
+
+@bp.route('/vendors/me/<image>', methods=['PUT'])
+@jwt_required()
+def upload_vendor_image(image):
+    if image not in ('logo', 'cover'):
+        return jsonify({'error': 'Not found'}), 404
+    
+    vendor = VendorProfile.query.filter_by(user_id=get_jwt_identity()).first()
+    
+    if not vendor:
+        return jsonify({'error': 'Vendor profile not found'}), 404
+    
+    path, error = _accept_upload()
+    if error:
+        return error
+    
+    image_pipeline.submit(f'vendor.{image}', vendor.id, path)
+    
+    return jsonify({'message': f'{image.capitalize()} uploaded and is being processed'}), 202
+
+def _upload_headers(response, session):
+    response.headers['Upload-Offset'] = str(session.offset)
+    response.headers['Upload-Length'] = str(session.size)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def _get_upload_session(upload_id):
+    return UploadSession.query.filter_by(id=upload_id, user_id=get_jwt_identity()).first()
+
+@bp.route('/memorials/<memorial_id>/videos/uploads', methods=['POST'])
+@jwt_required()
+def create_video_upload(memorial_id):
+    current_user_id = get_jwt_identity()
+    
+    memorial = Memorial.query.filter_by(id=memorial_id, user_id=current_user_id).first()
+    
+    if not memorial:
+        return jsonify({'error': 'Memorial not found or unauthorized'}), 404
+    
+    data = request.get_json() or {}
+    plans = current_app.config['SUBSCRIPTION_PLANS']
+    max_size = plans.get(current_plan(), plans['free'])['max_video_mb'] * 1024 * 1024
+    
+    try:
+        session = resumable_uploads.create(
+            current_user_id,
+            memorial_id,
+            data.get('filename'),
+            data.get('size'),
+            max_size,
+            checksum=data.get('checksum'),
+            caption=data.get('caption')
+        )
+    except InvalidUpload as e:
+        return jsonify({'error': str(e)}), 400
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    
+    upload_url = url_for('api.append_video_upload', upload_id=session.id)
+    response = jsonify({
+        'upload': session.to_dict(),
+        'upload_url': upload_url,
+        'chunk_max_bytes': resumable_uploads.chunk_max_bytes
+    })
+    response.headers['Location'] = upload_url
+    return _upload_headers(response, session), 201
+
+@bp.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_video_upload(upload_id):
+    # HEAD is answered here too; clients resume from Upload-Offset
+    session = _get_upload_session(upload_id)
+    
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    return _upload_headers(jsonify({'upload': session.to_dict()}), session), 200
+
+@bp.route('/uploads/<upload_id>', methods=['PATCH'])
+@jwt_required()
+def append_video_upload(upload_id):
+    session = _get_upload_session(upload_id)
+    
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    if request.mimetype not in CHUNK_MIMETYPES:
+        return jsonify({'error': 'Chunks must be sent as application/offset+octet-stream'}), 415
+    
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+    
+    # Upload-Checksum: sha256 <hex digest of this chunk>
+    checksum = None
+    if 'Upload-Checksum' in request.headers:
+        algorithm, _, checksum = request.headers['Upload-Checksum'].partition(' ')
+        if algorithm.lower() != 'sha256' or not checksum:
+            return jsonify({'error': 'Upload-Checksum must be "sha256 <hex digest>"'}), 400
+    
+    try:
+        resumable_uploads.append(session, offset, request.stream, checksum=checksum)
+    except UploadOffsetMismatch as e:
+        response = jsonify({'error': 'Upload-Offset does not match the upload', 'offset': e.offset})
+        return _upload_headers(response, session), 409
+    except InvalidUpload as e:
+        return _upload_headers(jsonify({'error': str(e)}), session), 400
+    except UploadTooLarge as e:
+        return _upload_headers(jsonify({'error': str(e)}), session), 413
+    
+    return _upload_headers(jsonify({'upload': session.to_dict()}), session), 200
+
+@bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_video_upload(upload_id):
+    session = _get_upload_session(upload_id)
+    
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    try:
+        video = resumable_uploads.complete(session)
+    except InvalidUpload as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'message': 'Video uploaded successfully',
+        'video': video.to_dict()
+    }), 201
+
+@bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_video_upload(upload_id):
+    session = _get_upload_session(upload_id)
+    
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    resumable_uploads.cancel(session)
+    
+    return jsonify({'message': 'Upload cancelled'}), 200
@@ -1,19 +1,34 @@
 from flask import request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.extensions import db
-from app.models import Memorial, MemorialVisibility, Tribute, User
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from app.extensions import db, count_cache, response_cache
+from app.models import Memorial, MemorialVisibility, Tribute, User, FundraiserStatus
 from datetime import datetime
+from app.utils.decorators import claims_required, current_plan
+from app.utils.pagination import keyset_page
+from app.utils.http_cache import Validators
+from app.services.stats_service import watermark
+from app.services.search_service import search_memorials
+import math
 from . import bp
 
+# Items returned per section of the memorial page
+PAGE_SECTION_LIMITS = {
+    'tributes': 20,
+    'photos': 24,
+    'videos': 6,
+    'donations': 10
+}
+
 @bp.route('/memorials', methods=['POST'])
-@jwt_required()
+@claims_required()
 def create_memorial():
     current_user_id = get_jwt_identity()
     data = request.get_json()
     
     # Check if user has permission
-    user = User.query.get(current_user_id)
-    if user.subscription_plan.value == 'free':
+    if current_plan() == 'free':
         # Check memorial count for free users
         memorial_count = Memorial.query.filter_by(user_id=current_user_id).count()
         if memorial_count >= 1:
@@ -50,48 +65,167 @@ def create_memorial():
         'memorial': memorial.to_dict()
     }), 201
 
+def _memorials_query(visibility):
+    query = Memorial.query
+    
+    if visibility == 'public':
+        query = query.filter_by(visibility=MemorialVisibility.PUBLIC)
+    
+    return query
+
 @bp.route('/memorials', methods=['GET'])
+@response_cache.cached(tags=['memorials'])
 def get_memorials():
     # Public endpoint - only show public memorials
-    visibility = request.args.get('visibility', 'public')
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    visibility = 'public' if request.args.get('visibility', 'public') == 'public' else 'all'
+    per_page = min(max(request.args.get('per_page', 10, type=int), 1), 100)
     
-    query = Memorial.query
+    # Any memorial write moves the watermark; totals may lag it, hence a weak ETag
+    validators = Validators(
+        'memorials', watermark('watermark.memorials'), sorted(request.args.items()),
+        public=visibility == 'public', weak=True
+    )
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
     
-    if visibility == 'public':
-        query = query.filter_by(visibility=MemorialVisibility.PUBLIC)
+    # Cached total, refreshed in the background instead of COUNT(*) per page
+    total = count_cache.get(f'memorials:{visibility}', lambda: _memorials_query(visibility).count())
+    
+    # Cursor mode: keyset on (created_at, id), no OFFSET
+    if 'cursor' in request.args:
+        try:
+            memorials, next_cursor = keyset_page(_memorials_query(visibility), Memorial, request.args['cursor'], per_page)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        return validators.apply(jsonify({
+            'memorials': [memorial.to_dict() for memorial in memorials],
+            'total': total,
+            'next_cursor': next_cursor
+        })), 200
+    
+    page = request.args.get('page', 1, type=int)
     
-    memorials = query.order_by(Memorial.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+    memorials = _memorials_query(visibility).order_by(Memorial.created_at.desc(), Memorial.id.desc()).paginate(
+        page=page, per_page=per_page, error_out=False, count=False
     )
     
-    return jsonify({
+    return validators.apply(jsonify({
         'memorials': [memorial.to_dict() for memorial in memorials.items],
-        'total': memorials.total,
-        'pages': memorials.pages,
+        'total': total,
+        'pages': math.ceil(total / per_page) if per_page > 0 else 0,
+        'current_page': page
+    })), 200
+
+@bp.route('/memorials/search', methods=['GET'])
+@jwt_required(optional=True)
+def search():
+    query = request.args.get('q', '').strip()
+    
+    if not query:
+        return jsonify({'error': 'Search query required'}), 400
+    
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(request.args.get('per_page', 20, type=int), 50)
+    
+    memorials = search_memorials(query, user_id=get_jwt_identity(), limit=per_page, offset=(page - 1) * per_page)
+    
+    return jsonify({
+        'memorials': [memorial.to_dict() for memorial in memorials],
         'current_page': page
     }), 200
 
+def _memorial_version(memorial_id):
+    # Columns only; enough for visibility checks and validators
+    return db.session.query(
+        Memorial.id, Memorial.user_id, Memorial.visibility, Memorial.updated_at
+    ).filter_by(id=memorial_id).first()
+
 @bp.route('/memorials/<memorial_id>', methods=['GET'])
+@response_cache.cached(tags=['memorial:{memorial_id}'])
+@jwt_required(optional=True)
 def get_memorial(memorial_id):
-    memorial = Memorial.query.get(memorial_id)
+    version = _memorial_version(memorial_id)
     
-    if not memorial:
+    if not version:
         return jsonify({'error': 'Memorial not found'}), 404
     
     # Check visibility
-    current_user_id = get_jwt_identity() if request.headers.get('Authorization') else None
+    error = _visibility_error(version, get_jwt_identity())
+    if error:
+        return error
+    
+    validators = Validators(
+        'memorial', memorial_id, version.updated_at,
+        last_modified=version.updated_at,
+        public=version.visibility == MemorialVisibility.PUBLIC
+    )
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    
+    memorial = Memorial.query.get(memorial_id)
     
+    if not memorial:
+        return jsonify({'error': 'Memorial not found'}), 404
+    
+    return validators.apply(jsonify({
+        'memorial': memorial.to_dict()
+    })), 200
+
+def _visibility_error(memorial, current_user_id):
     if memorial.visibility == MemorialVisibility.PRIVATE:
         if not current_user_id or memorial.user_id != current_user_id:
             return jsonify({'error': 'This memorial is private'}), 403
     elif memorial.visibility == MemorialVisibility.FAMILY_ONLY:
         if not current_user_id:
             return jsonify({'error': 'Authentication required'}), 401
+    return None
+
+@bp.route('/memorials/<memorial_id>/page', methods=['GET'])
+@jwt_required(optional=True)
+def get_memorial_page(memorial_id):
+    """Everything a memorial page renders, in a fixed number of queries
+
+    One query for the memorial joined with its fundraisers, then one
+    limited query each for tributes, photos, videos and, when a
+    fundraiser is linked, its recent donations.
+    """
+    memorial = Memorial.query.options(joinedload(Memorial.fundraisers)).get(memorial_id)
+    
+    if not memorial:
+        return jsonify({'error': 'Memorial not found'}), 404
+    
+    error = _visibility_error(memorial, get_jwt_identity())
+    if error:
+        return error
+    
+    # One extra row tells us whether there are more tributes to page through
+    tributes = memorial.tributes.limit(PAGE_SECTION_LIMITS['tributes'] + 1).all()
+    photos = memorial.photos.limit(PAGE_SECTION_LIMITS['photos']).all()
+    videos = memorial.videos.limit(PAGE_SECTION_LIMITS['videos']).all()
+    
+    # Prefer the newest active fundraiser, else the newest of any status
+    fundraiser = next(
+        (f for f in memorial.fundraisers if f.status == FundraiserStatus.ACTIVE),
+        memorial.fundraisers[0] if memorial.fundraisers else None
+    )
+    
+    fundraiser_data = None
+    if fundraiser:
+        fundraiser_data = fundraiser.to_dict()
+        fundraiser_data['recent_donations'] = [
+            donation.to_public_dict() for donation in fundraiser.donations.limit(PAGE_SECTION_LIMITS['donations'])
+        ]
     
     return jsonify({
-        'memorial': memorial.to_dict()
+        'memorial': memorial.to_dict(),
+        'tributes': [tribute.to_dict() for tribute in tributes[:PAGE_SECTION_LIMITS['tributes']]],
+        'has_more_tributes': len(tributes) > PAGE_SECTION_LIMITS['tributes'],
+        'photos': [photo.to_dict() for photo in photos],
+        'videos': [video.to_dict() for video in videos],
+        'fundraiser': fundraiser_data
     }), 200
 
 @bp.route('/memorials/<memorial_id>/tributes', methods=['POST'])
@@ -127,17 +261,38 @@ def add_tribute(memorial_id):
     }), 201
 
 @bp.route('/memorials/<memorial_id>/tributes', methods=['GET'])
+@response_cache.cached(tags=['memorial:{memorial_id}'])
+@jwt_required(optional=True)
 def get_tributes(memorial_id):
-    memorial = Memorial.query.get(memorial_id)
+    version = _memorial_version(memorial_id)
     
-    if not memorial:
+    if not version:
         return jsonify({'error': 'Memorial not found'}), 404
     
+    # Tributes are as visible as their memorial
+    error = _visibility_error(version, get_jwt_identity())
+    if error:
+        return error
+    
+    # Tributes are never edited, so newest timestamp plus count identifies the list
+    latest, count = db.session.query(
+        func.max(Tribute.created_at), func.count(Tribute.id)
+    ).filter_by(memorial_id=memorial_id).one()
+    
+    validators = Validators(
+        'tributes', memorial_id, version.visibility, latest, count,
+        last_modified=latest,
+        public=version.visibility == MemorialVisibility.PUBLIC
+    )
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    
     tributes = Tribute.query.filter_by(memorial_id=memorial_id).order_by(Tribute.created_at.desc()).all()
     
-    return jsonify({
+    return validators.apply(jsonify({
         'tributes': [tribute.to_dict() for tribute in tributes]
-    }), 200
+    })), 200
 
 @bp.route('/memorials/user', methods=['GET'])
 @jwt_required()
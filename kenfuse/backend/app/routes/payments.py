@@ -1,16 +1,87 @@
-from flask import request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import request, jsonify, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from app.extensions import db, job_queue
+from app.models import Payment, PaymentStatus, QueuedJobStatus, UserRole
+from app.services.payment_service import PaymentService, normalize_phone, STK_PUSH_JOB
 from . import bp
 
 @bp.route('/payments/mpesa', methods=['POST'])
 @jwt_required()
 def initiate_mpesa_payment():
+    """Record the payment and queue its STK push; poll status_url for the outcome"""
     current_user_id = get_jwt_identity()
+    data = request.get_json() or {}
     
-    return jsonify({
-        'message': 'M-Pesa payment endpoint',
-        'user_id': current_user_id
-    }), 200
+    for field in ['phone_number', 'amount']:
+        if field not in data:
+            return jsonify({'error': f'Missing required field: {field}'}), 400
+    
+    try:
+        phone_number = normalize_phone(data['phone_number'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        amount = float(data['amount'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid amount'}), 400
+    
+    # STK push only takes whole shillings
+    if amount < 1 or amount != int(amount):
+        return jsonify({'error': 'Amount must be a whole number of shillings'}), 400
+    
+    result = PaymentService().process_mpesa_payment(
+        user_id=current_user_id,
+        phone_number=phone_number,
+        amount=amount,
+        description=data.get('description')
+    )
+    
+    status_url = url_for('api.get_payment_status', payment_id=result['payment_id'])
+    response = jsonify({
+        'message': result['message'],
+        'payment_id': result['payment_id'],
+        'status': PaymentStatus.PENDING.value,
+        'status_url': status_url
+    })
+    response.headers['Location'] = status_url
+    return response, 202
+
+@bp.route('/payments/<payment_id>', methods=['GET'])
+@jwt_required(optional=True)
+def get_payment_status(payment_id):
+    """Where a payment stands, including its queued STK push
+
+    Anonymous donations have no owner, so their status is readable by
+    anyone holding the id; only status fields are returned here.
+    """
+    payment = db.session.get(Payment, payment_id)
+    
+    if not payment or (payment.user_id and payment.user_id != get_jwt_identity()
+                       and get_jwt().get('role') != UserRole.ADMIN.value):
+        return jsonify({'error': 'Payment not found'}), 404
+    
+    metadata = payment.payment_metadata or {}
+    job = job_queue.latest(payment.id, STK_PUSH_JOB)
+    response = jsonify({
+        'id': payment.id,
+        'status': payment.status.value,
+        'amount': payment.amount,
+        'currency': payment.currency,
+        'payment_method': payment.payment_method.value,
+        'checkout_request_id': metadata.get('checkout_request_id'),
+        'error': metadata.get('error') or (metadata.get('response_description') if payment.status == PaymentStatus.FAILED else None),
+        'initiation': {
+            'status': job.status.value,
+            'attempts': job.attempts,
+            'next_attempt_at': job.run_at.isoformat() if job.status == QueuedJobStatus.QUEUED else None
+        } if job else None
+    })
+    
+    # Still waiting on the push or the payer; tell pollers when to look again
+    if payment.status == PaymentStatus.PENDING:
+        response.headers['Retry-After'] = '2'
+    return response, 200
 
 @bp.route('/payments/card', methods=['POST'])
 @jwt_required()
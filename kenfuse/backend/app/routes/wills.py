@@ -6,17 +6,18 @@ from io import BytesIO
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 import os
+from app.utils.decorators import claims_required, current_plan
+from app.utils.media_files import precompress
 from . import bp
 
 @bp.route('/wills', methods=['POST'])
-@jwt_required()
+@claims_required()
 def create_will():
     current_user_id = get_jwt_identity()
     data = request.get_json()
     
     # Check if user has permission
-    user = User.query.get(current_user_id)
-    if user.subscription_plan.value == 'free':
+    if current_plan() == 'free':
         # Check will count for free users
         will_count = Will.query.filter_by(user_id=current_user_id).count()
         if will_count >= 1:
@@ -165,6 +166,7 @@ def export_will_pdf(will_id):
     # Save PDF to uploads folder
     with open(pdf_path, 'wb') as f:
         f.write(buffer.getvalue())
+    precompress(pdf_path)
 
     # Update will's pdf_url
     will.pdf_url = f"/api/static/uploads/{pdf_filename}"
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.models import FundraiserHourlyStat, FundraiserDailyStat, FundraiserDonorStat
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+# Bucket widths a series can be downsampled to, narrowest first
+BUCKETS = [
+    ('hour', HOUR),
+    ('3h', 3 * HOUR),
+    ('6h', 6 * HOUR),
+    ('12h', 12 * HOUR),
+    ('day', DAY),
+    ('week', 7 * DAY),
+    ('30d', 30 * DAY),
+    ('90d', 90 * DAY),
+    ('365d', 365 * DAY)
+]
+
+class InvalidRange(Exception):
+    """Raised when an analytics range or bucket cannot be served"""
+
+def pick_bucket(start, end, max_points, bucket=None):
+    """Narrowest bucket that covers start..end in at most max_points points"""
+    widths = dict(BUCKETS)
+    if bucket:
+        if bucket not in widths:
+            raise InvalidRange(f'bucket must be one of {", ".join(widths)}')
+        if (end - start) / widths[bucket] > max_points:
+            raise InvalidRange(f'Too many {bucket} buckets for this range; use a wider bucket or a shorter range')
+        return bucket, widths[bucket]
+    for name, width in BUCKETS:
+        if (end - start) / width <= max_points:
+            return name, width
+    return BUCKETS[-1]
+
+def donation_series(fundraiser_id, start, end, max_points=200, bucket=None):
+    """Donations per bucket and payment method between start and end, from the rollups
+
+    Hour-wide buckets read the hourly table and wider ones the daily
+    table, so the rows read depend on the range and bucket, never on how
+    many donations there are. Buckets are aligned to the start of the
+    range (whole days for day-wide buckets) and empty ones are included
+    so charts get an evenly spaced series.
+    """
+    name, width = pick_bucket(start, end, max_points, bucket)
+    if width < DAY:
+        start = start.replace(minute=0, second=0, microsecond=0)
+        model, column = FundraiserHourlyStat, FundraiserHourlyStat.hour
+        lower, upper = start, end
+    else:
+        start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        model, column = FundraiserDailyStat, FundraiserDailyStat.day
+        lower, upper = start.date(), end.date()
+
+    rows = db.session.query(column, model.payment_method, model.count, model.amount).filter(
+        model.fundraiser_id == fundraiser_id,
+        column >= lower,
+        column <= upper
+    ).all()
+
+    points = []
+    moment = start
+    while moment <= end:
+        points.append({'start': moment.isoformat(), 'count': 0, 'amount': 0.0, 'by_method': {}})
+        moment += width
+
+    totals = {'count': 0, 'amount': 0.0, 'by_method': {}}
+    for at, method, count, amount in rows:
+        if not count:
+            continue
+        if not isinstance(at, datetime):
+            at = datetime(at.year, at.month, at.day)
+        index = int((at - start) / width)
+        if not 0 <= index < len(points):
+            continue
+        for target in (points[index], totals):
+            target['count'] += count
+            target['amount'] += amount
+            by_method = target['by_method'].setdefault(method, {'count': 0, 'amount': 0.0})
+            by_method['count'] += count
+            by_method['amount'] += amount
+
+    for target in points + [totals]:
+        target['amount'] = round(target['amount'], 2)
+        for by_method in target['by_method'].values():
+            by_method['amount'] = round(by_method['amount'], 2)
+    totals['average_gift'] = round(totals['amount'] / totals['count'], 2) if totals['count'] else 0
+
+    return {
+        'bucket': name,
+        'bucket_seconds': int(width.total_seconds()),
+        'source': model.__tablename__,
+        'series': points,
+        'totals': totals
+    }
+
+def top_donors(fundraiser_id, limit=10):
+    """Largest named donors over the fundraiser's lifetime"""
+    donors = FundraiserDonorStat.query.filter(
+        FundraiserDonorStat.fundraiser_id == fundraiser_id,
+        FundraiserDonorStat.count > 0
+    ).order_by(FundraiserDonorStat.amount.desc()).limit(limit).all()
+    return [donor.to_dict() for donor in donors]
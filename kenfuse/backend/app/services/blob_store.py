@@ -0,0 +1,156 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from app.utils.media_files import is_compressible, precompress, remove_siblings
+from app.utils.metrics import metrics
+
+CHUNK_SIZE = 64 * 1024
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+class BlobStore:
+    """Content-addressed files on local disk
+
+    Each blob is named by the sha256 of its bytes and sharded two
+    levels deep (ab/cd/abcd...), so identical uploads share one file and
+    names never change, which makes them safe to cache forever. The hash
+    is computed while the upload streams to a temp file in the same
+    filesystem, and the finished file is renamed into place atomically.
+    Compressible blobs get .gz/.br siblings written once at store time.
+
+    Storing content that is already present touches the existing file,
+    so garbage collection can tell it was just reused.
+    """
+
+    def __init__(self, app=None):
+        self.root = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.root = app.config['BLOB_STORE_FOLDER']
+        os.makedirs(os.path.join(self.root, 'tmp'), exist_ok=True)
+        app.extensions['blob_store'] = self
+
+    def path(self, blob_hash):
+        if not HASH_PATTERN.match(blob_hash or ''):
+            raise ValueError('Invalid blob hash')
+        return os.path.join(self.root, blob_hash[:2], blob_hash[2:4], blob_hash)
+
+    def exists(self, blob_hash):
+        return os.path.exists(self.path(blob_hash))
+
+    def put_stream(self, stream, max_size=None, content_type=None):
+        """Store everything read from stream; returns (hash, size)
+
+        Raises ValueError once more than max_size bytes have been read.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise ValueError('File is too large')
+                    digest.update(chunk)
+                    temp.write(chunk)
+            return self._commit(temp_path, digest.hexdigest(), content_type), size
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def put_bytes(self, data, content_type=None):
+        digest = hashlib.sha256(data).hexdigest()
+        fd, temp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        with os.fdopen(fd, 'wb') as temp:
+            temp.write(data)
+        return self._commit(temp_path, digest, content_type), len(data)
+
+    def put_file(self, source_path, blob_hash=None, content_type=None):
+        """Move an existing file into the store; the hash is computed unless given"""
+        if blob_hash is None:
+            digest = hashlib.sha256()
+            with open(source_path, 'rb') as source:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            blob_hash = digest.hexdigest()
+        size = os.path.getsize(source_path)
+        # Stage inside the store first; the source may be on another filesystem
+        fd, temp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        os.close(fd)
+        shutil.move(source_path, temp_path)
+        # Stored now, however old the source is, so an orphan scan waits for its row
+        os.utime(temp_path)
+        return self._commit(temp_path, blob_hash, content_type), size
+
+    def _commit(self, temp_path, blob_hash, content_type=None):
+        final_path = self.path(blob_hash)
+        try:
+            # Same content already stored; mark it as just used
+            os.utime(final_path)
+        except FileNotFoundError:
+            pass
+        else:
+            os.remove(temp_path)
+            metrics.incr('blobs.deduplicated')
+            return blob_hash
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(temp_path, final_path)
+        if is_compressible(content_type):
+            precompress(final_path)
+        metrics.incr('blobs.stored')
+        return blob_hash
+
+    def retire(self, blob_hash, unused_since):
+        """Move a blob aside for deletion unless it was stored or reused after unused_since
+
+        Returns the path it was moved to, or None if it is missing or in
+        use. While it is aside, storing the same content writes a fresh
+        copy rather than reusing this one. Finish with purge() or restore().
+        """
+        fd, retired_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'), suffix='.retired')
+        os.close(fd)
+        try:
+            os.replace(self.path(blob_hash), retired_path)
+        except FileNotFoundError:
+            os.remove(retired_path)
+            return None
+        if os.path.getmtime(retired_path) >= unused_since:
+            self.restore(blob_hash, retired_path)
+            return None
+        # Fresh mtime so an orphan scan leaves it to us
+        os.utime(retired_path)
+        return retired_path
+
+    def restore(self, blob_hash, retired_path):
+        path = self.path(blob_hash)
+        if os.path.exists(path):
+            # Stored again meanwhile; same bytes
+            os.remove(retired_path)
+        else:
+            os.replace(retired_path, path)
+
+    def purge(self, blob_hash, retired_path):
+        os.remove(retired_path)
+        path = self.path(blob_hash)
+        if not os.path.exists(path):
+            remove_siblings(path)
+
+    def delete(self, blob_hash):
+        path = self.path(blob_hash)
+        remove_siblings(path)
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
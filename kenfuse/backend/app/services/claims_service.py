@@ -0,0 +1,169 @@
+import threading
+import time
+
+from sqlalchemy import event, inspect
+
+from app.utils.metrics import metrics
+
+# Only ever raise the stored minimum; concurrent revocations may arrive out of order
+RAISE_SCRIPT = """
+local current = tonumber(redis.call('get', KEYS[1]) or '-1')
+if tonumber(ARGV[1]) > current then
+    redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+end
+return 0
+"""
+
+class ClaimsRevocations:
+    """Minimum accepted claims version per user, shared by every worker
+
+    User.claims_version is bumped whenever role, plan or plan expiry
+    change. After such a commit, access tokens carrying an older version
+    are rejected until the client refreshes. CLAIMS_REVOCATION_URL picks
+    where the check looks:
+
+    - memory:// (the default without Redis) caches each user's
+      claims_version in this process for CLAIMS_VERSION_TTL seconds, so
+      a gated request reads the users table at most once per user and
+      TTL. A change committed in this process applies at once; other
+      workers see it when their entry expires.
+    - redis:// keeps the minimum version per user for the access token
+      lifetime, written after the commit that bumped it. If Redis is
+      unreachable the database is checked instead.
+    - database:// reads the user's current claims_version on every gated
+      request, one primary key lookup. Opt in where a change must apply
+      on every worker at once and there is no Redis.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 3600
+        self.version_ttl = 30.0
+        self.backend = 'memory'
+        self.redis = None
+        self.prefix = 'kenfuse:claims:'
+        self._versions = {}
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+        self._listening = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        expires = app.config.get('JWT_ACCESS_TOKEN_EXPIRES')
+        if expires:
+            self.ttl = expires.total_seconds() if hasattr(expires, 'total_seconds') else int(expires)
+        self.version_ttl = app.config.get('CLAIMS_VERSION_TTL', 30.0)
+        url = app.config.get('CLAIMS_REVOCATION_URL', 'memory://')
+        self.redis = None
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            import redis
+
+            self.redis = redis.Redis.from_url(url)
+            self._raise = self.redis.register_script(RAISE_SCRIPT)
+            self.backend = 'redis'
+        elif url.startswith('database://'):
+            self.backend = 'database'
+        else:
+            self.backend = 'memory'
+        self._logger = app.logger
+        app.extensions['claims_revocations'] = self
+        self._listen()
+
+    def revoke(self, user_id, min_version):
+        if self.backend == 'database':
+            # The committed claims_version is the revocation
+            return
+        if self.backend == 'redis':
+            try:
+                self._raise(keys=[self.prefix + str(user_id)], args=[min_version, int(self.ttl * 1000)])
+            except Exception:
+                metrics.incr('claims_revocations.errors')
+                self._logger.exception('Could not record claims revocation for user %s', user_id)
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            current = self._versions.get(str(user_id))
+            if current is None or current[0] is None or current[0] < min_version:
+                self._versions[str(user_id)] = (min_version, now + self.version_ttl)
+            self._prune(now)
+
+    def is_stale(self, user_id, version):
+        if self.backend == 'redis':
+            try:
+                value = self.redis.get(self.prefix + str(user_id))
+            except Exception:
+                metrics.incr('claims_revocations.errors')
+                return self._stale_in_database(user_id, version)
+            return value is not None and (version is None or version < int(value))
+        if self.backend == 'database':
+            return self._stale_in_database(user_id, version)
+
+        current = self._cached_version(user_id)
+        # A deleted user's tokens are stale too
+        return current is None or version is None or version < current
+
+    def _stale_in_database(self, user_id, version):
+        current = self._current_version(user_id)
+        # A deleted user's tokens are stale too
+        return current is None or version is None or version < current
+
+    def _current_version(self, user_id):
+        from app.extensions import db
+        from app.models import User
+
+        return db.session.query(User.claims_version).filter_by(id=str(user_id)).scalar()
+
+    def _cached_version(self, user_id):
+        """The user's claims_version, read from the database at most once per version_ttl"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._versions.get(str(user_id))
+        if entry is not None and entry[1] > now:
+            metrics.incr('claims_revocations.hits')
+            return entry[0]
+
+        metrics.incr('claims_revocations.misses')
+        current = self._current_version(user_id)
+        with self._lock:
+            entry = self._versions.get(str(user_id))
+            # A revocation committed here while we read is never lowered
+            if entry is not None and entry[1] > now and entry[0] is not None and (current is None or entry[0] > current):
+                return entry[0]
+            self._versions[str(user_id)] = (current, now + self.version_ttl)
+            self._prune(now)
+        return current
+
+    def _prune(self, now):
+        if now - self._last_prune < self.version_ttl:
+            return
+        expired = [user_id for user_id, (_, expires_at) in self._versions.items() if expires_at < now]
+        for user_id in expired:
+            del self._versions[user_id]
+        self._last_prune = now
+
+    def _listen(self):
+        if self._listening:
+            return
+        from app.extensions import db
+
+        event.listen(db.session, 'after_flush', self._collect_changes)
+        event.listen(db.session, 'after_commit', self._apply_revocations)
+        event.listen(db.session, 'after_rollback', self._discard_changes)
+        self._listening = True
+
+    def _collect_changes(self, session, flush_context):
+        from app.models import User
+
+        changed = session.info.setdefault('_claims_revoked', {})
+        for obj in session.dirty:
+            if isinstance(obj, User) and inspect(obj).attrs.claims_version.history.has_changes():
+                changed[str(obj.id)] = obj.claims_version
+
+    def _apply_revocations(self, session):
+        for user_id, version in session.info.pop('_claims_revoked', {}).items():
+            self.revoke(user_id, version)
+
+    def _discard_changes(self, session):
+        session.info.pop('_claims_revoked', None)
@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app.utils.metrics import metrics
+
+class CountCache:
+    """Cached row counts for listing totals
+
+    The first request for a key counts synchronously; after that the
+    cached value is served and, once older than the TTL, refreshed on a
+    background thread (stale-while-revalidate), so listing requests do
+    not pay for a COUNT(*) scan.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 60
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('COUNT_CACHE_TTL', 60)
+        app.extensions['count_cache'] = self
+
+    def get(self, key, count_fn):
+        """Cached result of count_fn(); count_fn must build its own query"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is None:
+            metrics.incr('count_cache.misses')
+            value = count_fn()
+            with self._lock:
+                self._entries[key] = (value, now)
+            return value
+
+        value, refreshed_at = entry
+        if refreshed_at + self.ttl <= now:
+            self._schedule_refresh(key, count_fn)
+        metrics.incr('count_cache.hits')
+        return value
+
+    def invalidate(self, prefix=''):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def _schedule_refresh(self, key, count_fn):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='count-cache')
+        self._executor.submit(self._refresh, current_app._get_current_object(), key, count_fn)
+
+    def _refresh(self, app, key, count_fn):
+        from app.extensions import db
+
+        try:
+            with app.app_context():
+                started = time.perf_counter()
+                value = count_fn()
+                metrics.observe('count_cache.refresh', time.perf_counter() - started)
+                db.session.remove()
+            with self._lock:
+                self._entries[key] = (value, time.monotonic())
+        except Exception:
+            app.logger.exception('Count refresh failed for %s', key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
@@ -0,0 +1,83 @@
+from datetime import datetime
+
+from sqlalchemy import case, func, literal, select, update
+
+from app.extensions import db, response_cache, event_hub
+from app.models import Fundraiser, FundraiserStatus
+from app.services.stats_service import bump
+from app.utils.metrics import metrics
+
+class FundraiserClosed(Exception):
+    """Raised when a fundraiser is no longer accepting donations"""
+
+def progress(current_amount, target_amount, status):
+    """Progress fields pushed to fundraiser streams, matching Fundraiser.to_dict"""
+    current_amount = float(current_amount or 0)
+    return {
+        'current_amount': current_amount,
+        'target_amount': float(target_amount),
+        'progress_percentage': min(100, (current_amount / target_amount * 100)) if target_amount > 0 else 0,
+        'status': status.value
+    }
+
+def add_to_total(fundraiser_id, amount):
+    """Atomically add amount to a fundraiser's total; returns (current_amount, status)
+
+    A single UPDATE adds to the stored value and flips the status to
+    COMPLETED once the target is reached, so concurrent donations never
+    overwrite each other. The row lock it takes is held only until the
+    caller commits, so run it as the last statement of the transaction.
+    Raises FundraiserClosed when the fundraiser is not active or has
+    passed its end date.
+
+    Bulk UPDATEs skip the ORM events, so the counters and cache purges
+    they would have made are applied here, along with the progress event
+    for live streams. The fundraisers watermark only moves when the
+    status flips: a bump per donation would put one more shared row in
+    every donation's transaction, and the purge already drops cached
+    lists that show the old total.
+    """
+    fundraisers = Fundraiser.__table__
+    total = func.coalesce(fundraisers.c.current_amount, 0) + amount
+    completed = literal(FundraiserStatus.COMPLETED, fundraisers.c.status.type)
+    stmt = update(fundraisers).where(
+        fundraisers.c.id == fundraiser_id,
+        fundraisers.c.status == FundraiserStatus.ACTIVE,
+        fundraisers.c.end_date > datetime.utcnow()
+    ).values(
+        current_amount=total,
+        status=case((total >= fundraisers.c.target_amount, completed), else_=fundraisers.c.status),
+        updated_at=datetime.utcnow()
+    )
+
+    columns = (fundraisers.c.current_amount, fundraisers.c.target_amount, fundraisers.c.status)
+    connection = db.session.connection()
+    if getattr(connection.dialect, 'update_returning', connection.dialect.name == 'postgresql'):
+        row = connection.execute(stmt.returning(*columns)).first()
+    else:
+        # The row stays locked by our UPDATE, so this read sees our own write
+        result = connection.execute(stmt)
+        row = connection.execute(
+            select(*columns).where(fundraisers.c.id == fundraiser_id)
+        ).first() if result.rowcount else None
+
+    if row is None:
+        raise FundraiserClosed()
+
+    current_amount, target_amount, status = row
+    if status == FundraiserStatus.COMPLETED:
+        bump(connection, 'fundraisers.status.active', -1)
+        bump(connection, 'fundraisers.status.completed', 1)
+        bump(connection, 'watermark.fundraisers')
+        metrics.incr('donations.completed_fundraisers')
+    response_cache.purge_after_commit(db.session, f'fundraiser:{fundraiser_id}', 'fundraisers')
+    event_hub.publish_after_commit(db.session, f'fundraiser:{fundraiser_id}', 'progress',
+                                   progress(current_amount, target_amount, status))
+
+    # Keep any loaded instance consistent with the row we just wrote
+    fundraiser = db.session.identity_map.get(db.session.identity_key(Fundraiser, fundraiser_id))
+    if fundraiser is not None:
+        db.session.expire(fundraiser, ['current_amount', 'status', 'updated_at'])
+
+    metrics.incr('donations.recorded')
+    return current_amount, status
@@ -0,0 +1,217 @@
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+from app.utils.metrics import metrics
+
+class EventHubFull(Exception):
+    """Raised when this process already serves its maximum number of streams"""
+
+class Subscription:
+    """One connected stream; events arrive on a bounded queue"""
+
+    def __init__(self, hub, channel, queue_size):
+        self.hub = hub
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def get(self, timeout):
+        """Next event, or None after timeout (or once the hub has dropped us)"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub._unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def encode_event(event):
+    """Server-Sent Events wire format"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+class EventHub:
+    """In-process pub/sub that fans events out to Server-Sent Event streams
+
+    Publishers never block: each subscriber has a bounded queue and one
+    that falls behind is dropped, reconnecting with Last-Event-ID to
+    replay what it missed from a short per-channel history. With a
+    redis:// URL, events go through a Redis channel and a listener
+    thread delivers them in every worker process; memory:// only reaches
+    streams in the publishing process.
+    """
+
+    def __init__(self, app=None):
+        self.max_subscribers = 200
+        self.queue_size = 100
+        self.history_size = 50
+        self.max_channels = 1000
+        self.redis = None
+        self.redis_channel = 'kenfuse:events'
+        self._subscribers = {}
+        self._history = OrderedDict()
+        self._count = 0
+        self._lock = threading.Lock()
+        self._bridge = None
+        self._listening = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_subscribers = app.config.get('SSE_MAX_CLIENTS', 200)
+        self.queue_size = app.config.get('SSE_QUEUE_SIZE', 100)
+        self.history_size = app.config.get('SSE_HISTORY_SIZE', 50)
+        url = app.config.get('EVENT_HUB_URL', 'memory://')
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            import redis
+
+            self.redis = redis.Redis.from_url(url)
+        self._logger = app.logger
+        app.extensions['event_hub'] = self
+        self._listen()
+
+    def publish(self, channel, event_type, data):
+        event = {'id': str(time.time_ns()), 'channel': channel, 'type': event_type, 'data': data}
+        if self.redis is not None:
+            try:
+                self.redis.publish(self.redis_channel, json.dumps(event))
+                metrics.incr('event_hub.published')
+                return
+            except Exception:
+                # Streams in this process still get it
+                metrics.incr('event_hub.errors')
+                self._logger.exception('Event hub publish failed')
+        metrics.incr('event_hub.published')
+        self._deliver(event)
+
+    def publish_after_commit(self, session, channel, event_type, data):
+        """Queue an event that is only published if session commits"""
+        session.info.setdefault('_event_hub_events', []).append((channel, event_type, data))
+
+    def subscribe(self, channel, last_event_id=None):
+        """Open a Subscription, replaying history newer than last_event_id
+
+        Raises EventHubFull at SSE_MAX_CLIENTS streams in this process.
+        """
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                metrics.incr('event_hub.rejected')
+                raise EventHubFull()
+            self._subscribers.setdefault(channel, set()).add(subscription)
+            self._count += 1
+            metrics.gauge('event_hub.subscribers', self._count)
+            if last_event_id and last_event_id.isdigit():
+                for event in self._history.get(channel, ()):
+                    if int(event['id']) > int(last_event_id):
+                        subscription.queue.put_nowait(event)
+        if self.redis is not None:
+            self._start_bridge()
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.channel]
+            self._count -= 1
+            metrics.gauge('event_hub.subscribers', self._count)
+
+    def _deliver(self, event):
+        channel = event['channel']
+        with self._lock:
+            history = self._history.get(channel)
+            if history is None:
+                history = self._history[channel] = deque(maxlen=self.history_size)
+                if len(self._history) > self.max_channels:
+                    self._history.popitem(last=False)
+            else:
+                self._history.move_to_end(channel)
+            history.append(event)
+            subscribers = list(self._subscribers.get(channel, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # Too slow; the client reconnects and replays from history
+                subscription.closed = True
+                self._unsubscribe(subscription)
+                metrics.incr('event_hub.dropped')
+        metrics.incr('event_hub.delivered', len(subscribers))
+
+    def _start_bridge(self):
+        with self._lock:
+            if self._bridge is not None:
+                return
+            self._bridge = threading.Thread(target=self._run_bridge, name='event-hub-bridge', daemon=True)
+        self._bridge.start()
+
+    def _run_bridge(self):
+        backoff = 1
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.redis_channel)
+                backoff = 1
+                for message in pubsub.listen():
+                    self._deliver(json.loads(message['data']))
+            except Exception:
+                metrics.incr('event_hub.errors')
+                self._logger.exception('Event hub bridge disconnected; retrying in %ss', backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def _listen(self):
+        if self._listening:
+            return
+        from sqlalchemy import event
+        from app.extensions import db
+
+        event.listen(db.session, 'after_flush', self._collect_donations)
+        event.listen(db.session, 'after_commit', self._publish_pending)
+        event.listen(db.session, 'after_rollback', self._discard_pending)
+        self._listening = True
+
+    def _collect_donations(self, session, flush_context):
+        from app.models import Donation
+
+        # Only public details; anonymous donations show up in the total alone
+        for obj in session.new:
+            if isinstance(obj, Donation) and not obj.is_anonymous:
+                self.publish_after_commit(session, f'fundraiser:{obj.fundraiser_id}', 'donation', {
+                    'id': obj.id,
+                    'amount': obj.amount,
+                    'currency': obj.currency,
+                    'donor_name': obj.donor_name,
+                    'message': obj.message,
+                    'created_at': obj.created_at.isoformat() if obj.created_at else None
+                })
+
+    def _publish_pending(self, session):
+        for channel, event_type, data in session.info.pop('_event_hub_events', ()):
+            self.publish(channel, event_type, data)
+
+    def _discard_pending(self, session):
+        session.info.pop('_event_hub_events', None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': self._count,
+                'max_subscribers': self.max_subscribers,
+                'channels': len(self._subscribers),
+                'bridge': self.redis is not None
+            }
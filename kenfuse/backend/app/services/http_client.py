@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.utils.metrics import metrics
+
+class ProviderHTTP:
+    """Keep-alive HTTP sessions for payment provider APIs
+
+    Each provider gets one requests.Session per process, so calls reuse
+    pooled TLS connections instead of opening one per request. Every
+    request has connect and read timeouts; connection failures are
+    retried (the request was never sent, so this is safe for POSTs too),
+    but reads and error statuses are not. Sessions are rebuilt after a
+    fork, since pooled sockets must not be shared between processes.
+    """
+
+    def __init__(self, app=None):
+        self.connect_timeout = 3.05
+        self.read_timeout = 30
+        self.pool_size = 10
+        self.connect_retries = 2
+        self._sessions = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.connect_timeout = app.config.get('PROVIDER_HTTP_CONNECT_TIMEOUT', 3.05)
+        self.read_timeout = app.config.get('PROVIDER_HTTP_READ_TIMEOUT', 30)
+        self.pool_size = app.config.get('PROVIDER_HTTP_POOL_SIZE', 10)
+        self.connect_retries = app.config.get('PROVIDER_HTTP_CONNECT_RETRIES', 2)
+        app.extensions['provider_http'] = self
+
+    def session(self, provider):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._sessions = {}
+                self._pid = os.getpid()
+            session = self._sessions.get(provider)
+            if session is None:
+                session = self._sessions[provider] = self._build_session()
+            return session
+
+    def _build_session(self):
+        retry = Retry(total=self.connect_retries, connect=self.connect_retries, read=0, status=0, other=0, backoff_factor=0.2)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def request(self, provider, method, url, **kwargs):
+        """requests-style call through the provider's pooled session, timed as http.<provider>"""
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        started = time.perf_counter()
+        try:
+            response = self.session(provider).request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.incr(f'http.{provider}.errors')
+            raise
+        finally:
+            metrics.observe(f'http.{provider}', time.perf_counter() - started)
+        metrics.incr(f'http.{provider}.status.{response.status_code // 100}xx')
+        return response
+
+    def stats(self):
+        with self._lock:
+            sessions = dict(self._sessions) if self._pid == os.getpid() else {}
+        return {
+            provider: {
+                'pools': len(session.get_adapter('https://').poolmanager.pools),
+                'pool_size': self.pool_size
+            }
+            for provider, session in sessions.items()
+        }
@@ -0,0 +1,242 @@
+import io
+import mimetypes
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from app.utils.metrics import metrics
+
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+
+# Longest side in pixels per variant
+DEFAULT_VARIANTS = {'thumb': 320, 'card': 800, 'full': 1600}
+
+# Encoders per output format; originals are never served
+ENCODINGS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}
+}
+
+class InvalidImage(Exception):
+    """Raised when an upload is not an image we accept"""
+
+class ImagePipelineBusy(Exception):
+    """Raised when too many uploads are already waiting to be processed"""
+
+def _owner_fields():
+    # field name -> (model, url attribute, variants attribute)
+    from app.models import Memorial, MemorialPhoto, Fundraiser, VendorProfile
+
+    return {
+        'memorial.photo': (Memorial, 'photo_url', 'photo_variants'),
+        'memorial_photo.photo': (MemorialPhoto, 'photo_url', 'photo_variants'),
+        'fundraiser.cover': (Fundraiser, 'cover_image', 'cover_variants'),
+        'vendor.logo': (VendorProfile, 'logo_url', 'logo_variants'),
+        'vendor.cover': (VendorProfile, 'cover_image', 'cover_variants')
+    }
+
+def render_variants(source_path, sizes):
+    """Encode every variant of one image; returns {name: {width, height, <ext>: bytes}}
+
+    EXIF orientation is applied to the pixels and all metadata (GPS,
+    camera serials) is dropped by re-encoding from raw pixels only.
+    """
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    variants = {}
+    previous = None
+    for name, longest in sorted(sizes.items(), key=lambda item: item[1]):
+        resized = image.copy()
+        # Never upscale; thumbnail keeps the aspect ratio
+        resized.thumbnail((longest, longest), Image.LANCZOS)
+        if previous is not None and previous['width'] == resized.width:
+            # Small originals: larger variants reuse the smaller files
+            variants[name] = previous
+            continue
+        variant = {'width': resized.width, 'height': resized.height}
+        for extension, options in ENCODINGS.items():
+            output = resized.convert('RGB') if options['format'] == 'JPEG' else resized
+            buffer = io.BytesIO()
+            output.save(buffer, **options)
+            variant[extension] = buffer.getvalue()
+        variants[name] = previous = variant
+    return variants
+
+class ImagePipeline:
+    """Validates uploads on the request thread and resizes them in a thread pool
+
+    Pillow releases the GIL while decoding, resizing and encoding, so a
+    small thread pool keeps CPU work off the request threads without the
+    cost of shipping pixels between processes. Variants go into the blob
+    store, so re-uploading the same photo elsewhere reuses its files.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 0
+        self.max_pending = 32
+        self.max_pixels = 40_000_000
+        self.sizes = dict(DEFAULT_VARIANTS)
+        self.incoming_folder = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.workers = app.config.get('IMAGE_WORKERS', 2)
+        self.max_pending = app.config.get('IMAGE_MAX_PENDING', 32)
+        self.max_pixels = app.config.get('IMAGE_MAX_PIXELS', 40_000_000)
+        self.sizes = app.config.get('IMAGE_VARIANTS', DEFAULT_VARIANTS)
+        self.incoming_folder = app.config['IMAGE_INCOMING_FOLDER']
+        os.makedirs(self.incoming_folder, exist_ok=True)
+        app.extensions['image_pipeline'] = self
+
+    def accept(self, file_storage):
+        """Validate an upload and park it in the incoming folder; returns its path
+
+        Only the header is decoded here, so this is cheap enough for the
+        request thread. Raises InvalidImage.
+        """
+        try:
+            with Image.open(file_storage.stream) as image:
+                image_format = image.format
+                width, height = image.size
+                image.verify()
+        except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as e:
+            raise InvalidImage('File is not a valid image') from e
+
+        if image_format not in ALLOWED_FORMATS:
+            raise InvalidImage('Only JPEG, PNG and WebP images are accepted')
+        if width * height > self.max_pixels:
+            raise InvalidImage('Image dimensions are too large')
+
+        path = os.path.join(self.incoming_folder, uuid.uuid4().hex)
+        file_storage.stream.seek(0)
+        file_storage.save(path)
+        return path
+
+    def submit(self, field, owner_id, incoming_path):
+        """Process an accepted upload for owner_id's field off the request thread
+
+        Raises ImagePipelineBusy (and discards the upload) when the queue is full.
+        """
+        from flask import current_app
+
+        if field not in _owner_fields():
+            raise ValueError(f'Unknown image field: {field}')
+
+        app = current_app._get_current_object()
+        if self.workers <= 0:
+            self._process(app, field, owner_id, incoming_path)
+            return
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                metrics.incr('images.rejected')
+                os.remove(incoming_path)
+                raise ImagePipelineBusy()
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='images')
+            metrics.gauge('images.pending', self._pending)
+        self._executor.submit(self._run, app, field, owner_id, incoming_path)
+
+    def _run(self, app, field, owner_id, incoming_path):
+        try:
+            self._process(app, field, owner_id, incoming_path)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                metrics.gauge('images.pending', self._pending)
+
+    def _process(self, app, field, owner_id, incoming_path):
+        started = time.perf_counter()
+        try:
+            stored = self._store(app, field, owner_id, incoming_path)
+        except Exception:
+            metrics.incr('images.failed')
+            app.logger.exception('Image processing failed for %s %s', field, owner_id)
+            self._discard(app, field, owner_id)
+            return
+        finally:
+            if os.path.exists(incoming_path):
+                os.remove(incoming_path)
+
+        if stored:
+            metrics.incr('images.processed')
+            metrics.observe('images.process', time.perf_counter() - started)
+
+    def _store(self, app, field, owner_id, incoming_path):
+        """Render the variants into the blob store and point the owner at them; False if the owner is gone"""
+        from app.extensions import db, blob_store
+        from app.services.media_service import attach, blob_url, memorial_id_for, register_blob
+
+        rendered = render_variants(incoming_path, self.sizes)
+
+        # Identical bytes (shared variants, repeat uploads) land on one blob
+        variants, blobs = {}, {}
+        for name, variant in rendered.items():
+            variants[name] = {'width': variant['width'], 'height': variant['height']}
+            for extension in ENCODINGS:
+                filename = f'{name}.{extension}'
+                content_type = mimetypes.guess_type(filename)[0]
+                blob_hash, size = blob_store.put_bytes(variant[extension], content_type)
+                blobs[blob_hash] = (size, content_type)
+                variants[name][extension] = blob_url(blob_hash, filename)
+
+        model, url_attribute, variants_attribute = _owner_fields()[field]
+        owner_type, owner_field = field.split('.')
+        with app.app_context():
+            try:
+                owner = db.session.get(model, owner_id)
+                if owner is None:
+                    return False
+                connection = db.session.connection()
+                for blob_hash, (size, content_type) in blobs.items():
+                    register_blob(connection, blob_hash, size, content_type)
+                attach(connection, owner_type, owner_id, owner_field, blobs, memorial_id_for(owner))
+
+                largest = max(variants, key=lambda name: variants[name]['width'])
+                setattr(owner, url_attribute, variants[largest]['jpeg'])
+                setattr(owner, variants_attribute, variants)
+                db.session.commit()
+            finally:
+                db.session.remove()
+        return True
+
+    def _discard(self, app, field, owner_id):
+        """Delete a gallery photo whose image could not be processed
+
+        The row was only a placeholder for this upload and would otherwise
+        be served as processing forever. Other owners keep the image they
+        had before. Blobs stored before the failure are left to garbage
+        collection.
+        """
+        from app.extensions import db
+        from app.models import MemorialPhoto
+
+        if field != 'memorial_photo.photo':
+            return
+        with app.app_context():
+            try:
+                photo = db.session.get(MemorialPhoto, owner_id)
+                if photo is not None and photo.photo_variants is None:
+                    db.session.delete(photo)
+                    db.session.commit()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Could not remove unprocessed photo %s', owner_id)
+            finally:
+                db.session.remove()
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'pending': self._pending, 'max_pending': self.max_pending}
@@ -0,0 +1,323 @@
+import os
+import random
+import secrets
+import socket
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, or_, select, update
+
+from app.utils.metrics import metrics
+
+Handler = namedtuple('Handler', 'kind fn on_failure max_attempts')
+Claimed = namedtuple('Claimed', 'id kind payload attempts max_attempts')
+
+class JobFailed(Exception):
+    """Raised by a handler when retrying cannot help; the job fails at once"""
+
+class JobQueue:
+    """Durable background jobs in the job_queue table, worked by thread pools
+
+    enqueue() adds a row to the caller's session, so a job exists exactly
+    when the transaction that asked for it commits. Workers claim ready
+    rows with SELECT ... FOR UPDATE SKIP LOCKED in a short transaction of
+    their own, so any number of threads and processes share the table
+    without waiting on each other, then run the handler outside it.
+
+    A handler that raises is retried with exponential backoff until
+    max_attempts, unless it raises JobFailed; either way on_failure is
+    called once the job gives up. A worker that dies mid-job leaves it
+    RUNNING until JOB_QUEUE_VISIBILITY_TIMEOUT, after which it is claimed
+    again, so handlers must tolerate running twice.
+
+    Web workers run JOB_QUEUE_WORKERS threads from their first request;
+    `flask jobs work` runs a dedicated pool.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 0
+        self.poll_interval = 1.0
+        self.visibility_timeout = timedelta(seconds=120)
+        self.max_attempts = 5
+        self.retry_base = 2.0
+        self.retry_max = 300.0
+        self.retention = timedelta(days=7)
+        self._handlers = {}
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._listening = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.workers = app.config.get('JOB_QUEUE_WORKERS', 2)
+        self.poll_interval = app.config.get('JOB_QUEUE_POLL_INTERVAL', 1.0)
+        self.visibility_timeout = timedelta(seconds=app.config.get('JOB_QUEUE_VISIBILITY_TIMEOUT', 120))
+        self.max_attempts = app.config.get('JOB_QUEUE_MAX_ATTEMPTS', 5)
+        self.retry_base = app.config.get('JOB_QUEUE_RETRY_BASE', 2.0)
+        self.retry_max = app.config.get('JOB_QUEUE_RETRY_MAX', 300.0)
+        self.retention = timedelta(days=app.config.get('JOB_QUEUE_RETENTION_DAYS', 7))
+        self._logger = app.logger
+        app.extensions['job_queue'] = self
+        self._listen()
+        if self.workers > 0:
+            app.before_request(lambda: self.start(app))
+
+    def register(self, kind, fn, on_failure=None, max_attempts=None):
+        """Run fn(**payload) for jobs of this kind; on_failure(payload, error) when one gives up"""
+        self._handlers[kind] = Handler(kind, fn, on_failure, max_attempts or self.max_attempts)
+
+    @property
+    def kinds(self):
+        return list(self._handlers)
+
+    def enqueue(self, kind, payload=None, reference=None, delay=0, session=None):
+        """Add a job to session (default db.session); it runs once that session commits"""
+        from app.extensions import db
+        from app.models import QueuedJob
+
+        session = session or db.session
+        now = datetime.utcnow()
+        job = QueuedJob(
+            kind=kind,
+            reference=reference,
+            payload=payload or {},
+            max_attempts=self._handlers[kind].max_attempts,
+            run_at=now + timedelta(seconds=delay),
+            created_at=now
+        )
+        session.add(job)
+        session.info['_job_queue_wake'] = True
+        metrics.incr(f'job_queue.{kind}.enqueued')
+        return job
+
+    def start(self, app, workers=None):
+        # A worker forked from a process that already started gets its own pool
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._run_loop, args=(app, self._holder(index)), name=f'job-queue-{index}', daemon=True)
+                for index in range(workers or self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def work_once(self, holder=None, limit=1):
+        """Claim and run up to limit ready jobs in this thread; returns how many ran"""
+        holder = holder or self._holder('inline')
+        jobs = self._claim(holder, limit)
+        for job in jobs:
+            self._execute(job, holder)
+        return len(jobs)
+
+    def _holder(self, index):
+        return f'{socket.gethostname()}:{os.getpid()}:{index}:{secrets.token_hex(4)}'
+
+    def _run_loop(self, app, holder):
+        from app.extensions import db
+
+        while not self._stopping.is_set():
+            ran = 0
+            with app.app_context():
+                try:
+                    ran = self.work_once(holder)
+                except Exception:
+                    metrics.incr('job_queue.errors')
+                    app.logger.exception('Job queue worker could not claim jobs')
+                finally:
+                    db.session.remove()
+            if not ran:
+                # Jitter keeps idle workers from polling in lockstep; a local enqueue wakes them early
+                self._wake.wait(self.poll_interval * random.uniform(0.8, 1.2))
+                self._wake.clear()
+
+    def _claim(self, holder, limit):
+        """Mark up to limit ready jobs RUNNING for holder, in one short transaction"""
+        from app.extensions import db
+        from app.models import QueuedJob, QueuedJobStatus
+
+        jobs = QueuedJob.__table__
+        now = datetime.utcnow()
+        ready = or_(
+            and_(jobs.c.status == QueuedJobStatus.QUEUED, jobs.c.run_at <= now),
+            and_(jobs.c.status == QueuedJobStatus.RUNNING, jobs.c.locked_until < now)
+        )
+        candidates = select(jobs.c.id).where(ready).order_by(jobs.c.run_at).limit(limit).with_for_update(skip_locked=True)
+
+        with db.engine.begin() as connection:
+            ids = connection.execute(candidates).scalars().all()
+            if not ids:
+                return []
+            # ready is checked again so databases without SKIP LOCKED never hand a job to two workers
+            connection.execute(
+                update(jobs).where(jobs.c.id.in_(ids), ready).values(
+                    status=QueuedJobStatus.RUNNING,
+                    attempts=jobs.c.attempts + 1,
+                    locked_by=holder,
+                    locked_until=now + self.visibility_timeout
+                )
+            )
+            rows = connection.execute(
+                select(jobs.c.id, jobs.c.kind, jobs.c.payload, jobs.c.attempts, jobs.c.max_attempts).where(
+                    jobs.c.id.in_(ids),
+                    jobs.c.status == QueuedJobStatus.RUNNING,
+                    jobs.c.locked_by == holder
+                ).order_by(jobs.c.run_at)
+            ).all()
+        metrics.incr('job_queue.claimed', len(rows))
+        return [Claimed(*row) for row in rows]
+
+    def _execute(self, job, holder):
+        from app.extensions import db
+
+        handler = self._handlers.get(job.kind)
+        started = time.perf_counter()
+        error, retry = None, False
+        try:
+            if handler is None:
+                raise JobFailed(f'No handler registered for {job.kind}')
+            handler.fn(**job.payload)
+        except JobFailed as e:
+            db.session.rollback()
+            error = str(e) or type(e).__name__
+        except Exception as e:
+            db.session.rollback()
+            error = f'{type(e).__name__}: {e}'
+            retry = job.attempts < job.max_attempts
+            self._logger.warning('Job %s (%s) failed on attempt %s: %s', job.id, job.kind, job.attempts, error)
+        finally:
+            metrics.observe(f'job_queue.{job.kind}', time.perf_counter() - started)
+
+        if error is None:
+            self._finish(job, holder, succeeded=True)
+            metrics.incr(f'job_queue.{job.kind}.done')
+        elif retry:
+            self._retry(job, holder, error)
+            metrics.incr(f'job_queue.{job.kind}.retried')
+        else:
+            self._finish(job, holder, succeeded=False, error=error)
+            metrics.incr(f'job_queue.{job.kind}.failed')
+            if handler is not None and handler.on_failure is not None:
+                try:
+                    handler.on_failure(job.payload, error)
+                except Exception:
+                    db.session.rollback()
+                    self._logger.exception('Failure handler for job %s (%s) raised', job.id, job.kind)
+
+    def _retry(self, job, holder, error):
+        from app.models import QueuedJobStatus
+
+        # Full jitter spreads retries of jobs that failed together, e.g. during a provider outage
+        delay = min(self.retry_max, self.retry_base * 2 ** (job.attempts - 1)) * random.uniform(0.5, 1.0)
+        self._settle(job, holder, status=QueuedJobStatus.QUEUED, run_at=datetime.utcnow() + timedelta(seconds=delay), last_error=error)
+
+    def _finish(self, job, holder, succeeded, error=None):
+        from app.models import QueuedJobStatus
+
+        status = QueuedJobStatus.DONE if succeeded else QueuedJobStatus.FAILED
+        self._settle(job, holder, status=status, finished_at=datetime.utcnow(), last_error=error)
+
+    def _settle(self, job, holder, **values):
+        from app.extensions import db
+        from app.models import QueuedJob
+
+        jobs = QueuedJob.__table__
+        with db.engine.begin() as connection:
+            # A job reclaimed after its visibility timeout belongs to the new holder now
+            result = connection.execute(
+                update(jobs).where(jobs.c.id == job.id, jobs.c.locked_by == holder).values(
+                    locked_by=None, locked_until=None, **values
+                )
+            )
+        if result.rowcount == 0:
+            metrics.incr('job_queue.lost_leases')
+            self._logger.warning('Job %s (%s) was reclaimed by another worker before it finished', job.id, job.kind)
+
+    def prune(self, batch_size=None, now=None):
+        """Delete finished jobs older than JOB_QUEUE_RETENTION_DAYS, a batch per transaction; returns the number deleted"""
+        from flask import current_app
+        from app.extensions import db
+        from app.models import QueuedJob, QueuedJobStatus
+
+        batch_size = batch_size or current_app.config['SWEEP_BATCH_SIZE']
+        cutoff = (now or datetime.utcnow()) - self.retention
+        jobs = QueuedJob.__table__
+        deleted = 0
+        while True:
+            ids = db.session.execute(
+                select(jobs.c.id).where(
+                    jobs.c.status.in_([QueuedJobStatus.DONE, QueuedJobStatus.FAILED]),
+                    jobs.c.finished_at < cutoff
+                ).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            db.session.execute(delete(jobs).where(jobs.c.id.in_(ids)))
+            db.session.commit()
+            deleted += len(ids)
+            if len(ids) < batch_size:
+                break
+        db.session.rollback()
+        return deleted
+
+    def latest(self, reference, kind=None):
+        """The most recent job for reference, or None"""
+        from app.models import QueuedJob
+
+        query = QueuedJob.query.filter_by(reference=reference)
+        if kind:
+            query = query.filter_by(kind=kind)
+        return query.order_by(QueuedJob.created_at.desc(), QueuedJob.id.desc()).first()
+
+    def _listen(self):
+        if self._listening:
+            return
+        from sqlalchemy import event
+        from app.extensions import db
+
+        event.listen(db.session, 'after_commit', self._wake_after_commit)
+        event.listen(db.session, 'after_rollback', self._discard_wake)
+        self._listening = True
+
+    def _wake_after_commit(self, session):
+        if session.info.pop('_job_queue_wake', False):
+            self._wake.set()
+
+    def _discard_wake(self, session):
+        session.info.pop('_job_queue_wake', None)
+
+    def stats(self):
+        from app.extensions import db
+        from app.models import QueuedJob, QueuedJobStatus
+
+        counts = db.session.query(QueuedJob.kind, QueuedJob.status, func.count()).group_by(QueuedJob.kind, QueuedJob.status).all()
+        oldest = db.session.query(func.min(QueuedJob.run_at)).filter(
+            QueuedJob.status == QueuedJobStatus.QUEUED, QueuedJob.run_at <= datetime.utcnow()
+        ).scalar()
+        stats = {
+            'workers': len(self._threads) if self._pid == os.getpid() else 0,
+            'oldest_ready_seconds': round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0,
+            'kinds': {}
+        }
+        for kind, status, count in counts:
+            stats['kinds'].setdefault(kind, {})[status.value] = count
+        return stats
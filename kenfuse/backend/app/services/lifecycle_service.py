@@ -0,0 +1,133 @@
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from app.extensions import db, scheduler, response_cache, event_hub, user_cache, claims_revocations, count_cache
+from app.models import Fundraiser, FundraiserStatus, User, SubscriptionPlan
+from app.services.donation_service import progress
+from app.services.stats_service import bump
+from app.utils.metrics import metrics
+
+def expire_fundraisers(batch_size=None, max_batches=None, now=None):
+    """Close ACTIVE fundraisers whose end_date has passed; returns the number closed
+
+    Each batch is one short transaction: pick up to batch_size ids from
+    ix_fundraisers_status_end_date, skipping rows a donation holds
+    locked (they are picked up next batch or next run), then flip them
+    with one UPDATE that re-checks status so a fundraiser completed by a
+    concurrent donation is left alone. Ended fundraisers become
+    COMPLETED; there is no separate expired status.
+    """
+    batch_size = batch_size or current_app.config['SWEEP_BATCH_SIZE']
+    now = now or datetime.utcnow()
+    fundraisers = Fundraiser.__table__
+    closed = batches = 0
+
+    while max_batches is None or batches < max_batches:
+        batches += 1
+        candidates = select(fundraisers.c.id).where(
+            fundraisers.c.status == FundraiserStatus.ACTIVE,
+            fundraisers.c.end_date < now
+        ).order_by(fundraisers.c.end_date).limit(batch_size).with_for_update(skip_locked=True)
+
+        connection = db.session.connection()
+        ids = connection.execute(candidates).scalars().all()
+        if not ids:
+            db.session.rollback()
+            break
+
+        rows = _close_fundraisers(connection, ids, now)
+
+        if rows:
+            bump(connection, 'fundraisers.status.active', -len(rows))
+            bump(connection, 'fundraisers.status.completed', len(rows))
+            bump(connection, 'watermark.fundraisers')
+            response_cache.purge_after_commit(db.session, 'fundraisers', *(f'fundraiser:{row.id}' for row in rows))
+            for row in rows:
+                event_hub.publish_after_commit(db.session, f'fundraiser:{row.id}', 'progress',
+                                               progress(row.current_amount, row.target_amount, FundraiserStatus.COMPLETED))
+                event_hub.publish_after_commit(db.session, 'lifecycle', 'fundraiser_expired', {'id': row.id})
+        db.session.commit()
+        closed += len(rows)
+        if len(ids) < batch_size:
+            break
+
+    if closed:
+        count_cache.invalidate('fundraisers:')
+        metrics.incr('lifecycle.fundraisers_expired', closed)
+    return closed
+
+def _close_fundraisers(connection, ids, now):
+    """Mark the still-ACTIVE fundraisers among ids COMPLETED; returns (id, current_amount, target_amount) rows"""
+    fundraisers = Fundraiser.__table__
+    columns = (fundraisers.c.id, fundraisers.c.current_amount, fundraisers.c.target_amount)
+    conditions = (fundraisers.c.id.in_(ids), fundraisers.c.status == FundraiserStatus.ACTIVE)
+    stmt = update(fundraisers).where(*conditions).values(status=FundraiserStatus.COMPLETED, updated_at=now)
+
+    if getattr(connection.dialect, 'update_returning', connection.dialect.name == 'postgresql'):
+        return connection.execute(stmt.returning(*columns)).all()
+    # The candidate rows are locked, so nothing changes between these two statements
+    rows = connection.execute(select(*columns).where(*conditions)).all()
+    connection.execute(stmt)
+    return rows
+
+def lapse_subscriptions(batch_size=None, max_batches=None, now=None):
+    """Move users whose paid plan has expired back to FREE; returns the number moved
+
+    Batched like expire_fundraisers, using ix_users_plan_expiry. The
+    UPDATE bumps claims_version so access tokens issued with the paid
+    plan are rejected, and the cached users are evicted on commit.
+    """
+    batch_size = batch_size or current_app.config['SWEEP_BATCH_SIZE']
+    now = now or datetime.utcnow()
+    users = User.__table__
+    lapsed = batches = 0
+
+    while max_batches is None or batches < max_batches:
+        batches += 1
+        candidates = select(users.c.id, users.c.subscription_plan, users.c.claims_version).where(
+            users.c.subscription_plan != SubscriptionPlan.FREE,
+            users.c.subscription_expiry < now
+        ).order_by(users.c.subscription_expiry).limit(batch_size).with_for_update(skip_locked=True)
+
+        connection = db.session.connection()
+        rows = connection.execute(candidates).all()
+        if not rows:
+            db.session.rollback()
+            break
+
+        # The rows are locked, so the versions read above are the ones being bumped
+        connection.execute(
+            update(users).where(users.c.id.in_([row.id for row in rows])).values(
+                subscription_plan=SubscriptionPlan.FREE,
+                claims_version=users.c.claims_version + 1,
+                updated_at=now
+            )
+        )
+        for plan, count in Counter(row.subscription_plan.value for row in rows).items():
+            bump(connection, f'users.subscription_plan.{plan}', -count)
+        bump(connection, 'users.subscription_plan.free', len(rows))
+        for row in rows:
+            event_hub.publish_after_commit(db.session, 'lifecycle', 'subscription_lapsed', {
+                'user_id': row.id,
+                'plan': row.subscription_plan.value
+            })
+        db.session.commit()
+
+        for row in rows:
+            user_cache.invalidate(row.id)
+            claims_revocations.revoke(row.id, (row.claims_version or 0) + 1)
+        lapsed += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    if lapsed:
+        metrics.incr('lifecycle.subscriptions_lapsed', lapsed)
+    return lapsed
+
+def register_lifecycle_jobs(app):
+    interval = app.config.get('SWEEP_INTERVAL', 300)
+    scheduler.register('expire_fundraisers', expire_fundraisers, interval)
+    scheduler.register('lapse_subscriptions', lapse_subscriptions, interval)
@@ -0,0 +1,183 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+from app.models import (
+    Memorial, MemorialPhoto, MemorialVideo, Fundraiser, VendorProfile,
+    MediaBlob, MediaReference
+)
+from app.utils.metrics import metrics
+
+# owner_type stored on media_references -> model
+OWNER_TYPES = {
+    'memorial': Memorial,
+    'memorial_photo': MemorialPhoto,
+    'memorial_video': MemorialVideo,
+    'fundraiser': Fundraiser,
+    'vendor': VendorProfile
+}
+
+_listeners_registered = False
+
+def blob_url(blob_hash, name):
+    return f'/api/media/{blob_hash}/{name}'
+
+def memorial_id_for(owner):
+    """Memorial whose visibility governs the owner's media, if any"""
+    if isinstance(owner, Memorial):
+        return owner.id
+    return getattr(owner, 'memorial_id', None)
+
+def register_blob(connection, blob_hash, size, content_type=None):
+    """Create the row for a stored blob, or mark an existing one as just used"""
+    blobs = MediaBlob.__table__
+    now = datetime.utcnow()
+    values = {'hash': blob_hash, 'size': size, 'content_type': content_type, 'ref_count': 0,
+              'created_at': now, 'updated_at': now}
+
+    dialect_insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(connection.dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(blobs).values(**values)
+        connection.execute(stmt.on_conflict_do_update(index_elements=['hash'], set_={'updated_at': now}))
+        return
+
+    result = connection.execute(update(blobs).where(blobs.c.hash == blob_hash).values(updated_at=now))
+    if result.rowcount == 0:
+        connection.execute(insert(blobs).values(**values))
+
+def attach(connection, owner_type, owner_id, field, hashes, memorial_id=None):
+    """Point an owner's field at hashes, releasing whatever it referenced before"""
+    detach(connection, owner_type, owner_id, field)
+
+    hashes = sorted(set(hashes))
+    if not hashes:
+        return
+
+    blobs = MediaBlob.__table__
+    connection.execute(insert(MediaReference.__table__), [
+        {'blob_hash': blob_hash, 'owner_type': owner_type, 'owner_id': owner_id,
+         'field': field, 'memorial_id': memorial_id}
+        for blob_hash in hashes
+    ])
+    connection.execute(
+        update(blobs).where(blobs.c.hash.in_(hashes)).values(ref_count=blobs.c.ref_count + 1)
+    )
+
+def detach(connection, owner_type, owner_id, field=None):
+    """Drop an owner's references (one field, or all of them)"""
+    references = MediaReference.__table__
+    blobs = MediaBlob.__table__
+    conditions = [references.c.owner_type == owner_type, references.c.owner_id == owner_id]
+    if field is not None:
+        conditions.append(references.c.field == field)
+
+    counts = connection.execute(
+        select(references.c.blob_hash, func.count()).where(*conditions).group_by(references.c.blob_hash)
+    ).all()
+    if not counts:
+        return
+
+    connection.execute(delete(references).where(*conditions))
+    for blob_hash, count in counts:
+        connection.execute(
+            update(blobs).where(blobs.c.hash == blob_hash).values(ref_count=blobs.c.ref_count - count)
+        )
+
+def _owner_deleted(mapper, connection, target):
+    owner_type = next(name for name, model in OWNER_TYPES.items() if isinstance(target, model))
+    detach(connection, owner_type, target.id)
+
+def _fundraiser_updated(mapper, connection, target):
+    # Relinking a fundraiser moves its media under the new memorial's visibility
+    if inspect(target).attrs.memorial_id.history.has_changes():
+        references = MediaReference.__table__
+        connection.execute(
+            update(references)
+            .where(references.c.owner_type == 'fundraiser', references.c.owner_id == target.id)
+            .values(memorial_id=target.memorial_id)
+        )
+
+def register_media_listeners():
+    """Release media references in the same flush that deletes their owner"""
+    global _listeners_registered
+    if _listeners_registered:
+        return
+
+    for model in OWNER_TYPES.values():
+        event.listen(model, 'after_delete', _owner_deleted)
+    event.listen(Fundraiser, 'after_update', _fundraiser_updated)
+    _listeners_registered = True
+
+def collect_garbage(blob_store, grace=timedelta(hours=1), batch_size=500, scan=False):
+    """Delete blobs nobody has referenced for at least grace; returns (blobs, bytes) removed
+
+    The grace period covers uploads that are stored but not yet
+    attached. With scan, files on disk that have no row at all (left by
+    a crash between storing and registering) are removed too.
+
+    Each file is moved aside before its row is deleted, and put back if
+    the row survives. An upload of the same content that found the file
+    in place has touched it, so the blob is kept; one that comes later
+    stores a fresh copy. Either way a registered blob keeps its file.
+    """
+    cutoff = datetime.utcnow() - grace
+    cutoff_ts = time.time() - grace.total_seconds()
+    blobs = MediaBlob.__table__
+    removed = freed = 0
+
+    while True:
+        candidates = db.session.query(MediaBlob.hash, MediaBlob.size).filter(
+            MediaBlob.ref_count <= 0, MediaBlob.updated_at < cutoff
+        ).limit(batch_size).all()
+        if not candidates:
+            break
+
+        for blob_hash, size in candidates:
+            retired_path = blob_store.retire(blob_hash, cutoff_ts)
+            if retired_path is None and blob_store.exists(blob_hash):
+                # Reused since the select; its row is about to be refreshed
+                continue
+            # Conditions repeated so a blob reused since the select survives
+            result = db.session.execute(
+                delete(blobs).where(blobs.c.hash == blob_hash, blobs.c.ref_count <= 0, blobs.c.updated_at < cutoff)
+            )
+            db.session.commit()
+            if not result.rowcount:
+                if retired_path is not None:
+                    blob_store.restore(blob_hash, retired_path)
+                continue
+            if retired_path is not None:
+                blob_store.purge(blob_hash, retired_path)
+            removed += 1
+            freed += size or 0
+
+        if len(candidates) < batch_size:
+            break
+
+    if scan:
+        orphans, orphan_bytes = _remove_unregistered_files(blob_store, cutoff_ts)
+        removed += orphans
+        freed += orphan_bytes
+
+    metrics.incr('blobs.collected', removed)
+    return removed, freed
+
+def _remove_unregistered_files(blob_store, cutoff_ts):
+    removed = freed = 0
+    for directory, _, filenames in os.walk(blob_store.root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if os.path.getmtime(path) >= cutoff_ts:
+                continue
+            in_tmp = os.path.basename(directory) == 'tmp'
+            # Precompressed siblings (<hash>.gz) belong to their blob's row
+            blob_hash = filename.split('.', 1)[0]
+            if in_tmp or db.session.get(MediaBlob, blob_hash) is None:
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+    return removed, freed
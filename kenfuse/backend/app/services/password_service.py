@@ -0,0 +1,146 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+from app.utils.metrics import metrics
+
+# bcrypt only looks at the first 72 bytes; older hashes were created with
+# the same silent truncation, so keep it explicit for compatibility.
+BCRYPT_MAX_BYTES = 72
+
+def _to_bytes(value):
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return value
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password[:BCRYPT_MAX_BYTES], bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _check_password(password, password_hash):
+    try:
+        return bcrypt.checkpw(password[:BCRYPT_MAX_BYTES], password_hash)
+    except ValueError:
+        # Malformed or non-bcrypt hash
+        return False
+
+def _pool_context():
+    # Fork keeps workers from re-importing the entry script (run_server.py
+    # starts the server at import time); fall back where fork is missing
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full or a hash takes too long"""
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded process pool off the request thread"""
+
+    def __init__(self, app=None):
+        # Until init_app runs (e.g. in standalone scripts) hash inline
+        self.rounds = 12
+        self.workers = 0
+        self.max_pending = 16
+        self.timeout = 10
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', 12)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', 16)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 10)
+        app.extensions['password_hasher'] = self
+
+    def hash(self, password):
+        """Hash a password with the configured work factor"""
+        return self._run(_hash_password, _to_bytes(password), self.rounds)
+
+    def verify(self, password, password_hash):
+        """Check a password against a stored bcrypt hash"""
+        if not password_hash:
+            return False
+        return self._run(_check_password, _to_bytes(password), _to_bytes(password_hash))
+
+    def needs_rehash(self, password_hash):
+        """True if the stored hash was created with a different work factor"""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (AttributeError, IndexError, ValueError):
+            return True
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'rounds': self.rounds,
+            'max_pending': self.max_pending,
+            'queue_depth': self._pending
+        }
+
+    def _get_executor(self):
+        # A forked worker must not reuse its parent's pool
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            with self._lock:
+                if self._executor is None or self._executor_pid != pid:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=_pool_context()
+                    )
+                    self._executor_pid = pid
+        return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _run(self, func, *args):
+        if self.workers <= 0:
+            with metrics.timer('password_hash.latency'):
+                return func(*args)
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                metrics.incr('password_hash.rejected')
+                raise PasswordHasherBusy('Password hashing queue is full')
+            self._pending += 1
+            metrics.gauge('password_hash.queue_depth', self._pending)
+
+        started = time.perf_counter()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is freed when the pool is done with the job, not when we
+        # stop waiting for it, so timed-out hashes still count against max_pending
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Still queued: drop it; already running: it finishes in the background
+            future.cancel()
+            metrics.incr('password_hash.timeouts')
+            raise PasswordHasherBusy('Password hashing timed out')
+        except BrokenProcessPool:
+            self._reset_executor()
+            raise
+        finally:
+            metrics.observe('password_hash.latency', time.perf_counter() - started)
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+            metrics.gauge('password_hash.queue_depth', self._pending)
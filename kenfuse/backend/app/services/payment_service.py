@@ -1,11 +1,31 @@
-import requests
 import base64
-import json
+import re
+import time
 from datetime import datetime
+import requests
 from flask import current_app
-import stripe
-from app.extensions import db
+from app.extensions import db, provider_http, token_cache, job_queue
 from app.models import Payment, PaymentStatus, PaymentMethod
+from app.services.job_queue import JobFailed
+from app.utils.metrics import metrics
+
+try:
+    import stripe
+except ImportError:  # Card payments are optional
+    stripe = None
+
+STK_PUSH_JOB = 'mpesa.stk_push'
+
+def normalize_phone(phone_number):
+    """Safaricom's 2547XXXXXXXX form of a Kenyan mobile number; raises ValueError"""
+    digits = re.sub(r'[\s\-()]', '', str(phone_number or '')).lstrip('+')
+    if digits.startswith('0'):
+        digits = '254' + digits[1:]
+    elif len(digits) == 9:
+        digits = '254' + digits
+    if not re.fullmatch(r'254[17]\d{8}', digits):
+        raise ValueError('Enter a Kenyan mobile number such as 0712345678')
+    return digits
 
 class MpesaService:
     def __init__(self):
@@ -14,43 +34,37 @@ class MpesaService:
         self.shortcode = current_app.config['MPESA_SHORTCODE']
         self.passkey = current_app.config['MPESA_PASSKEY']
         self.callback_url = current_app.config['MPESA_CALLBACK_URL']
-        self.access_token = None
+        self.base_url = current_app.config['MPESA_BASE_URL'].rstrip('/')
         
+    @property
+    def access_token(self):
+        return self.get_access_token()
+    
     def get_access_token(self):
-        """Get M-Pesa access token"""
-        url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-        auth = base64.b64encode(f"{self.consumer_key}:{self.consumer_secret}".encode()).decode()
-        
-        headers = {
-            'Authorization': f'Basic {auth}'
-        }
-        
+        """M-Pesa access token, shared by every request until it is due for refresh"""
+        return token_cache.get(f'mpesa:{self.shortcode}', self._fetch_access_token)
+    
+    def _fetch_access_token(self):
         try:
-            response = requests.get(url, headers=headers)
+            response = provider_http.request(
+                'mpesa', 'GET', f'{self.base_url}/oauth/v1/generate',
+                params={'grant_type': 'client_credentials'},
+                auth=(self.consumer_key, self.consumer_secret)
+            )
             response.raise_for_status()
-            self.access_token = response.json()['access_token']
-            return self.access_token
+            data = response.json()
+            return data['access_token'], data.get('expires_in', 3599)
         except Exception as e:
             current_app.logger.error(f"Error getting M-Pesa token: {str(e)}")
             raise
     
     def stk_push(self, phone_number, amount, account_reference, transaction_desc):
         """Initiate STK Push payment"""
-        if not self.access_token:
-            self.get_access_token()
-        
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         password = base64.b64encode(
             f"{self.shortcode}{self.passkey}{timestamp}".encode()
         ).decode()
         
-        url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-        
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
-        
         payload = {
             "BusinessShortCode": self.shortcode,
             "Password": password,
@@ -65,19 +79,37 @@ class MpesaService:
             "TransactionDesc": transaction_desc
         }
         
+        started = time.perf_counter()
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = self._post_stk_push(payload)
+            if response.status_code == 401:
+                # Token revoked before its expiry; fetch a new one and try once more
+                token_cache.invalidate(f'mpesa:{self.shortcode}')
+                response = self._post_stk_push(payload)
             response.raise_for_status()
+            metrics.incr('mpesa.stk_push.sent')
             return response.json()
         except Exception as e:
+            metrics.incr('mpesa.stk_push.errors')
             current_app.logger.error(f"Error in STK Push: {str(e)}")
             raise
+        finally:
+            metrics.observe('mpesa.stk_push', time.perf_counter() - started)
+    
+    def _post_stk_push(self, payload):
+        return provider_http.request(
+            'mpesa', 'POST', f'{self.base_url}/mpesa/stkpush/v1/processrequest',
+            json=payload,
+            headers={'Authorization': f'Bearer {self.get_access_token()}'}
+        )
 
 class StripeService:
     def __init__(self):
         self.secret_key = current_app.config['STRIPE_SECRET_KEY']
         self.publishable_key = current_app.config['STRIPE_PUBLISHABLE_KEY']
         self.webhook_secret = current_app.config['STRIPE_WEBHOOK_SECRET']
+        if stripe is None:
+            raise RuntimeError('Card payments need the stripe package installed')
         stripe.api_key = self.secret_key
     
     def create_payment_intent(self, amount, currency='kes', metadata=None):
@@ -148,7 +180,14 @@ class StripeService:
 class PaymentService:
     def __init__(self):
         self.mpesa_service = MpesaService()
-        self.stripe_service = StripeService()
+        self._stripe_service = None
+    
+    @property
+    def stripe_service(self):
+        # Built on first use so M-Pesa payments work without the stripe package
+        if self._stripe_service is None:
+            self._stripe_service = StripeService()
+        return self._stripe_service
     
     def create_payment(self, user_id, amount, payment_method, description=None, metadata=None):
         """Create a new payment record"""
@@ -157,7 +196,7 @@ class PaymentService:
             amount=amount,
             payment_method=payment_method,
             description=description,
-            metadata=metadata or {}
+            payment_metadata=metadata or {}
         )
         
         db.session.add(payment)
@@ -166,52 +205,26 @@ class PaymentService:
         return payment
     
     def process_mpesa_payment(self, user_id, phone_number, amount, description=None):
-        """Process M-Pesa payment"""
-        try:
-            # Create payment record
-            payment = self.create_payment(
-                user_id=user_id,
-                amount=amount,
-                payment_method=PaymentMethod.MPESA,
-                description=description
-            )
-            
-            # Initiate STK Push
-            response = self.mpesa_service.stk_push(
-                phone_number=phone_number,
-                amount=int(amount),
-                account_reference=f"KENFUSE{payment.id[:8]}",
-                transaction_desc=description or "KENFUSE Payment"
-            )
-            
-            # Update payment with request data
-            if response.get('ResponseCode') == '0':
-                payment.metadata = {
-                    'checkout_request_id': response.get('CheckoutRequestID'),
-                    'merchant_request_id': response.get('MerchantRequestID'),
-                    'response_code': response.get('ResponseCode'),
-                    'response_description': response.get('ResponseDescription')
-                }
-                db.session.commit()
-                
-                return {
-                    'success': True,
-                    'payment_id': payment.id,
-                    'checkout_request_id': response.get('CheckoutRequestID'),
-                    'message': 'Payment initiated successfully'
-                }
-            else:
-                payment.status = PaymentStatus.FAILED
-                db.session.commit()
-                
-                return {
-                    'success': False,
-                    'error': response.get('ResponseDescription', 'Payment failed')
-                }
-                
-        except Exception as e:
-            current_app.logger.error(f"Error processing M-Pesa payment: {str(e)}")
-            raise
+        """Record an M-Pesa payment and queue its STK push; the payer is prompted by a job worker"""
+        payment = Payment(
+            user_id=user_id,
+            amount=amount,
+            payment_method=PaymentMethod.MPESA,
+            description=description,
+            payment_metadata={'phone_number': phone_number}
+        )
+        db.session.add(payment)
+        db.session.flush()
+        
+        # Same transaction as the payment, so a push is queued exactly when the payment exists
+        enqueue_stk_push(payment, phone_number, description)
+        db.session.commit()
+        
+        return {
+            'success': True,
+            'payment_id': payment.id,
+            'message': 'Payment queued; confirm the prompt on your phone'
+        }
     
     def process_card_payment(self, user_id, amount, description=None, metadata=None):
         """Process card payment"""
@@ -256,7 +269,7 @@ class PaymentService:
         # This would typically query M-Pesa API or check callback data
         # For now, we'll simulate verification
         payment = Payment.query.filter_by(
-            metadata['checkout_request_id'].astext == checkout_request_id
+            Payment.payment_metadata['checkout_request_id'].as_string() == checkout_request_id
         ).first()
         
         if payment:
@@ -268,4 +281,71 @@ class PaymentService:
         return {
             'success': False,
             'error': 'Payment not found'
-        }
\ No newline at end of file
+        }
+
+def enqueue_stk_push(payment, phone_number, description=None):
+    """Queue the STK push for a flushed M-Pesa payment; commit the session to send it"""
+    return job_queue.enqueue(STK_PUSH_JOB, {
+        'payment_id': payment.id,
+        'phone_number': phone_number,
+        'description': description
+    }, reference=payment.id)
+
+def send_stk_push(payment_id, phone_number, description=None):
+    """Job handler: prompt the payer, then record the checkout request on the payment
+
+    Running twice is harmless, because a payment that already has a
+    checkout request (or is no longer pending) is left alone. Errors
+    where Safaricom never accepted the request (connection failures,
+    429 and 5xx) are retried by the queue. A read timeout is not: the
+    payer may already have been prompted, and a second push could charge
+    them twice, so the payment fails and is left to reconciliation.
+    """
+    payment = db.session.get(Payment, payment_id)
+    if payment is None or payment.status != PaymentStatus.PENDING:
+        return
+    
+    metadata = dict(payment.payment_metadata or {})
+    if metadata.get('checkout_request_id'):
+        return
+    
+    try:
+        response = MpesaService().stk_push(
+            phone_number=phone_number,
+            amount=int(payment.amount),
+            account_reference=f"KENFUSE{payment.id[:8]}",
+            transaction_desc=description or "KENFUSE Payment"
+        )
+    except requests.ReadTimeout as e:
+        raise JobFailed('M-Pesa did not answer in time; the payer may still have been prompted') from e
+    except requests.HTTPError as e:
+        status = e.response.status_code if e.response is not None else None
+        if status is not None and 400 <= status < 500 and status != 429:
+            raise JobFailed(f'M-Pesa rejected the request ({status})') from e
+        raise
+    
+    metadata.update({
+        'checkout_request_id': response.get('CheckoutRequestID'),
+        'merchant_request_id': response.get('MerchantRequestID'),
+        'response_code': response.get('ResponseCode'),
+        'response_description': response.get('ResponseDescription')
+    })
+    payment.payment_metadata = metadata
+    if response.get('ResponseCode') != '0':
+        payment.status = PaymentStatus.FAILED
+        metrics.incr('mpesa.stk_push.declined')
+    db.session.commit()
+
+def fail_stk_push(payload, error):
+    """Mark the payment failed once its STK push job gives up"""
+    payment = db.session.get(Payment, payload['payment_id'])
+    if payment is None or payment.status != PaymentStatus.PENDING:
+        return
+    
+    payment.status = PaymentStatus.FAILED
+    payment.payment_metadata = {**(payment.payment_metadata or {}), 'error': error}
+    db.session.commit()
+
+def register_payment_jobs(app):
+    job_queue.register(STK_PUSH_JOB, send_stk_push, on_failure=fail_stk_push,
+                       max_attempts=app.config.get('MPESA_STK_PUSH_ATTEMPTS', 5))
\ No newline at end of file
@@ -0,0 +1,56 @@
+from flask import current_app, g, request
+from flask_jwt_extended import verify_jwt_in_request, get_jwt, get_jwt_identity
+from flask_jwt_extended.exceptions import JWTExtendedException
+from flask_limiter.util import get_remote_address
+from jwt.exceptions import PyJWTError
+
+from app.utils.decorators import current_plan
+
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+def _client():
+    """(client key, plan) for the current request, resolved once per request
+
+    Authenticated callers are keyed on their JWT identity and budgeted by
+    the plan in their token claims; everyone else falls back to the
+    client address. Nothing here touches the database.
+    """
+    if '_quota_client' not in g:
+        client = ('ip:%s' % get_remote_address(), None)
+        # JWT verification skips preflights without decoding anything
+        if not is_preflight():
+            try:
+                verify_jwt_in_request(optional=True)
+                identity = get_jwt_identity()
+                if identity:
+                    client = ('user:%s' % identity, current_plan(get_jwt()))
+            except (JWTExtendedException, PyJWTError):
+                # Invalid or expired tokens are rejected by the route itself
+                pass
+        g._quota_client = client
+    return g._quota_client
+
+def quota_bucket():
+    return 'write' if request.method in WRITE_METHODS else 'read'
+
+def rate_limit_key():
+    """Limiter key: one read and one write bucket per user (or address)"""
+    key, _ = _client()
+    return '%s:%s' % (key, quota_bucket())
+
+def quota_scope(endpoint):
+    """Limiter scope shared by every endpoint, so a bucket is not multiplied per route"""
+    return 'quota:%s' % quota_bucket()
+
+def quota_limit():
+    """Budget for the current request's bucket, derived from the caller's plan"""
+    _, plan = _client()
+    if plan is None:
+        budgets = current_app.config['ANONYMOUS_RATE_LIMITS']
+    else:
+        plans = current_app.config['SUBSCRIPTION_PLANS']
+        budgets = plans.get(plan, plans['free'])['rate_limits']
+    return budgets[quota_bucket()]
+
+def is_preflight():
+    return request.method == 'OPTIONS'
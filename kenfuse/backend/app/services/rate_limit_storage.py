@@ -0,0 +1,323 @@
+import atexit
+import os
+import sqlite3
+import tempfile
+import time
+
+from limits.storage import MovingWindowSupport, Storage
+
+from app.utils.metrics import metrics
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'kenfuse-ratelimits.sqlite3')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ratelimit_counters (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ratelimit_events (
+    key TEXT NOT NULL,
+    ts REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_ratelimit_events_key_ts ON ratelimit_events (key, ts);
+CREATE INDEX IF NOT EXISTS ix_ratelimit_events_expires_at ON ratelimit_events (expires_at);
+"""
+
+UPSERT_COUNTER = """
+INSERT INTO ratelimit_counters (key, value, expires_at) VALUES (:key, :amount, :expires_at)
+ON CONFLICT (key) DO UPDATE SET
+    value = CASE WHEN ratelimit_counters.expires_at <= :now
+                 THEN excluded.value ELSE ratelimit_counters.value + excluded.value END,
+    expires_at = CASE WHEN ratelimit_counters.expires_at <= :now OR :elastic
+                      THEN excluded.expires_at ELSE ratelimit_counters.expires_at END
+"""
+
+class SQLiteStorage(Storage, MovingWindowSupport):
+    """Rate limit storage shared by every worker process on one host
+
+    Counters live in a WAL-mode SQLite file (put it on /dev/shm for a
+    purely in-memory store). Each process keeps a local view and syncs
+    its pending hits in one transaction every ``sync_interval`` seconds
+    or ``batch_size`` hits, so most checks never touch the file. Across
+    processes a limit can overshoot by at most one batch per worker;
+    ``sync_interval=0`` makes every check a synchronous transaction.
+
+    URIs follow SQLAlchemy's form: ``sqlite:////abs/path.db``,
+    ``sqlite:///relative.db``, ``sqlite:///:memory:`` (single process)
+    or bare ``sqlite://`` for a file in the system temp directory.
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri=None, sync_interval=0.05, batch_size=32, timeout=5.0, **options):
+        path = (uri or '').split('://', 1)[-1]
+        self.path = path[1:] if path.startswith('/') else (path or DEFAULT_PATH)
+        self.sync_interval = float(sync_interval)
+        self.batch_size = int(batch_size)
+        self.timeout = float(timeout)
+        self._connection = None
+        self._connection_pid = None
+        self._pending = {}
+        self._counters = {}
+        self._pending_events = {}
+        self._windows = {}
+        self._last_purge = 0.0
+        super().__init__(uri, **options)
+        self._connect()
+        atexit.register(self.flush)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connect(self):
+        # Connections are not shared across fork
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            if self.path != ':memory:':
+                connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._connection = connection
+            self._connection_pid = os.getpid()
+            self._pending.clear()
+            self._counters.clear()
+            self._pending_events.clear()
+            self._windows.clear()
+        return self._connection
+
+    def _transaction(self):
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        return connection
+
+    # Fixed window
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        with self.lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = [0, expiry, False]
+            pending[0] += amount
+            pending[1] = expiry
+            pending[2] = pending[2] or elastic_expiry
+
+            cached = self._counters.get(key)
+            if (cached is None or elastic_expiry or cached[1] <= now
+                    or cached[2] + self.sync_interval <= now or pending[0] >= self.batch_size):
+                self._flush_counters(now)
+                cached = self._counters[key]
+                return cached[0]
+
+            return cached[0] + pending[0]
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            cached = self._counters.get(key)
+            pending = self._pending.get(key, (0,))[0]
+            if cached is None or cached[2] + self.sync_interval <= now:
+                row = self._connect().execute(
+                    'SELECT value, expires_at FROM ratelimit_counters WHERE key = ?', (key,)
+                ).fetchone()
+                cached = (row[0], row[1], now) if row else (0, now, now)
+                self._counters[key] = cached
+            value = cached[0] if cached[1] > now else 0
+            return value + pending
+
+    def get_expiry(self, key):
+        now = time.time()
+        with self.lock:
+            cached = self._counters.get(key)
+            if cached is None:
+                row = self._connect().execute(
+                    'SELECT expires_at FROM ratelimit_counters WHERE key = ?', (key,)
+                ).fetchone()
+                return int(row[0]) if row else int(now)
+            return int(cached[1])
+
+    def _flush_counters(self, now):
+        if not self._pending:
+            return
+        started = time.perf_counter()
+        pending, self._pending = self._pending, {}
+        connection = self._transaction()
+        try:
+            for key, (amount, expiry, elastic) in pending.items():
+                connection.execute(UPSERT_COUNTER, {
+                    'key': key,
+                    'amount': amount,
+                    'expires_at': now + expiry,
+                    'now': now,
+                    'elastic': 1 if elastic else 0
+                })
+            keys = list(pending)
+            rows = connection.execute(
+                'SELECT key, value, expires_at FROM ratelimit_counters WHERE key IN (%s)' % ','.join('?' * len(keys)),
+                keys
+            ).fetchall()
+            self._purge_expired(connection, now)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+        for key, value, expires_at in rows:
+            self._counters[key] = (value, expires_at, now)
+        metrics.incr('ratelimit.syncs')
+        metrics.observe('ratelimit.sync', time.perf_counter() - started)
+
+    # Moving (sliding) window
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        with self.lock:
+            cached = self._windows.get(key)
+            pending = self._pending_events.setdefault(key, [])
+            if cached is None or cached[2] + self.sync_interval <= now or len(pending) + amount >= self.batch_size:
+                return self._sync_window(key, expiry, now, limit=limit, amount=amount)
+
+            count = cached[1] + len(pending)
+            if count + amount > limit:
+                return False
+            pending.extend([now] * amount)
+            return True
+
+    def get_moving_window(self, key, limit, expiry):
+        now = time.time()
+        with self.lock:
+            cached = self._windows.get(key)
+            if cached is None or cached[2] + self.sync_interval <= now:
+                self._sync_window(key, expiry, now)
+                cached = self._windows[key]
+            pending = self._pending_events.get(key, [])
+            oldest = cached[0] if cached[1] else (pending[0] if pending else now)
+            return int(oldest), cached[1] + len(pending)
+
+    def _sync_window(self, key, expiry, now, limit=None, amount=0):
+        """Write pending events for key and optionally acquire atomically"""
+        started = time.perf_counter()
+        pending = self._pending_events.pop(key, [])
+        acquired = False
+        connection = self._transaction()
+        try:
+            if pending:
+                connection.executemany(
+                    'INSERT INTO ratelimit_events (key, ts, expires_at) VALUES (?, ?, ?)',
+                    [(key, ts, ts + expiry) for ts in pending]
+                )
+            connection.execute('DELETE FROM ratelimit_events WHERE key = ? AND ts <= ?', (key, now - expiry))
+            oldest, count = connection.execute(
+                'SELECT MIN(ts), COUNT(*) FROM ratelimit_events WHERE key = ?', (key,)
+            ).fetchone()
+            if limit is not None and count + amount <= limit:
+                connection.executemany(
+                    'INSERT INTO ratelimit_events (key, ts, expires_at) VALUES (?, ?, ?)',
+                    [(key, now, now + expiry)] * amount
+                )
+                count += amount
+                oldest = oldest or now
+                acquired = True
+            self._purge_expired(connection, now)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+        self._windows[key] = (oldest or now, count, now, expiry)
+        metrics.incr('ratelimit.syncs')
+        metrics.observe('ratelimit.sync', time.perf_counter() - started)
+        return acquired
+
+    # Maintenance
+
+    def _purge_expired(self, connection, now):
+        """Drop expired counters and events for every key, not just the ones being synced
+
+        Keys seen once (a passing address, a user who never returns) are
+        otherwise never touched again. Runs at most once a minute per
+        process, inside the caller's transaction.
+        """
+        if now - self._last_purge < 60:
+            return
+        connection.execute('DELETE FROM ratelimit_counters WHERE expires_at <= ?', (now,))
+        connection.execute('DELETE FROM ratelimit_events WHERE expires_at <= ?', (now,))
+        self._last_purge = now
+
+        # The local views of those keys are just as stale
+        for key, (_, expires_at, _) in list(self._counters.items()):
+            if expires_at <= now and key not in self._pending:
+                del self._counters[key]
+        for key, (_, _, synced_at, expiry) in list(self._windows.items()):
+            if synced_at + expiry <= now and not self._pending_events.get(key):
+                del self._windows[key]
+                self._pending_events.pop(key, None)
+        metrics.gauge('ratelimit.local_keys', len(self._counters) + len(self._windows))
+
+    def flush(self):
+        """Write all pending hits; called at exit"""
+        if self._connection is None or self._connection_pid != os.getpid():
+            return
+        with self.lock:
+            now = time.time()
+            self._flush_counters(now)
+            for key in list(self._pending_events):
+                pending = self._pending_events.pop(key)
+                if pending:
+                    connection = self._transaction()
+                    expiry = self._windows[key][3] if key in self._windows else 0
+                    connection.executemany(
+                        'INSERT INTO ratelimit_events (key, ts, expires_at) VALUES (?, ?, ?)',
+                        [(key, ts, ts + expiry) for ts in pending]
+                    )
+                    connection.execute('COMMIT')
+
+    def check(self):
+        try:
+            with self.lock:
+                self._connect().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        with self.lock:
+            connection = self._transaction()
+            try:
+                count = connection.execute('SELECT COUNT(*) FROM ratelimit_counters').fetchone()[0]
+                connection.execute('DELETE FROM ratelimit_counters')
+                connection.execute('DELETE FROM ratelimit_events')
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+            self._pending.clear()
+            self._counters.clear()
+            self._pending_events.clear()
+            self._windows.clear()
+            return count
+
+    def clear(self, key):
+        with self.lock:
+            connection = self._transaction()
+            try:
+                connection.execute('DELETE FROM ratelimit_counters WHERE key = ?', (key,))
+                connection.execute('DELETE FROM ratelimit_events WHERE key = ?', (key,))
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+            self._pending.pop(key, None)
+            self._counters.pop(key, None)
+            self._pending_events.pop(key, None)
+            self._windows.pop(key, None)
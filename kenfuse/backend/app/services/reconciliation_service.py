@@ -0,0 +1,486 @@
+import csv
+import time
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, delete, exists, false, func, insert, or_, select, update
+
+from app.extensions import db, response_cache, event_hub
+from app.models import (
+    Payment, PaymentStatus, PaymentMethod, Donation, Fundraiser, FundraiserStatus,
+    ReconciliationRun, SettlementLine
+)
+from app.services.donation_service import progress
+from app.services.stats_service import bump
+from app.utils.metrics import metrics
+
+BATCH_SIZE = 5000
+AMOUNT_TOLERANCE = 0.005
+
+# Header names seen in each provider's CSV exports, per field we read
+STATEMENT_COLUMNS = {
+    'mpesa': {
+        'reference': ('Receipt No.', 'Receipt No', 'ReceiptNo', 'receipt'),
+        'amount': ('Paid In', 'Paid in', 'Amount', 'amount'),
+        'settled_at': ('Completion Time', 'Transaction Date', 'completed_at'),
+        'status': ('Transaction Status', 'Status', 'status')
+    },
+    'stripe': {
+        'reference': ('PaymentIntent ID', 'payment_intent_id', 'payment_intent', 'id'),
+        'amount': ('Amount', 'gross', 'amount'),
+        'settled_at': ('Created (UTC)', 'created_utc', 'created'),
+        'status': ('Status', 'status')
+    }
+}
+
+SETTLED_STATUSES = {'', 'completed', 'paid', 'succeeded', 'available'}
+
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%d/%m/%Y %H:%M:%S', '%d-%m-%Y %H:%M:%S', '%d/%m/%Y %H:%M')
+
+# Statement times without a zone are local to the provider's export
+STATEMENT_UTC_OFFSETS = {'mpesa': timedelta(hours=3), 'stripe': timedelta(0)}  # M-Pesa statements are in EAT
+
+PROVIDER_METHODS = {'mpesa': PaymentMethod.MPESA, 'stripe': PaymentMethod.CARD}
+
+# Payment columns a statement reference can match, first one preferred
+REFERENCE_COLUMNS = {
+    'mpesa': (Payment.mpesa_receipt,),
+    'stripe': (Payment.stripe_payment_intent, Payment.transaction_id)
+}
+
+REPORT_COLUMNS = ('kind', 'provider', 'reference', 'payment_id', 'donation_id', 'fundraiser_id', 'expected', 'actual', 'detail')
+
+StatementLine = namedtuple('StatementLine', 'number reference amount settled_at settled error')
+
+class StatementError(Exception):
+    """Raised when a statement file has no recognisable header"""
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _parse_time(value, provider):
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        for time_format in TIME_FORMATS:
+            try:
+                parsed = datetime.strptime(value, time_format)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f'unrecognised time {value!r}')
+    if parsed.tzinfo:
+        return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed - STATEMENT_UTC_OFFSETS[provider]
+
+def read_statement(stream, provider):
+    """StatementLines from a provider CSV export, one row at a time
+
+    Rows before the header (M-Pesa statements open with account
+    details) are skipped. Unreadable rows come back with error set
+    rather than stopping the file.
+    """
+    aliases = STATEMENT_COLUMNS[provider]
+    reader = csv.reader(stream)
+    columns = None
+    for row in reader:
+        header = [cell.strip() for cell in row]
+        found = {field: next((header.index(name) for name in names if name in header), None) for field, names in aliases.items()}
+        if found['reference'] is not None and found['amount'] is not None:
+            columns = found
+            break
+    if columns is None:
+        raise StatementError(f'No {provider} statement header found')
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        number = reader.line_num
+        try:
+            reference = row[columns['reference']].strip()
+            status = row[columns['status']].strip().lower() if columns['status'] is not None else ''
+            amount = float(row[columns['amount']].replace(',', '').strip() or 0)
+            settled_at = _parse_time(row[columns['settled_at']], provider) if columns['settled_at'] is not None else None
+        except (IndexError, ValueError) as e:
+            yield StatementLine(number, row[columns['reference']].strip() if len(row) > columns['reference'] else '', None, None, False, str(e))
+            continue
+        if not reference:
+            yield StatementLine(number, '', amount, settled_at, False, 'missing reference')
+            continue
+        yield StatementLine(number, reference, amount, settled_at, status in SETTLED_STATUSES, None)
+
+def _status_for(row, total):
+    """Status after a corrected total: active ones complete at the target, running completed ones reopen below it"""
+    if row.status == FundraiserStatus.ACTIVE and total >= row.target_amount:
+        return FundraiserStatus.COMPLETED
+    if row.status == FundraiserStatus.COMPLETED and total < row.target_amount and row.end_date > datetime.utcnow():
+        return FundraiserStatus.ACTIVE
+    return row.status
+
+class Reconciliation:
+    """Matches settlement statements to payments, and payments to donations
+
+    Statement lines are matched in batches: one indexed IN query per
+    batch finds payments by receipt or payment intent, and lines left
+    over are paired with payments of the same amount, made within the
+    time window, that have no reference recorded. Matched lines are
+    staged in settlement_lines so the checks that need the whole
+    statement (duplicates, completed payments never settled, fundraiser
+    totals) run as set queries in the database. Memory stays bounded by
+    the batch size whatever the size of the statement or the tables.
+
+    Mismatches are written to the report CSV as they are found.
+    """
+
+    def __init__(self, report, window=timedelta(minutes=10), batch_size=BATCH_SIZE):
+        self.report = csv.writer(report)
+        self.report.writerow(REPORT_COLUMNS)
+        self.window = window
+        self.batch_size = batch_size
+        self.counts = Counter()
+        self.periods = {}
+        self.run = None
+
+    def start(self, sources):
+        self.run = ReconciliationRun(sources=sources)
+        db.session.add(self.run)
+        db.session.commit()
+        return self.run
+
+    def mismatch(self, kind, provider='', reference='', payment_id='', donation_id='', fundraiser_id='',
+                 expected='', actual='', detail=''):
+        self.counts[kind] += 1
+        self.report.writerow((kind, provider, reference, payment_id, donation_id, fundraiser_id, expected, actual, detail))
+
+    def load(self, provider, stream):
+        """Match every line of one statement; returns the number of lines read"""
+        read = 0
+        for lines in _chunks(read_statement(stream, provider), self.batch_size):
+            started = time.perf_counter()
+            self._match(provider, lines)
+            db.session.commit()
+            read += len(lines)
+            metrics.observe('reconciliation.batch', time.perf_counter() - started)
+        self.counts['statement_lines'] += read
+        metrics.incr('reconciliation.lines', read)
+        return read
+
+    def _match(self, provider, lines):
+        settled = []
+        for line in lines:
+            if line.error:
+                self.mismatch('unreadable_line', provider, line.reference, detail=f'line {line.number}: {line.error}')
+            elif not line.settled:
+                self.counts['skipped_lines'] += 1
+            else:
+                settled.append(line)
+                if line.settled_at:
+                    start, end = self.periods.get(provider, (line.settled_at, line.settled_at))
+                    self.periods[provider] = (min(start, line.settled_at), max(end, line.settled_at))
+        if not settled:
+            return
+
+        columns = REFERENCE_COLUMNS[provider]
+        references = {line.reference for line in settled}
+        by_reference = {}
+        payments = db.session.execute(
+            select(Payment.id, Payment.amount, Payment.status, *columns).where(or_(*(column.in_(references) for column in columns)))
+        )
+        for payment in payments:
+            for column in reversed(columns):
+                value = getattr(payment, column.key)
+                if value in references:
+                    by_reference[value] = payment
+
+        staged = []
+        unmatched = []
+        for line in settled:
+            payment = by_reference.get(line.reference)
+            if payment is None:
+                unmatched.append(line)
+            else:
+                staged.append(self._stage(provider, line, payment, 'reference'))
+
+        if unmatched:
+            candidates = self._window_candidates(provider, unmatched)
+            for line in unmatched:
+                payment = self._nearest(candidates, line)
+                if payment is None:
+                    self.mismatch('unmatched_settlement', provider, line.reference, expected=line.amount,
+                                  detail=f'line {line.number}')
+                    staged.append(self._stage(provider, line, None, None))
+                else:
+                    # Matched on amount and time alone; the payment should record this reference
+                    self.mismatch('missing_reference', provider, line.reference, payment.id, expected=line.reference,
+                                  detail=f'matched on amount and time, line {line.number}')
+                    staged.append(self._stage(provider, line, payment, 'window'))
+
+        db.session.execute(insert(SettlementLine), staged)
+
+    def _stage(self, provider, line, payment, match):
+        if payment is not None:
+            self.counts['matched'] += 1
+            if abs(payment.amount - line.amount) > AMOUNT_TOLERANCE:
+                self.mismatch('amount_mismatch', provider, line.reference, payment.id,
+                              expected=line.amount, actual=payment.amount, detail=f'line {line.number}')
+            if payment.status != PaymentStatus.COMPLETED:
+                self.mismatch('settled_not_completed', provider, line.reference, payment.id,
+                              expected=PaymentStatus.COMPLETED.value, actual=payment.status.value if payment.status else '')
+        return {
+            'run_id': self.run.id,
+            'provider': provider,
+            'reference': line.reference,
+            'amount': line.amount,
+            'settled_at': line.settled_at,
+            'payment_id': payment.id if payment is not None else None,
+            'match': match
+        }
+
+    def _window_candidates(self, provider, lines):
+        """Unmatched payments without a reference that could pay these lines, by amount"""
+        times = [line.settled_at for line in lines if line.settled_at]
+        if not times:
+            return {}
+        already_matched = exists().where(SettlementLine.run_id == self.run.id, SettlementLine.payment_id == Payment.id)
+        payments = db.session.execute(
+            select(Payment.id, Payment.amount, Payment.status, Payment.created_at).where(
+                Payment.payment_method == PROVIDER_METHODS[provider],
+                Payment.created_at.between(min(times) - self.window, max(times) + self.window),
+                REFERENCE_COLUMNS[provider][0].is_(None),
+                Payment.amount.in_({line.amount for line in lines}),
+                ~already_matched
+            ).order_by(Payment.created_at)
+        )
+        candidates = {}
+        for payment in payments:
+            candidates.setdefault(round(payment.amount, 2), []).append(payment)
+        return candidates
+
+    def _nearest(self, candidates, line):
+        if line.settled_at is None:
+            return None
+        options = candidates.get(round(line.amount, 2), [])
+        best = None
+        for payment in options:
+            gap = abs(payment.created_at - line.settled_at)
+            if gap <= self.window and (best is None or gap < abs(best.created_at - line.settled_at)):
+                best = payment
+        if best is not None:
+            options.remove(best)
+        return best
+
+    def check_statements(self):
+        """Statement-wide checks: duplicate references, completed payments never settled"""
+        duplicates = db.session.execute(
+            select(SettlementLine.provider, SettlementLine.reference, func.count())
+            .where(SettlementLine.run_id == self.run.id)
+            .group_by(SettlementLine.provider, SettlementLine.reference)
+            .having(func.count() > 1)
+            .execution_options(yield_per=self.batch_size)
+        )
+        for provider, reference, count in duplicates:
+            self.mismatch('duplicate_settlement', provider, reference, actual=count)
+
+        settled = exists().where(SettlementLine.run_id == self.run.id, SettlementLine.payment_id == Payment.id)
+        for provider, (start, end) in self.periods.items():
+            columns = REFERENCE_COLUMNS[provider]
+            unsettled = db.session.execute(
+                select(Payment.id, Payment.amount, columns[0]).where(
+                    Payment.payment_method == PROVIDER_METHODS[provider],
+                    Payment.status == PaymentStatus.COMPLETED,
+                    Payment.created_at.between(start - self.window, end),
+                    ~settled
+                ).execution_options(yield_per=self.batch_size)
+            )
+            for payment_id, amount, reference in unsettled:
+                self.mismatch('unsettled_payment', provider, reference or '', payment_id, actual=amount,
+                              detail='completed but not in the statement')
+
+    def link_donations(self):
+        """Fill Payment.donation_id from payment_metadata on payments written before the column existed"""
+        last_id = None
+        while True:
+            query = select(Payment.id, Payment.payment_metadata).where(Payment.donation_id.is_(None))
+            if last_id is not None:
+                query = query.where(Payment.id > last_id)
+            page = db.session.execute(query.order_by(Payment.id).limit(self.batch_size)).all()
+            if not page:
+                break
+            last_id = page[-1].id
+
+            wanted = {
+                payment_id: str(metadata['donation_id'])
+                for payment_id, metadata in page
+                if isinstance(metadata, dict) and metadata.get('donation_id')
+            }
+            found = set(db.session.execute(
+                select(Donation.id).where(Donation.id.in_(set(wanted.values())))
+            ).scalars()) if wanted else set()
+            links = []
+            for payment_id, donation_id in wanted.items():
+                if donation_id in found:
+                    links.append({'id': payment_id, 'donation_id': donation_id})
+                else:
+                    self.mismatch('payment_without_donation', payment_id=payment_id, donation_id=donation_id)
+            if links:
+                db.session.execute(update(Payment), links)
+                self.counts['linked_payments'] += len(links)
+            db.session.commit()
+
+    def check_donations(self):
+        """Every donation has exactly one payment for the same amount"""
+        orphans = db.session.execute(
+            select(Donation.id, Donation.fundraiser_id, Donation.amount, Donation.payment_method, Donation.transaction_id)
+            .outerjoin(Payment, Payment.donation_id == Donation.id)
+            .where(Payment.id.is_(None))
+            .execution_options(yield_per=self.batch_size)
+        )
+        for donation_id, fundraiser_id, amount, method, transaction_id in orphans:
+            self.mismatch('donation_without_payment', method, transaction_id, donation_id=donation_id,
+                          fundraiser_id=fundraiser_id, expected=amount)
+
+        pairs = db.session.execute(
+            select(Donation.id, Donation.fundraiser_id, Donation.amount, Payment.id, Payment.amount)
+            .join(Payment, Payment.donation_id == Donation.id)
+            .where(func.abs(Donation.amount - Payment.amount) > AMOUNT_TOLERANCE)
+            .execution_options(yield_per=self.batch_size)
+        )
+        for donation_id, fundraiser_id, donation_amount, payment_id, payment_amount in pairs:
+            self.mismatch('donation_amount_mismatch', payment_id=payment_id, donation_id=donation_id,
+                          fundraiser_id=fundraiser_id, expected=payment_amount, actual=donation_amount)
+
+        duplicates = db.session.execute(
+            select(Payment.donation_id, func.count())
+            .where(Payment.donation_id.isnot(None))
+            .group_by(Payment.donation_id)
+            .having(func.count() > 1)
+            .execution_options(yield_per=self.batch_size)
+        )
+        for donation_id, count in duplicates:
+            self.mismatch('duplicate_payment', donation_id=donation_id, actual=count)
+
+    def _covered(self):
+        """Payments made through a provider, and in the period, of a statement loaded in this run"""
+        return or_(false(), *(
+            and_(Payment.payment_method == PROVIDER_METHODS[provider], Payment.created_at.between(start - self.window, end))
+            for provider, (start, end) in self.periods.items()
+        ))
+
+    def correct_totals(self, apply=False):
+        """Compare each fundraiser's current_amount with the donations actually received
+
+        Totals include a donation as soon as it is made, so only payments
+        a statement covers can be found missing: a donation counts unless
+        its payment falls in a loaded statement's provider and period yet
+        is neither COMPLETED nor settled on it. With apply, differing
+        totals are overwritten, and the status recomputed, one batch of
+        fundraisers per transaction; a fundraiser that changed since it
+        was read (a donation arrived) is left for the next run.
+        """
+        fundraisers = Fundraiser.__table__
+        received = or_(
+            Payment.status == PaymentStatus.COMPLETED,
+            exists().where(SettlementLine.run_id == self.run.id, SettlementLine.payment_id == Payment.id),
+            ~self._covered()
+        )
+        last_id = None
+        while True:
+            query = select(fundraisers.c.id, fundraisers.c.current_amount, fundraisers.c.target_amount,
+                           fundraisers.c.status, fundraisers.c.end_date)
+            if last_id is not None:
+                query = query.where(fundraisers.c.id > last_id)
+            page = db.session.execute(query.order_by(fundraisers.c.id).limit(self.batch_size)).all()
+            if not page:
+                break
+            last_id = page[-1].id
+
+            totals = dict(db.session.execute(
+                select(Donation.fundraiser_id, func.sum(Donation.amount))
+                .join(Payment, Payment.donation_id == Donation.id)
+                .where(Donation.fundraiser_id.in_([row.id for row in page]), received)
+                .group_by(Donation.fundraiser_id)
+            ).all())
+
+            corrected = []
+            for row in page:
+                expected = round(float(totals.get(row.id) or 0), 2)
+                actual = float(row.current_amount or 0)
+                if abs(expected - actual) <= AMOUNT_TOLERANCE:
+                    continue
+                self.mismatch('fundraiser_total', fundraiser_id=row.id, expected=expected, actual=actual)
+                if apply:
+                    status = _status_for(row, expected)
+                    result = db.session.execute(
+                        update(fundraisers).where(
+                            fundraisers.c.id == row.id,
+                            fundraisers.c.current_amount == row.current_amount,
+                            fundraisers.c.target_amount == row.target_amount,
+                            fundraisers.c.status == row.status
+                        ).values(current_amount=expected, status=status, updated_at=datetime.utcnow())
+                    )
+                    if result.rowcount:
+                        corrected.append((row, expected, status))
+                    else:
+                        self.counts['fundraiser_changed'] += 1
+
+            if corrected:
+                # Bulk UPDATEs skip the ORM events that keep these current
+                connection = db.session.connection()
+                bump(connection, 'watermark.fundraisers')
+                for row, _, status in corrected:
+                    if status != row.status:
+                        bump(connection, f'fundraisers.status.{row.status.value}', -1)
+                        bump(connection, f'fundraisers.status.{status.value}', 1)
+                response_cache.purge_after_commit(db.session, 'fundraisers', *(f'fundraiser:{row.id}' for row, _, _ in corrected))
+                for row, expected, status in corrected:
+                    event_hub.publish_after_commit(db.session, f'fundraiser:{row.id}', 'progress',
+                                                   progress(expected, row.target_amount, status))
+                self.counts['fundraisers_corrected'] += len(corrected)
+            db.session.commit()
+
+    def finish(self, applied=False):
+        """Drop the staged statement lines and store the summary on the run"""
+        while True:
+            batch = select(SettlementLine.id).where(SettlementLine.run_id == self.run.id).limit(self.batch_size)
+            if not db.session.execute(delete(SettlementLine).where(SettlementLine.id.in_(batch))).rowcount:
+                break
+            db.session.commit()
+        self.run.summary = dict(self.counts)
+        self.run.applied = applied
+        self.run.finished_at = datetime.utcnow()
+        db.session.commit()
+        return self.run
+
+def reconcile(statements, report, window=timedelta(minutes=10), batch_size=BATCH_SIZE, apply=False):
+    """Run a full reconciliation; statements maps provider to (name, text stream)
+
+    Returns the finished ReconciliationRun, whose summary holds the
+    count of each mismatch kind written to report.
+    """
+    started = time.perf_counter()
+    reconciliation = Reconciliation(report, window=window, batch_size=batch_size)
+    reconciliation.start({provider: name for provider, (name, _) in statements.items()})
+    try:
+        for provider, (_, stream) in statements.items():
+            reconciliation.load(provider, stream)
+        reconciliation.check_statements()
+        reconciliation.link_donations()
+        reconciliation.check_donations()
+        reconciliation.correct_totals(apply=apply)
+    except Exception:
+        # Keep the partial summary but not the staged lines
+        db.session.rollback()
+        reconciliation.finish(applied=False)
+        raise
+    run = reconciliation.finish(applied=apply)
+    metrics.observe('reconciliation.run', time.perf_counter() - started)
+    return run
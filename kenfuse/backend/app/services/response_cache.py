@@ -0,0 +1,343 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, make_response, request
+
+from app.utils.metrics import metrics
+from app.utils.single_flight import SingleFlight
+
+# Headers replayed on a hit; after_request hooks (CORS, rate limits) add the rest
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Vary')
+
+# Compare-and-delete so a slow filler never releases someone else's lock
+UNLOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class LocalBackend:
+    """In-process LRU bounded by total body size"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, meta, body, tags = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return meta, body
+
+    def set(self, key, meta, body, tags, ttl):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, meta, body, tags)
+            self.size += len(body)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                metrics.incr('response_cache.evictions')
+            metrics.gauge('response_cache.bytes', self.size)
+
+    def lock(self, key, timeout):
+        # Entries are per process, so in-process single-flight is all there is
+        return None
+
+    def unlock(self, key, token):
+        pass
+
+    def purge(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    self._remove(key)
+            metrics.gauge('response_cache.bytes', self.size)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= len(entry[2])
+        for tag in entry[3]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+class RedisBackend:
+    """Shared cache for every worker; tags are Redis sets of entry keys
+
+    Redis evicts under its own maxmemory policy, so evictions are not
+    counted here.
+    """
+
+    def __init__(self, url, prefix='rc:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._unlock = self.client.register_script(UNLOCK_SCRIPT)
+
+    def get(self, key):
+        meta, body = self.client.hmget(self.prefix + key, 'meta', 'body')
+        if meta is None:
+            return None
+        return json.loads(meta), body
+
+    def set(self, key, meta, body, tags, ttl):
+        key = self.prefix + key
+        pipe = self.client.pipeline()
+        pipe.hset(key, mapping={'meta': json.dumps(meta), 'body': body})
+        pipe.expire(key, ttl)
+        for tag in tags:
+            # Tag sets outlive their entries by one TTL at most
+            pipe.sadd(self.prefix + 'tag:' + tag, key)
+            pipe.expire(self.prefix + 'tag:' + tag, ttl)
+        pipe.execute()
+
+    def lock(self, key, timeout):
+        """A token when this process should fill key, False while another process is"""
+        token = uuid.uuid4().hex
+        if self.client.set(self.prefix + 'lock:' + key, token, nx=True, px=int(timeout * 1000)):
+            return token
+        return False
+
+    def unlock(self, key, token):
+        self._unlock(keys=[self.prefix + 'lock:' + key], args=[token])
+
+    def purge(self, tags):
+        tag_keys = [self.prefix + 'tag:' + tag for tag in tags]
+        keys = self.client.sunion(tag_keys) if tag_keys else set()
+        pipe = self.client.pipeline()
+        if keys:
+            pipe.delete(*keys)
+        pipe.delete(*tag_keys)
+        pipe.execute()
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+def _tags_for(obj):
+    from app.models import Memorial, Tribute, Fundraiser, Donation
+
+    if isinstance(obj, Memorial):
+        return {f'memorial:{obj.id}', 'memorials'}
+    if isinstance(obj, Tribute):
+        return {f'memorial:{obj.memorial_id}'}
+    if isinstance(obj, Fundraiser):
+        return {f'fundraiser:{obj.id}', 'fundraisers'}
+    if isinstance(obj, Donation):
+        return {f'fundraiser:{obj.fundraiser_id}'}
+    return set()
+
+class ResponseCache:
+    """Whole-response cache for anonymous public GETs
+
+    Entries are keyed on the path plus sorted query args and carry tags
+    such as ``memorial:<id>``. Any commit that writes a memorial,
+    tribute, fundraiser or donation purges the affected tags, so write
+    handlers need no cache code; bulk SQL updates must call ``purge``
+    themselves. Only 200 responses marked ``Cache-Control: public`` are
+    stored, so private and family-only content never enters the cache.
+
+    Concurrent misses for the same key are coalesced: one request per
+    process runs the view and the rest share its bytes. With a shared
+    backend a short-lived lock extends that across processes, and
+    requests that lose the lock wait for the winner's entry.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 60
+        self.lock_timeout = 2.0
+        self.flight = SingleFlight('response_cache.coalesced')
+        self._listening = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        url = app.config.get('RESPONSE_CACHE_URL', 'memory://')
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            self.backend = RedisBackend(url)
+        else:
+            self.backend = LocalBackend(app.config.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', 60)
+        self.lock_timeout = app.config.get('RESPONSE_CACHE_LOCK_TIMEOUT', 2.0)
+        self.flight.timeout = app.config.get('RESPONSE_CACHE_WAIT_TIMEOUT', 10.0)
+        app.extensions['response_cache'] = self
+        self._listen()
+
+    def cached(self, tags=()):
+        """Cache an anonymous GET view; tags are formatted with the view arguments"""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self._cacheable_request():
+                    return fn(*args, **kwargs)
+
+                key = self._key()
+                entry = self._get(key)
+                if entry is not None:
+                    metrics.incr('response_cache.hits')
+                    return self._replay(*entry)
+
+                metrics.incr('response_cache.misses')
+                tag_set = {tag.format(**kwargs) for tag in tags}
+                # Conditional requests only share with identical conditional requests
+                flight_key = '%s|%s|%s' % (
+                    key, request.headers.get('If-None-Match', ''), request.headers.get('If-Modified-Since', '')
+                )
+                (response, entry), shared = self.flight.do(
+                    flight_key, lambda: self._fill(key, tag_set, fn, args, kwargs)
+                )
+                if shared or response is None:
+                    return self._replay(*entry, cache_status='SHARED')
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def _fill(self, key, tags, fn, args, kwargs):
+        """Run the view for key and store the result; returns (response, (meta, body))"""
+        token = self.backend.lock(key, self.lock_timeout) if self.lock_timeout else None
+        if token is False:
+            entry = self._wait_for(key)
+            if entry is not None:
+                return None, entry
+
+        try:
+            response = make_response(fn(*args, **kwargs))
+            meta = {
+                'status': response.status_code,
+                'headers': [(name, response.headers[name]) for name in STORED_HEADERS if name in response.headers]
+            }
+            body = response.get_data()
+            if response.status_code == 200 and response.cache_control.public:
+                self._set(key, meta, body, tags)
+            return response, (meta, body)
+        finally:
+            if token:
+                self._release(key, token)
+
+    def _wait_for(self, key):
+        # Another process holds the fill lock; poll for its entry until the lock would expire
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.02)
+            entry = self._get(key)
+            if entry is not None:
+                metrics.incr('response_cache.lock_waits')
+                return entry
+        metrics.incr('response_cache.lock_timeouts')
+        return None
+
+    def _release(self, key, token):
+        try:
+            self.backend.unlock(key, token)
+        except Exception:
+            metrics.incr('response_cache.errors')
+            current_app.logger.exception('Response cache unlock failed')
+
+    def purge(self, *tags):
+        if not tags or self.backend is None:
+            return
+        try:
+            self.backend.purge(tags)
+            metrics.incr('response_cache.purges', len(tags))
+        except Exception:
+            metrics.incr('response_cache.errors')
+            current_app.logger.exception('Response cache purge failed')
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def _cacheable_request(self):
+        return (
+            self.backend is not None
+            and current_app.config.get('RESPONSE_CACHE_ENABLED', True)
+            and request.method == 'GET'
+            and 'Authorization' not in request.headers
+        )
+
+    def purge_after_commit(self, session, *tags):
+        """Queue tags to purge when session commits, for writes made with bulk SQL"""
+        session.info.setdefault('_response_cache_tags', set()).update(tags)
+
+    def _key(self):
+        args = urlencode(sorted(request.args.items(multi=True)))
+        return f'{request.path}?{args}'
+
+    def _get(self, key):
+        # A failing backend degrades to uncached responses
+        try:
+            return self.backend.get(key)
+        except Exception:
+            metrics.incr('response_cache.errors')
+            current_app.logger.exception('Response cache read failed')
+            return None
+
+    def _set(self, key, meta, body, tags):
+        try:
+            self.backend.set(key, meta, body, tags, self.ttl)
+        except Exception:
+            metrics.incr('response_cache.errors')
+            current_app.logger.exception('Response cache write failed')
+
+    def _replay(self, meta, body, cache_status='HIT'):
+        response = current_app.response_class(body, status=meta['status'], headers=meta['headers'])
+        response.headers['X-Cache'] = cache_status
+        # Clients revalidating against a cached entry still get 304s
+        return response.make_conditional(request)
+
+    def _listen(self):
+        if self._listening:
+            return
+        from sqlalchemy import event
+        from app.extensions import db
+
+        event.listen(db.session, 'after_flush', self._collect_changes)
+        event.listen(db.session, 'after_commit', self._apply_purges)
+        event.listen(db.session, 'after_rollback', self._discard_changes)
+        self._listening = True
+
+    def _collect_changes(self, session, flush_context):
+        tags = session.info.setdefault('_response_cache_tags', set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            tags |= _tags_for(obj)
+
+    def _apply_purges(self, session):
+        tags = session.info.pop('_response_cache_tags', None)
+        if tags:
+            self.purge(*tags)
+
+    def _discard_changes(self, session):
+        session.info.pop('_response_cache_tags', None)
@@ -0,0 +1,195 @@
+import os
+import random
+import secrets
+import socket
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app.utils.metrics import metrics
+
+Job = namedtuple('Job', 'name fn interval')
+
+class Scheduler:
+    """Periodic jobs run inside the web workers, one worker at a time
+
+    Every worker runs the loop, but a job only starts in the worker that
+    wins its lease: a conditional UPDATE on scheduler_leases that
+    succeeds when the lease is free and the job's interval has passed
+    since its last start. A worker that dies mid-run holds the lease
+    until SCHEDULER_LEASE_TTL, after which another worker takes over.
+    Each run is recorded in job_runs with its duration and rows touched.
+
+    The loop starts with the first request a worker serves, so CLI
+    commands and forked-but-idle processes never run jobs on their own.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.tick = 30
+        self.lease_ttl = timedelta(seconds=600)
+        self.retention = timedelta(days=30)
+        self.holder = f'{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}'
+        self._jobs = {}
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SCHEDULER_ENABLED', True)
+        self.tick = app.config.get('SCHEDULER_TICK', 30)
+        self.lease_ttl = timedelta(seconds=app.config.get('SCHEDULER_LEASE_TTL', 600))
+        self.retention = timedelta(days=app.config.get('SCHEDULER_RUN_RETENTION_DAYS', 30))
+        self._logger = app.logger
+        app.extensions['scheduler'] = self
+        if self.enabled:
+            app.before_request(lambda: self.start(app))
+
+    def register(self, name, fn, interval):
+        """Run fn() every interval seconds; fn returns the number of rows it changed"""
+        self._jobs[name] = Job(name, fn, timedelta(seconds=interval))
+
+    @property
+    def jobs(self):
+        return dict(self._jobs)
+
+    def start(self, app):
+        # A worker forked from a process that already started gets its own loop
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.holder = f'{socket.gethostname()}:{self._pid}:{secrets.token_hex(4)}'
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run_loop, args=(app,), name='scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self, name, force=False, **kwargs):
+        """Run one job now if this process can take its lease; returns the JobRun or None
+
+        force skips the interval check but still waits for a running copy
+        elsewhere to finish (or its lease to expire). Exceptions are
+        recorded on the run rather than raised.
+        """
+        from app.extensions import db
+
+        job = self._jobs[name]
+        if not self._acquire(job, force):
+            metrics.incr('scheduler.skipped')
+            return None
+
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        rows, error = 0, None
+        try:
+            rows = job.fn(**kwargs) or 0
+        except Exception as e:
+            db.session.rollback()
+            error = f'{type(e).__name__}: {e}'
+            metrics.incr('scheduler.errors')
+            self._logger.exception('Scheduled job %s failed', name)
+        finally:
+            duration = time.perf_counter() - started
+            self._release(job)
+
+        metrics.observe(f'scheduler.{name}', duration)
+        metrics.incr(f'scheduler.{name}.rows', rows)
+        return self._record(name, started_at, duration, rows, error)
+
+    def _run_loop(self, app):
+        from app.extensions import db
+
+        # Jitter keeps workers that started together from polling in lockstep
+        while not self._stopping.wait(self.tick * random.uniform(0.8, 1.2)):
+            with app.app_context():
+                for name in list(self._jobs):
+                    try:
+                        self.run(name)
+                    except Exception:
+                        metrics.incr('scheduler.errors')
+                        app.logger.exception('Scheduler could not run %s', name)
+                    finally:
+                        db.session.remove()
+
+    def _acquire(self, job, force):
+        from app.extensions import db
+        from app.models import SchedulerLease
+
+        leases = SchedulerLease.__table__
+        now = datetime.utcnow()
+        conditions = [leases.c.name == job.name, or_(leases.c.expires_at.is_(None), leases.c.expires_at < now)]
+        if not force:
+            conditions.append(or_(leases.c.last_run_at.is_(None), leases.c.last_run_at <= now - job.interval))
+
+        with db.engine.begin() as connection:
+            self._ensure_lease(connection, leases, job.name)
+            result = connection.execute(
+                update(leases).where(*conditions).values(holder=self.holder, expires_at=now + self.lease_ttl, last_run_at=now)
+            )
+        return result.rowcount == 1
+
+    def _ensure_lease(self, connection, leases, name):
+        dialect_insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(connection.dialect.name)
+        if dialect_insert is not None:
+            connection.execute(dialect_insert(leases).values(name=name).on_conflict_do_nothing(index_elements=['name']))
+            return
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(leases).values(name=name))
+        except IntegrityError:
+            pass
+
+    def _release(self, job):
+        from app.extensions import db
+        from app.models import SchedulerLease
+
+        leases = SchedulerLease.__table__
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    update(leases).where(leases.c.name == job.name, leases.c.holder == self.holder).values(expires_at=None)
+                )
+        except Exception:
+            # The lease lapses on its own after SCHEDULER_LEASE_TTL
+            self._logger.exception('Could not release the %s lease', job.name)
+
+    def _record(self, name, started_at, duration, rows, error):
+        from app.extensions import db
+        from app.models import JobRun
+
+        run = JobRun(
+            name=name,
+            holder=self.holder,
+            started_at=started_at,
+            duration_ms=duration * 1000,
+            rows=rows,
+            error=error
+        )
+        db.session.add(run)
+        db.session.execute(
+            delete(JobRun).where(JobRun.name == name, JobRun.started_at < started_at - self.retention)
+        )
+        db.session.commit()
+        return run
+
+    def recent_runs(self, name=None, limit=50):
+        from app.models import JobRun
+
+        query = JobRun.query.order_by(JobRun.started_at.desc(), JobRun.id.desc())
+        if name:
+            query = query.filter_by(name=name)
+        return query.limit(limit).all()
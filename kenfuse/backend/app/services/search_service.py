@@ -0,0 +1,196 @@
+import re
+
+from sqlalchemy import event, inspect, or_, text
+
+from app.extensions import db
+from app.models import Memorial, MemorialVisibility
+
+# Columns that feed the index; other updates leave it alone
+INDEXED_COLUMNS = ('deceased_name', 'location', 'biography', 'obituary')
+
+MAX_TERMS = 8
+
+# Postgres: one tsvector per memorial, names weighted above places above text
+POSTGRES_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS memorial_search (
+        memorial_id {id_type} PRIMARY KEY REFERENCES memorials (id) ON DELETE CASCADE,
+        document TSVECTOR NOT NULL
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS ix_memorial_search_document ON memorial_search USING GIN (document)'
+)
+
+POSTGRES_DOCUMENT = """
+    setweight(to_tsvector('simple', coalesce(deceased_name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(location, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(biography, '') || ' ' || coalesce(obituary, '')), 'C')
+"""
+
+POSTGRES_UPSERT = f"""
+    INSERT INTO memorial_search (memorial_id, document)
+    SELECT id, {POSTGRES_DOCUMENT} FROM memorials WHERE id = :id
+    ON CONFLICT (memorial_id) DO UPDATE SET document = excluded.document
+"""
+
+POSTGRES_SEARCH = """
+    SELECT memorials.* FROM memorial_search
+    JOIN memorials ON memorials.id = memorial_search.memorial_id
+    WHERE memorial_search.document @@ to_tsquery('simple', :query) AND {visibility}
+    ORDER BY ts_rank(memorial_search.document, to_tsquery('simple', :query)) DESC, memorials.created_at DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+# SQLite: FTS5 keyed on the memorials rowid, with prefix indexes for name typeahead
+SQLITE_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS memorial_search USING fts5(
+        deceased_name, location, body,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+)
+
+SQLITE_SELECT = """
+    SELECT rowid, deceased_name, coalesce(location, ''), coalesce(biography, '') || ' ' || coalesce(obituary, '')
+    FROM memorials
+"""
+
+SQLITE_SEARCH = """
+    SELECT memorials.* FROM memorial_search
+    JOIN memorials ON memorials.rowid = memorial_search.rowid
+    WHERE memorial_search MATCH :query AND {visibility}
+    ORDER BY bm25(memorial_search, 10.0, 5.0, 1.0), memorials.created_at DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+_listeners_registered = False
+
+def _dialect(connection):
+    name = connection.dialect.name
+    return name if name in ('postgresql', 'sqlite') else None
+
+def ensure_search_index(connection):
+    """Create the search table for this dialect if it is missing"""
+    dialect = _dialect(connection)
+    if dialect is None:
+        return
+    # Match memorials.id, which is VARCHAR(36) or a native uuid
+    id_type = Memorial.__table__.c.id.type.compile(dialect=connection.dialect)
+    for statement in POSTGRES_DDL if dialect == 'postgresql' else SQLITE_DDL:
+        connection.execute(text(statement.replace('{id_type}', id_type)))
+
+def _remove(connection, memorial_id):
+    dialect = _dialect(connection)
+    if dialect == 'postgresql':
+        connection.execute(text('DELETE FROM memorial_search WHERE memorial_id = :id'), {'id': memorial_id})
+    elif dialect == 'sqlite':
+        connection.execute(
+            text('DELETE FROM memorial_search WHERE rowid = (SELECT rowid FROM memorials WHERE id = :id)'),
+            {'id': memorial_id}
+        )
+
+def _index(connection, memorial_id):
+    dialect = _dialect(connection)
+    if dialect == 'postgresql':
+        connection.execute(text(POSTGRES_UPSERT), {'id': memorial_id})
+    elif dialect == 'sqlite':
+        _remove(connection, memorial_id)
+        connection.execute(
+            text(f'INSERT INTO memorial_search (rowid, deceased_name, location, body) {SQLITE_SELECT} WHERE id = :id'),
+            {'id': memorial_id}
+        )
+
+def reindex(connection):
+    """Rebuild the whole index from the memorials table"""
+    dialect = _dialect(connection)
+    ensure_search_index(connection)
+    if dialect == 'postgresql':
+        connection.execute(text('TRUNCATE memorial_search'))
+        connection.execute(text(f'INSERT INTO memorial_search (memorial_id, document) SELECT id, {POSTGRES_DOCUMENT} FROM memorials'))
+    elif dialect == 'sqlite':
+        connection.execute(text('DELETE FROM memorial_search'))
+        connection.execute(text(f'INSERT INTO memorial_search (rowid, deceased_name, location, body) {SQLITE_SELECT}'))
+    return connection.execute(text('SELECT count(*) FROM memorials')).scalar()
+
+def _after_insert(mapper, connection, target):
+    _index(connection, target.id)
+
+def _after_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[column].history.has_changes() for column in INDEXED_COLUMNS):
+        _index(connection, target.id)
+
+def _before_delete(mapper, connection, target):
+    # Before, so the SQLite rowid can still be looked up
+    _remove(connection, target.id)
+
+def _create_index(metadata, connection, **kw):
+    ensure_search_index(connection)
+
+def _drop_index(metadata, connection, **kw):
+    if _dialect(connection):
+        connection.execute(text('DROP TABLE IF EXISTS memorial_search'))
+
+def register_search_listeners():
+    """Keep memorial_search in step with memorial writes, inside the same flush"""
+    global _listeners_registered
+    if _listeners_registered:
+        return
+
+    event.listen(db.metadata, 'after_create', _create_index)
+    event.listen(db.metadata, 'before_drop', _drop_index)
+    event.listen(Memorial, 'after_insert', _after_insert)
+    event.listen(Memorial, 'after_update', _after_update)
+    event.listen(Memorial, 'before_delete', _before_delete)
+    _listeners_registered = True
+
+def _terms(query):
+    # Word characters only, so user input never reaches the query syntax
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+def search_memorials(query, user_id=None, limit=20, offset=0):
+    """Memorials matching every term (last-name prefixes included), best match first
+
+    Anonymous callers see public memorials; signed-in callers also see
+    family-only ones and their own private memorials.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    # Enum columns store member names
+    params = {'limit': limit, 'offset': offset, 'public': MemorialVisibility.PUBLIC.name}
+    if user_id:
+        params.update(family_only=MemorialVisibility.FAMILY_ONLY.name, user_id=user_id)
+        visibility = '(memorials.visibility IN (:public, :family_only) OR memorials.user_id = :user_id)'
+    else:
+        visibility = 'memorials.visibility = :public'
+
+    dialect = _dialect(db.session.connection())
+    if dialect == 'postgresql':
+        params['query'] = ' & '.join(f'{term}:*' for term in terms)
+        statement = POSTGRES_SEARCH.format(visibility=visibility)
+    elif dialect == 'sqlite':
+        params['query'] = ' '.join(f'"{term}"*' for term in terms)
+        statement = SQLITE_SEARCH.format(visibility=visibility)
+    else:
+        return _search_fallback(terms, user_id, limit, offset)
+
+    return Memorial.query.from_statement(text(statement).bindparams(**params)).all()
+
+def _search_fallback(terms, user_id, limit, offset):
+    # Unindexed scan for databases without a full-text backend
+    query = Memorial.query
+    for term in terms:
+        pattern = f'%{term}%'
+        query = query.filter(or_(*(getattr(Memorial, column).ilike(pattern) for column in INDEXED_COLUMNS)))
+    if user_id:
+        query = query.filter(or_(
+            Memorial.visibility.in_([MemorialVisibility.PUBLIC, MemorialVisibility.FAMILY_ONLY]),
+            Memorial.user_id == user_id
+        ))
+    else:
+        query = query.filter(Memorial.visibility == MemorialVisibility.PUBLIC)
+    return query.order_by(Memorial.created_at.desc()).limit(limit).offset(offset).all()
@@ -0,0 +1,315 @@
+import enum
+import random
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import event, func, inspect, update, insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+from app.models import (
+    User, Fundraiser, Memorial, VendorProfile, Donation,
+    StatCounter, DailyDonationStat, FundraiserHourlyStat, FundraiserDailyStat, FundraiserDonorStat
+)
+
+# Model -> (counter prefix, attributes counted by value)
+TRACKED_MODELS = {
+    User: ('users', ['role', 'subscription_plan']),
+    Fundraiser: ('fundraisers', ['status']),
+    Memorial: ('memorials', ['visibility']),
+    VendorProfile: ('vendors', ['status'])
+}
+
+# Model -> counter bumped on every write; list endpoints use it as an ETag source
+WATERMARKED_MODELS = {
+    Memorial: 'watermark.memorials',
+    Fundraiser: 'watermark.fundraisers'
+}
+
+# Counters every write of a kind bumps (donations.count, users.total,
+# watermarks) are split over this many rows, one picked at random per bump,
+# so concurrent transactions rarely wait on the same row lock
+COUNTER_SHARDS = 16
+
+_listeners_registered = False
+
+def _label(value):
+    return value.value if isinstance(value, enum.Enum) else str(value)
+
+def upsert_increment(connection, table, keys, increments, values=None):
+    """Atomically add increments to the row identified by keys, creating it if needed
+
+    values are plain columns written on insert and overwritten on update.
+    """
+    values = values or {}
+    dialect_insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(connection.dialect.name)
+
+    if dialect_insert is not None:
+        stmt = dialect_insert(table).values(**keys, **increments, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={
+                **{column: table.c[column] + stmt.excluded[column] for column in increments},
+                **{column: stmt.excluded[column] for column in values}
+            }
+        )
+        connection.execute(stmt)
+        return
+
+    conditions = [table.c[column] == value for column, value in keys.items()]
+    result = connection.execute(
+        update(table).where(*conditions).values(
+            {column: table.c[column] + value for column, value in increments.items()}, **values
+        )
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(**keys, **increments, **values))
+
+def _shard():
+    return random.randrange(COUNTER_SHARDS)
+
+def bump(connection, name, delta=1):
+    upsert_increment(connection, StatCounter.__table__, {'name': name, 'shard': _shard()}, {'value': delta})
+
+def bump_donations(connection, day, payment_method, count, amount):
+    bump(connection, 'donations.count', count)
+    bump(connection, 'donations.amount', amount)
+    upsert_increment(
+        connection,
+        DailyDonationStat.__table__,
+        {'day': day, 'payment_method': payment_method, 'shard': _shard()},
+        {'count': count, 'amount': amount}
+    )
+
+def donor_key(donation):
+    """Groups a donor's gifts: their account when signed in, else their phone number"""
+    return f'user:{donation.donor_id}' if donation.donor_id else f'phone:{donation.donor_phone}'
+
+def bump_fundraiser_donations(connection, donation, created_at, sign):
+    """Add (sign=1) or remove (sign=-1) one donation from its fundraiser's rollups"""
+    increments = {'count': sign, 'amount': sign * donation.amount}
+    hour = created_at.replace(minute=0, second=0, microsecond=0)
+    upsert_increment(
+        connection,
+        FundraiserHourlyStat.__table__,
+        {'fundraiser_id': donation.fundraiser_id, 'hour': hour, 'payment_method': donation.payment_method},
+        increments
+    )
+    upsert_increment(
+        connection,
+        FundraiserDailyStat.__table__,
+        {'fundraiser_id': donation.fundraiser_id, 'day': created_at.date(), 'payment_method': donation.payment_method},
+        increments
+    )
+    if not donation.is_anonymous:
+        upsert_increment(
+            connection,
+            FundraiserDonorStat.__table__,
+            {'fundraiser_id': donation.fundraiser_id, 'donor_key': donor_key(donation)},
+            increments,
+            values={'donor_name': donation.donor_name}
+        )
+
+def _count_row(connection, target, sign):
+    prefix, attributes = TRACKED_MODELS[type(target)]
+    bump(connection, f'{prefix}.total', sign)
+    for attribute in attributes:
+        value = getattr(target, attribute)
+        if value is not None:
+            bump(connection, f'{prefix}.{attribute}.{_label(value)}', sign)
+
+def _after_insert(mapper, connection, target):
+    _count_row(connection, target, 1)
+
+def _after_delete(mapper, connection, target):
+    _count_row(connection, target, -1)
+
+def _after_update(mapper, connection, target):
+    prefix, attributes = TRACKED_MODELS[type(target)]
+    state = inspect(target)
+    for attribute in attributes:
+        history = state.attrs[attribute].history
+        if not history.has_changes():
+            continue
+        for old in history.deleted:
+            if old is not None:
+                bump(connection, f'{prefix}.{attribute}.{_label(old)}', -1)
+        for new in history.added:
+            if new is not None:
+                bump(connection, f'{prefix}.{attribute}.{_label(new)}', 1)
+
+def _bump_watermark(mapper, connection, target):
+    bump(connection, WATERMARKED_MODELS[type(target)])
+
+def _donation_inserted(mapper, connection, target):
+    created_at = target.created_at or datetime.utcnow()
+    bump_donations(connection, created_at.date(), target.payment_method, 1, target.amount)
+    bump_fundraiser_donations(connection, target, created_at, 1)
+
+def _donation_deleted(mapper, connection, target):
+    created_at = target.created_at or datetime.utcnow()
+    bump_donations(connection, created_at.date(), target.payment_method, -1, -target.amount)
+    bump_fundraiser_donations(connection, target, created_at, -1)
+
+def _load_old_value(target, value, oldvalue, initiator):
+    return value
+
+def register_stats_listeners():
+    """Keep dashboard counters current inside the same flush as each write"""
+    global _listeners_registered
+    if _listeners_registered:
+        return
+
+    for model, (_, attributes) in TRACKED_MODELS.items():
+        # Load the previous value on set so after_update sees what to decrement
+        for attribute in attributes:
+            event.listen(getattr(model, attribute), 'set', _load_old_value, active_history=True, retval=True)
+        event.listen(model, 'after_insert', _after_insert)
+        event.listen(model, 'after_update', _after_update)
+        event.listen(model, 'after_delete', _after_delete)
+    for model in WATERMARKED_MODELS:
+        for event_name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, event_name, _bump_watermark)
+    event.listen(Donation, 'after_insert', _donation_inserted)
+    event.listen(Donation, 'after_delete', _donation_deleted)
+    _listeners_registered = True
+
+def get_dashboard_stats(days=30):
+    """Dashboard payload from the rollup tables; cost is independent of table sizes"""
+    # Start every known bucket at zero so the shape is stable
+    stats = {}
+    for model, (prefix, attributes) in TRACKED_MODELS.items():
+        section = stats[prefix] = {'total': 0}
+        for attribute in attributes:
+            enum_class = getattr(model, attribute).type.enum_class
+            section[attribute] = {member.value: 0 for member in enum_class}
+
+    counters = db.session.query(StatCounter.name, func.sum(StatCounter.value)) \
+        .filter(~StatCounter.name.like('watermark.%')).group_by(StatCounter.name)
+    for name, value in counters:
+        parts = name.split('.')
+        node = stats
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = int(value) if parts[-1] != 'amount' else round(value, 2)
+
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    daily = db.session.query(
+        DailyDonationStat.day, DailyDonationStat.payment_method,
+        func.sum(DailyDonationStat.count), func.sum(DailyDonationStat.amount)
+    ).filter(DailyDonationStat.day >= since) \
+        .group_by(DailyDonationStat.day, DailyDonationStat.payment_method).order_by(DailyDonationStat.day).all()
+
+    donations = stats.setdefault('donations', {'count': 0, 'amount': 0.0})
+    donations['by_day'] = [
+        {'day': _as_date(day).isoformat(), 'payment_method': method, 'count': count, 'amount': amount}
+        for day, method, count, amount in daily
+    ]
+
+    by_method = {}
+    for _, payment_method, count, amount in daily:
+        method = by_method.setdefault(payment_method, {'count': 0, 'amount': 0.0})
+        method['count'] += count
+        method['amount'] = round(method['amount'] + amount, 2)
+    donations['by_method'] = by_method
+
+    stats['active_fundraisers'] = stats.get('fundraisers', {}).get('status', {}).get('active', 0)
+    return stats
+
+def counter(name):
+    """Current value of a counter, summed over its shards"""
+    return db.session.query(func.sum(StatCounter.value)).filter_by(name=name).scalar() or 0
+
+def watermark(name):
+    """Current value of a write watermark, read without loading any rows"""
+    return counter(name)
+
+def _as_date(value):
+    # SQLite returns date() as a string
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+def reconcile_dashboard_stats():
+    """Recompute every counter from the base tables and replace the rollups
+
+    Corrects any drift from bulk updates or manual SQL. This scans the
+    base tables, so run it from the CLI or scheduler, not per request.
+    """
+    counters = {}
+    for model, (prefix, attributes) in TRACKED_MODELS.items():
+        counters[f'{prefix}.total'] = db.session.query(func.count()).select_from(model).scalar()
+        for attribute in attributes:
+            column = getattr(model, attribute)
+            for value, count in db.session.query(column, func.count()).group_by(column):
+                if value is not None:
+                    counters[f'{prefix}.{attribute}.{_label(value)}'] = count
+
+    count, amount = db.session.query(func.count(Donation.id), func.coalesce(func.sum(Donation.amount), 0)).one()
+    counters['donations.count'] = count
+    counters['donations.amount'] = amount
+
+    day = func.date(Donation.created_at)
+    daily = db.session.query(day, Donation.payment_method, func.count(Donation.id), func.sum(Donation.amount)) \
+        .group_by(day, Donation.payment_method).all()
+
+    # Watermarks only ever move forward, so they survive a reconcile
+    StatCounter.query.filter(~StatCounter.name.like('watermark.%')).delete(synchronize_session=False)
+    DailyDonationStat.query.delete()
+    db.session.add_all(StatCounter(name=name, value=value) for name, value in counters.items())
+    db.session.add_all(
+        DailyDonationStat(day=_as_date(row_day), payment_method=method, count=row_count, amount=row_amount)
+        for row_day, method, row_count, row_amount in daily
+    )
+    db.session.commit()
+
+    return counters
+
+def rebuild_fundraiser_rollups(fundraiser_id):
+    """Recompute one fundraiser's hourly, daily and donor rollups from its donations
+
+    Reads the donations once through ix_donations_fundraiser_created_at
+    and replaces the rollup rows in the caller's transaction. Donations
+    committed while it runs may be missed; running it again corrects that.
+    Returns the number of donations read.
+    """
+    hourly, daily, donors = {}, {}, {}
+    donations = db.session.query(
+        Donation.created_at, Donation.payment_method, Donation.amount, Donation.is_anonymous,
+        Donation.donor_id, Donation.donor_phone, Donation.donor_name
+    ).filter(Donation.fundraiser_id == fundraiser_id).order_by(Donation.created_at).yield_per(1000)
+
+    read = 0
+    for donation in donations:
+        read += 1
+        created_at = donation.created_at or datetime.utcnow()
+        for buckets, key in (
+            (hourly, (created_at.replace(minute=0, second=0, microsecond=0), donation.payment_method)),
+            (daily, (created_at.date(), donation.payment_method))
+        ):
+            bucket = buckets.setdefault(key, [0, 0.0])
+            bucket[0] += 1
+            bucket[1] += donation.amount
+        if not donation.is_anonymous:
+            # Ordered by time, so the name from the latest gift wins
+            donor = donors.setdefault(donor_key(donation), [0, 0.0, None])
+            donor[0] += 1
+            donor[1] += donation.amount
+            donor[2] = donation.donor_name
+
+    for model in (FundraiserHourlyStat, FundraiserDailyStat, FundraiserDonorStat):
+        db.session.query(model).filter(model.fundraiser_id == fundraiser_id).delete(synchronize_session=False)
+    connection = db.session.connection()
+    if hourly:
+        connection.execute(insert(FundraiserHourlyStat.__table__), [
+            {'fundraiser_id': fundraiser_id, 'hour': hour, 'payment_method': method, 'count': count, 'amount': amount}
+            for (hour, method), (count, amount) in hourly.items()
+        ])
+    if daily:
+        connection.execute(insert(FundraiserDailyStat.__table__), [
+            {'fundraiser_id': fundraiser_id, 'day': day, 'payment_method': method, 'count': count, 'amount': amount}
+            for (day, method), (count, amount) in daily.items()
+        ])
+    if donors:
+        connection.execute(insert(FundraiserDonorStat.__table__), [
+            {'fundraiser_id': fundraiser_id, 'donor_key': key, 'donor_name': name, 'count': count, 'amount': amount}
+            for key, (count, amount, name) in donors.items()
+        ])
+    return read
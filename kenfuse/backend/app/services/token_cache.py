@@ -0,0 +1,189 @@
+import json
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from app.utils.metrics import metrics
+from app.utils.single_flight import SingleFlight
+
+Token = namedtuple('Token', 'value expires_at refresh_at')
+
+# Compare-and-delete so a slow fetcher never releases someone else's lock
+UNLOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class TokenCache:
+    """OAuth access tokens shared by every thread, and with Redis by every worker
+
+    A token is reused until refresh_at, a little before it expires. From
+    then on one caller fetches a replacement while everyone else keeps
+    using the current token, so requests never wait on the provider's
+    token endpoint unless the token has actually expired. When no valid
+    token exists, concurrent callers share a single fetch (per process,
+    and across processes through a short Redis lock).
+    """
+
+    def __init__(self, app=None):
+        self.redis = None
+        self.prefix = 'kenfuse:tokens:'
+        self.early_refresh = 300
+        self.lock_timeout = 10.0
+        self.flight = SingleFlight('token_cache.coalesced', timeout=15.0)
+        self._tokens = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        url = app.config.get('TOKEN_CACHE_URL', 'memory://')
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            import redis
+
+            self.redis = redis.Redis.from_url(url)
+            self._unlock = self.redis.register_script(UNLOCK_SCRIPT)
+        self.early_refresh = app.config.get('TOKEN_EARLY_REFRESH', 300)
+        self._logger = app.logger
+        app.extensions['token_cache'] = self
+
+    def get(self, name, fetch):
+        """A valid token for name; fetch() returns (token, expires_in seconds) when one is needed"""
+        now = time.time()
+        token = self._tokens.get(name)
+        if token is None or now >= token.refresh_at:
+            token = self._load_shared(name) or token
+            if token is not None:
+                with self._lock:
+                    self._tokens[name] = token
+
+        if token is not None and now < token.refresh_at:
+            metrics.incr('token_cache.hits')
+            return token.value
+
+        if token is not None and now < token.expires_at:
+            # Due for refresh but still valid: one caller refreshes, nobody waits
+            metrics.incr('token_cache.hits')
+            lock = self._try_lock(name)
+            if lock:
+                try:
+                    token = self._fetch(name, fetch)
+                except Exception:
+                    metrics.incr('token_cache.refresh_errors')
+                    self._logger.exception('Early refresh of the %s token failed; using the current one', name)
+                finally:
+                    self._release(name, lock)
+            return token.value
+
+        metrics.incr('token_cache.misses')
+        token, _ = self.flight.do(name, lambda: self._fetch_when_missing(name, fetch))
+        return token.value
+
+    def invalidate(self, name):
+        """Forget a token the provider rejected"""
+        with self._lock:
+            self._tokens.pop(name, None)
+        if self.redis is not None:
+            try:
+                self.redis.delete(self.prefix + name)
+            except Exception:
+                metrics.incr('token_cache.errors')
+                self._logger.exception('Token cache delete failed')
+
+    def _fetch_when_missing(self, name, fetch):
+        lock = self._try_lock(name)
+        if lock is False:
+            # Another worker is fetching; its token lands in Redis
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                token = self._load_shared(name)
+                if token is not None and time.time() < token.expires_at:
+                    with self._lock:
+                        self._tokens[name] = token
+                    metrics.incr('token_cache.lock_waits')
+                    return token
+        try:
+            return self._fetch(name, fetch)
+        finally:
+            if lock:
+                self._release(name, lock)
+
+    def _fetch(self, name, fetch):
+        started = time.perf_counter()
+        value, expires_in = fetch()
+        provider = name.split(':')[0]
+        metrics.incr(f'token_cache.{provider}.fetches')
+        metrics.observe(f'token_cache.{provider}.fetch', time.perf_counter() - started)
+
+        lifetime = float(expires_in)
+        now = time.time()
+        # Stop using a token slightly before the provider does, and start replacing it well before that
+        expires_at = now + lifetime - min(30, lifetime * 0.1)
+        token = Token(value, expires_at, expires_at - min(self.early_refresh, lifetime / 2))
+        with self._lock:
+            self._tokens[name] = token
+        if self.redis is not None:
+            try:
+                self.redis.set(self.prefix + name, json.dumps(token._asdict()), px=max(1, int((expires_at - now) * 1000)))
+            except Exception:
+                metrics.incr('token_cache.errors')
+                self._logger.exception('Token cache write failed')
+        return token
+
+    def _load_shared(self, name):
+        if self.redis is None:
+            return None
+        try:
+            data = self.redis.get(self.prefix + name)
+        except Exception:
+            metrics.incr('token_cache.errors')
+            self._logger.exception('Token cache read failed')
+            return None
+        return Token(**json.loads(data)) if data else None
+
+    def _try_lock(self, name):
+        """A truthy lock when this caller should fetch, False while another caller is"""
+        with self._lock:
+            if name in self._refreshing:
+                return False
+            self._refreshing.add(name)
+        if self.redis is None:
+            return True
+        token = uuid.uuid4().hex
+        try:
+            if self.redis.set(self.prefix + 'lock:' + name, token, nx=True, px=int(self.lock_timeout * 1000)):
+                return token
+        except Exception:
+            # Without Redis every worker fetches for itself
+            metrics.incr('token_cache.errors')
+            return True
+        with self._lock:
+            self._refreshing.discard(name)
+        return False
+
+    def _release(self, name, lock):
+        with self._lock:
+            self._refreshing.discard(name)
+        if isinstance(lock, str):
+            try:
+                self._unlock(keys=[self.prefix + 'lock:' + name], args=[lock])
+            except Exception:
+                metrics.incr('token_cache.errors')
+                self._logger.exception('Token cache unlock failed')
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return {
+                name: {
+                    'expires_in': round(token.expires_at - now, 1),
+                    'refresh_in': round(token.refresh_at - now, 1)
+                }
+                for name, token in self._tokens.items()
+            }
@@ -0,0 +1,310 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.utils import secure_filename
+
+from app.utils.metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+CHUNK_SIZE = 64 * 1024
+
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+VIDEO_TYPES = {
+    '.mp4': 'video/mp4',
+    '.m4v': 'video/x-m4v',
+    '.mov': 'video/quicktime',
+    '.webm': 'video/webm'
+}
+
+class InvalidUpload(Exception):
+    """Raised when an upload request is malformed or fails verification"""
+
+class UploadTooLarge(Exception):
+    """Raised when a file or chunk exceeds what the uploader is allowed"""
+
+class UploadOffsetMismatch(Exception):
+    """Raised when a chunk does not start where the upload left off"""
+
+    def __init__(self, offset):
+        super().__init__(f'Upload is at offset {offset}')
+        self.offset = offset
+
+class ResumableUploads:
+    """Chunked uploads appended to a part file on disk, resumable by offset
+
+    Each append streams the request body to the part file through one
+    CHUNK_SIZE buffer, so memory per upload stays constant whatever the
+    file size. The offset is only advanced after the bytes are fsynced;
+    a dropped connection keeps whatever arrived, and the client resumes
+    from the offset reported by HEAD. Completed files move into the blob
+    store by rename, so the part folder should share its filesystem.
+    """
+
+    def __init__(self, app=None):
+        self.folder = None
+        self.chunk_max_bytes = 8 * 1024 * 1024
+        self.ttl = timedelta(hours=24)
+        self._lock = threading.Lock()
+        self._appending = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.folder = app.config['UPLOAD_SESSION_FOLDER']
+        self.chunk_max_bytes = app.config.get('UPLOAD_CHUNK_MAX_BYTES', 8 * 1024 * 1024)
+        self.ttl = timedelta(seconds=app.config.get('UPLOAD_SESSION_TTL', 24 * 3600))
+        os.makedirs(self.folder, exist_ok=True)
+        app.extensions['resumable_uploads'] = self
+
+    def part_path(self, upload_id):
+        return os.path.join(self.folder, f'{upload_id}.part')
+
+    def create(self, user_id, memorial_id, filename, size, max_size, checksum=None, caption=None):
+        """Start a video upload of size bytes; returns the UploadSession
+
+        Raises InvalidUpload, or UploadTooLarge when size exceeds max_size.
+        """
+        from app.extensions import db
+        from app.models import UploadSession
+
+        filename = secure_filename(filename or '')
+        content_type = VIDEO_TYPES.get(os.path.splitext(filename)[1].lower())
+        if not content_type:
+            raise InvalidUpload('Only MP4, M4V, MOV and WebM videos are accepted')
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise InvalidUpload('size must be a positive number of bytes')
+        if size > max_size:
+            raise UploadTooLarge(f'Videos on your plan are limited to {max_size // (1024 * 1024)} MB')
+        if checksum is not None:
+            checksum = str(checksum).lower()
+            if not SHA256_PATTERN.match(checksum):
+                raise InvalidUpload('checksum must be a hex sha256 digest')
+
+        session = UploadSession(
+            user_id=user_id,
+            memorial_id=memorial_id,
+            filename=filename,
+            content_type=content_type,
+            caption=caption,
+            size=size,
+            checksum=checksum,
+            expires_at=datetime.utcnow() + self.ttl
+        )
+        db.session.add(session)
+        db.session.flush()
+        open(self.part_path(session.id), 'wb').close()
+        db.session.commit()
+
+        metrics.incr('uploads.started')
+        return session
+
+    def append(self, session, offset, stream, checksum=None):
+        """Write the chunk read from stream at offset; returns the new offset
+
+        checksum is an optional hex sha256 of the chunk. A chunk that fails
+        it is discarded whole; without one, a partial chunk from a dropped
+        connection is kept. Raises InvalidUpload, UploadTooLarge or
+        UploadOffsetMismatch.
+        """
+        from app.extensions import db
+
+        if session.is_complete:
+            raise InvalidUpload('Upload is already complete')
+
+        started = time.perf_counter()
+        with open(self.part_path(session.id), 'r+b') as part:
+            # One appender per upload, across worker processes on this host
+            if fcntl is not None:
+                try:
+                    fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise UploadOffsetMismatch(session.offset)
+
+            db.session.refresh(session)
+            if offset != session.offset:
+                raise UploadOffsetMismatch(session.offset)
+
+            # Bytes past the recorded offset were never acknowledged
+            part.seek(offset)
+            part.truncate()
+
+            limit = min(self.chunk_max_bytes, session.size - offset)
+            digest = hashlib.sha256() if checksum else None
+            received = 0
+            disconnected = None
+
+            with self._lock:
+                self._appending += 1
+                metrics.gauge('uploads.appending', self._appending)
+            try:
+                while True:
+                    try:
+                        chunk = stream.read(CHUNK_SIZE)
+                    except ClientDisconnected as e:
+                        disconnected = e
+                        break
+                    if not chunk:
+                        break
+                    received += len(chunk)
+                    if received > limit:
+                        part.truncate(offset)
+                        raise UploadTooLarge('Chunk is larger than allowed or than the remaining file')
+                    if digest is not None:
+                        digest.update(chunk)
+                    part.write(chunk)
+
+                if checksum and (disconnected or digest.hexdigest() != checksum.lower()):
+                    part.truncate(offset)
+                    if disconnected:
+                        raise disconnected
+                    raise InvalidUpload('Chunk checksum does not match')
+
+                part.flush()
+                os.fsync(part.fileno())
+            finally:
+                with self._lock:
+                    self._appending -= 1
+                    metrics.gauge('uploads.appending', self._appending)
+
+            session.offset = offset + received
+            session.expires_at = datetime.utcnow() + self.ttl
+            db.session.commit()
+
+        metrics.incr('uploads.bytes', received)
+        metrics.observe('uploads.append', time.perf_counter() - started)
+        if disconnected:
+            raise disconnected
+        return session.offset
+
+    def complete(self, session):
+        """Move a fully received upload into the blob store; returns the MemorialVideo
+
+        Completing twice, or from two requests at once, returns the same
+        video. The file's hash is saved on the session before the part
+        file moves, so a completion that failed after the move can be
+        retried. Raises InvalidUpload when bytes are missing or the
+        whole-file checksum does not match (the upload is discarded in
+        that case).
+        """
+        from app.extensions import db, blob_store
+        from app.models import MemorialVideo, UploadSession
+        from app.services.media_service import attach, blob_url, register_blob
+        from app.utils.ids import new_id
+
+        if session.is_complete:
+            return db.session.get(MemorialVideo, session.video_id)
+        if session.offset != session.size:
+            raise InvalidUpload(f'Upload is incomplete ({session.offset} of {session.size} bytes)')
+
+        started = time.perf_counter()
+        path = self.part_path(session.id)
+        blob_hash = self._hash_part(path)
+        if blob_hash is None:
+            # Moved by an earlier attempt or a concurrent completion
+            db.session.refresh(session)
+            if session.is_complete:
+                return db.session.get(MemorialVideo, session.video_id)
+            if not (session.checksum and blob_store.exists(session.checksum)):
+                raise InvalidUpload('Upload data is missing; start a new upload')
+            blob_hash = session.checksum
+        else:
+            if session.checksum and blob_hash != session.checksum:
+                self.cancel(session)
+                raise InvalidUpload('File checksum does not match; upload discarded')
+            session.checksum = blob_hash
+            db.session.commit()
+            try:
+                blob_store.put_file(path, blob_hash, session.content_type)
+            except FileNotFoundError:
+                # A concurrent completion moved it first
+                if not blob_store.exists(blob_hash):
+                    raise
+
+        # Only one completion sets video_id; a concurrent one waits on the
+        # row, matches nothing and returns the winner's video
+        uploads = UploadSession.__table__
+        video_id = new_id()
+        claimed = db.session.execute(
+            update(uploads).where(uploads.c.id == session.id, uploads.c.video_id.is_(None)).values(video_id=video_id)
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
+            db.session.refresh(session)
+            return db.session.get(MemorialVideo, session.video_id)
+
+        video = MemorialVideo(
+            id=video_id,
+            memorial_id=session.memorial_id,
+            video_url=blob_url(blob_hash, session.filename),
+            caption=session.caption,
+            uploaded_by=session.user_id
+        )
+        db.session.add(video)
+        db.session.flush()
+
+        connection = db.session.connection()
+        register_blob(connection, blob_hash, session.size, session.content_type)
+        attach(connection, 'memorial_video', video.id, 'video', [blob_hash], session.memorial_id)
+        db.session.commit()
+
+        metrics.incr('uploads.completed')
+        metrics.observe('uploads.complete', time.perf_counter() - started)
+        return video
+
+    def _hash_part(self, path):
+        """Hex sha256 of a part file, or None if it is gone"""
+        digest = hashlib.sha256()
+        try:
+            with open(path, 'rb') as part:
+                for chunk in iter(lambda: part.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+        except FileNotFoundError:
+            return None
+        return digest.hexdigest()
+
+    def cancel(self, session):
+        from app.extensions import db
+
+        self._remove_part(session.id)
+        db.session.delete(session)
+        db.session.commit()
+
+    def expire(self, now=None):
+        """Delete sessions past their expiry along with their part files; returns the count"""
+        from app.extensions import db
+        from app.models import UploadSession
+
+        expired = UploadSession.query.filter(UploadSession.expires_at < (now or datetime.utcnow())).all()
+        for session in expired:
+            self._remove_part(session.id)
+            db.session.delete(session)
+        db.session.commit()
+
+        metrics.incr('uploads.expired', len(expired))
+        return len(expired)
+
+    def _remove_part(self, upload_id):
+        try:
+            os.remove(self.part_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'appending': self._appending,
+                'buffer_bytes': self._appending * CHUNK_SIZE,
+                'chunk_max_bytes': self.chunk_max_bytes
+            }
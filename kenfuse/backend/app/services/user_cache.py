@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_request_context
+from werkzeug.local import LocalProxy
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.utils.metrics import metrics
+
+class UserCache:
+    """Identity cache for the JWT user lookup
+
+    Users are memoised once per request and kept across requests in a
+    bounded TTL/LRU map of column snapshots, so warm lookups attach a
+    detached copy to the session without a query. Entries are dropped
+    after any commit that modifies or deletes the user.
+    """
+
+    def __init__(self, app=None):
+        self.maxsize = 10000
+        self.ttl = 60
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._listening = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('USER_CACHE_SIZE', 10000)
+        self.ttl = app.config.get('USER_CACHE_TTL', 60)
+        app.extensions['user_cache'] = self
+        self._listen()
+
+    def get(self, user_id):
+        """Return the User for user_id, or None"""
+        if user_id is None:
+            return None
+        user_id = str(user_id)
+
+        memo = g.setdefault('_user_cache', {}) if has_request_context() else {}
+        if user_id in memo:
+            return memo[user_id]
+
+        from app.extensions import db
+        from app.models import User
+
+        snapshot = self._lookup(user_id)
+        if snapshot is not None:
+            metrics.incr('user_cache.hits')
+            user = User(**snapshot)
+            make_transient_to_detached(user)
+            user = db.session.merge(user, load=False)
+        else:
+            metrics.incr('user_cache.misses')
+            user = db.session.get(User, user_id)
+            if user is not None:
+                self.store(user)
+
+        memo[user_id] = user
+        return user
+
+    def lazy(self, user_id):
+        """Proxy that only looks the user up when first used
+
+        Routes authorised from token claims alone never touch the cache
+        or the database.
+        """
+        return LocalProxy(lambda: self.get(user_id))
+
+    def store(self, user):
+        snapshot = {attr.key: getattr(user, attr.key) for attr in inspect(type(user)).column_attrs}
+        with self._lock:
+            self._entries[str(user.id)] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(str(user.id))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                metrics.incr('user_cache.evictions')
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+        if has_request_context():
+            g.get('_user_cache', {}).pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _lookup(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, snapshot = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return snapshot
+
+    def _listen(self):
+        if self._listening:
+            return
+        from app.extensions import db
+
+        event.listen(db.session, 'after_flush', self._collect_changes)
+        event.listen(db.session, 'after_commit', self._apply_invalidations)
+        event.listen(db.session, 'after_rollback', self._discard_changes)
+        self._listening = True
+
+    def _collect_changes(self, session, flush_context):
+        from app.models import User
+
+        changed = session.info.setdefault('_user_cache_invalid', set())
+        for obj in list(session.dirty) + list(session.deleted):
+            if isinstance(obj, User) and obj.id is not None:
+                changed.add(str(obj.id))
+
+    def _apply_invalidations(self, session):
+        for user_id in session.info.pop('_user_cache_invalid', ()):
+            self.invalidate(user_id)
+
+    def _discard_changes(self, session):
+        session.info.pop('_user_cache_invalid', None)
@@ -0,0 +1,43 @@
+from datetime import datetime
+from functools import wraps
+
+from flask import jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt, get_jwt_identity
+
+def current_plan(claims=None):
+    """Subscription plan from token claims, treating an expired plan as free"""
+    claims = claims if claims is not None else get_jwt()
+    plan = claims.get('plan', 'free')
+    expiry = claims.get('plan_expiry')
+    if plan != 'free' and expiry and datetime.fromisoformat(expiry) < datetime.utcnow():
+        return 'free'
+    return plan
+
+def claims_required(roles=None, plans=None, message=None):
+    """Authorise from signed JWT claims alone, without loading the user
+
+    Tokens issued before the user's role or plan last changed are
+    rejected with 401 so the client refreshes them.
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            verify_jwt_in_request()
+            claims = get_jwt()
+
+            from app.extensions import claims_revocations
+            if 'cv' not in claims or claims_revocations.is_stale(get_jwt_identity(), claims['cv']):
+                return jsonify({
+                    'error': 'Token is out of date, please refresh',
+                    'code': 'claims_stale'
+                }), 401
+
+            if roles and claims.get('role') not in roles:
+                return jsonify({'error': message or 'Unauthorized'}), 403
+
+            if plans and current_plan(claims) not in plans:
+                return jsonify({'error': message or 'Your subscription plan does not allow this action'}), 403
+
+            return fn(*args, **kwargs)
+        return decorator
+    return wrapper
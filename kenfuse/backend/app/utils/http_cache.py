@@ -0,0 +1,57 @@
+import hashlib
+import json
+from datetime import timezone
+
+from flask import current_app, request
+
+from app.utils.metrics import metrics
+
+class Validators:
+    """ETag / Last-Modified for one response plus the Cache-Control policy to send
+
+    Build it from a cheap version lookup (an updated_at column, a list
+    watermark) so a matching conditional request is answered with 304
+    before any ORM objects are loaded or serialised.
+    """
+
+    def __init__(self, *version, last_modified=None, public=True, weak=False):
+        digest = hashlib.sha1(json.dumps(version, default=str).encode()).hexdigest()
+        self.etag = digest[:32]
+        self.last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0) if last_modified else None
+        self.public = public
+        self.weak = weak
+
+    def not_modified(self):
+        """A 304 response when the client's copy is current, else None"""
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+        if request.if_none_match:
+            matched = request.if_none_match.contains_weak(self.etag)
+        elif request.if_modified_since and self.last_modified:
+            matched = self.last_modified <= request.if_modified_since
+        else:
+            matched = False
+
+        if not matched:
+            metrics.incr('http_cache.misses')
+            return None
+
+        metrics.incr('http_cache.not_modified')
+        return self.apply(current_app.response_class(status=304))
+
+    def apply(self, response):
+        response.set_etag(self.etag, weak=self.weak)
+        if self.last_modified:
+            response.last_modified = self.last_modified
+
+        if self.public:
+            response.cache_control.public = True
+            response.cache_control.max_age = current_app.config.get('HTTP_CACHE_MAX_AGE', 0)
+            response.cache_control.must_revalidate = True
+        else:
+            # Private, family-only and owner-only content never goes to shared caches
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+
+        # Visibility decisions depend on the caller
+        response.vary.add('Authorization')
+        return response
@@ -0,0 +1,121 @@
+import secrets
+import threading
+import time
+import uuid
+
+from sqlalchemy import String, inspect, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.types import TypeDecorator
+
+CROCKFORD_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+def uuid7():
+    """Time-ordered UUID (RFC 9562 version 7), monotonic within this process
+
+    48 bits of Unix milliseconds, then a 12-bit counter seeded randomly
+    each millisecond (method 1 of the RFC), then 62 random bits. Ids
+    sort by creation time, so primary key inserts append to the right
+    edge of the B-tree instead of landing on random pages.
+    """
+    global _last_ms, _counter
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            _counter = secrets.randbits(11)  # Leaves room to count up within the millisecond
+        else:
+            # Same millisecond, or the clock stepped back: keep counting from the last id
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = secrets.randbits(11)
+        timestamp, counter = _last_ms, _counter
+
+    value = (timestamp << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | secrets.randbits(62)
+    return uuid.UUID(int=value)
+
+def new_id():
+    """Default for primary keys"""
+    return str(uuid7())
+
+def ulid():
+    """26-character Crockford base32 form of a uuid7; sorts by time as text"""
+    value = uuid7().int
+    return ''.join(CROCKFORD_ALPHABET[(value >> shift) & 0x1F] for shift in range(125, -1, -5))
+
+def transaction_id(prefix='TXN'):
+    return f'{prefix}{ulid()}'
+
+class GUID(TypeDecorator):
+    """UUID key column: VARCHAR(36) text, or a native 16-byte uuid on PostgreSQL
+
+    Values are always str in Python. Native storage is switched on with
+    NATIVE_UUIDS once the columns have been converted (flask ids
+    convert-to-uuid); it must be set before the first query.
+    """
+
+    impl = String(36)
+    cache_ok = True
+
+    native = False
+
+    def load_dialect_impl(self, dialect):
+        if GUID.native and dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        return dialect.type_descriptor(String(36))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not (GUID.native and dialect.name == 'postgresql'):
+            return value
+        try:
+            return str(uuid.UUID(str(value)))
+        except ValueError:
+            # A malformed id from a URL matches nothing rather than raising
+            return None
+
+def convert_to_native_uuids(connection, metadata, extra_columns=()):
+    """Change every GUID column from VARCHAR(36) to uuid in place (PostgreSQL)
+
+    Existing uuid4 values convert as they are. Foreign keys are dropped
+    and recreated around the change; run it in one transaction so a
+    failure leaves the schema untouched. Returns the columns converted.
+    """
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+    targets = [
+        (table.name, column.name)
+        for table in metadata.sorted_tables if table.name in existing
+        for column in table.columns if isinstance(column.type, GUID)
+    ]
+    targets += [(table, column) for table, column in extra_columns if table in existing]
+
+    pending = []
+    for table_name, column_name in targets:
+        column_type = next(c['type'] for c in inspector.get_columns(table_name) if c['name'] == column_name)
+        if not isinstance(column_type, postgresql.UUID):
+            pending.append((table_name, column_name))
+    if not pending:
+        return []
+
+    foreign_keys = [(table_name, fk) for table_name in existing for fk in inspector.get_foreign_keys(table_name)]
+    for table_name, fk in foreign_keys:
+        connection.execute(text(f'ALTER TABLE "{table_name}" DROP CONSTRAINT "{fk["name"]}"'))
+
+    for table_name, column_name in pending:
+        connection.execute(text(
+            f'ALTER TABLE "{table_name}" ALTER COLUMN "{column_name}" TYPE uuid USING "{column_name}"::uuid'
+        ))
+
+    for table_name, fk in foreign_keys:
+        columns = ', '.join(f'"{name}"' for name in fk['constrained_columns'])
+        referred = ', '.join(f'"{name}"' for name in fk['referred_columns'])
+        ondelete = fk.get('options', {}).get('ondelete')
+        connection.execute(text(
+            f'ALTER TABLE "{table_name}" ADD CONSTRAINT "{fk["name"]}" FOREIGN KEY ({columns}) '
+            f'REFERENCES "{fk["referred_table"]}" ({referred})' + (f' ON DELETE {ondelete}' if ondelete else '')
+        ))
+    return pending
@@ -0,0 +1,10 @@
+def srcset(variants):
+    """srcset strings per format for a variants mapping, or None before processing"""
+    if not variants:
+        return None
+    # Variants of small originals can share a width; list each file once
+    ordered = sorted({variant['width']: variant for variant in variants.values()}.values(), key=lambda variant: variant['width'])
+    return {
+        extension: ', '.join(f"{variant[extension]} {variant['width']}w" for variant in ordered)
+        for extension in ('webp', 'jpeg')
+    }
@@ -0,0 +1,114 @@
+import gzip
+import os
+import shutil
+
+from flask import current_app, request, send_file
+
+from app.utils.metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # .br siblings are skipped without the Brotli package
+    brotli = None
+
+# Types worth compressing; JPEG, WebP and video are already compressed
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/pdf', 'application/xml', 'image/svg+xml'
+}
+
+# Content-Encoding -> sibling suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# A sibling must save at least this fraction to be kept
+MIN_SAVING = 0.1
+
+def is_compressible(mimetype):
+    return bool(mimetype) and (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES)
+
+def precompress(path):
+    """Write .gz (and .br when Brotli is installed) siblings next to path
+
+    Done once when a file is stored, at maximum compression, so serving
+    it never compresses on the fly. Siblings that do not save at least
+    MIN_SAVING are not kept. Returns the suffixes written.
+    """
+    size = os.path.getsize(path)
+    written = []
+
+    gz_path = path + '.gz'
+    with open(path, 'rb') as source, gzip.GzipFile(gz_path, 'wb', compresslevel=9, mtime=0) as target:
+        shutil.copyfileobj(source, target)
+    written.append('.gz')
+
+    if brotli is not None:
+        with open(path, 'rb') as source:
+            data = brotli.compress(source.read(), quality=11)
+        with open(path + '.br', 'wb') as target:
+            target.write(data)
+        written.append('.br')
+
+    kept = []
+    for suffix in written:
+        if os.path.getsize(path + suffix) > size * (1 - MIN_SAVING):
+            os.remove(path + suffix)
+        else:
+            kept.append(suffix)
+    metrics.incr('media.precompressed', len(kept))
+    return kept
+
+def remove_siblings(path):
+    for _, suffix in ENCODINGS:
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+def send_media_file(path, mimetype, etag, max_age, public=True, immutable=False, accel_path=None):
+    """Serve a file with strong validators, Range support and precompressed siblings
+
+    With MEDIA_OFFLOAD set, the body is left to the front server through
+    X-Sendfile (the absolute path) or X-Accel-Redirect (accel_path, an
+    internal nginx location), which then also answers Range requests.
+    Conditional requests are still answered here so a 304 costs no I/O.
+    """
+    encoding = None
+    if is_compressible(mimetype):
+        for candidate, suffix in ENCODINGS:
+            if request.accept_encodings[candidate] and os.path.exists(path + suffix):
+                encoding = candidate
+                path += suffix
+                etag = f'{etag}-{candidate}'  # Each representation gets its own strong ETag
+                if accel_path:
+                    accel_path += suffix
+                break
+
+    offload = current_app.config.get('MEDIA_OFFLOAD')
+    if offload and (offload != 'x-accel-redirect' or accel_path):
+        response = current_app.response_class(mimetype=mimetype)
+        response.set_etag(etag)
+        if request.if_none_match.contains(etag):
+            response.status_code = 304
+        elif offload == 'x-accel-redirect':
+            response.headers['X-Accel-Redirect'] = accel_path
+        else:
+            response.headers['X-Sendfile'] = os.path.abspath(path)
+        metrics.incr('media.offloaded')
+    else:
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=etag, max_age=max_age)
+
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        metrics.incr(f'media.served_{encoding}')
+    if is_compressible(mimetype):
+        response.vary.add('Accept-Encoding')
+
+    # send_file marks anything with a max_age public; set the policy explicitly
+    response.cache_control.max_age = max_age
+    response.cache_control.no_cache = True if not max_age else None
+    response.cache_control.public = True if public else None
+    response.cache_control.private = None if public else True
+    if not public:
+        response.vary.add('Authorization')
+    if immutable:
+        response.cache_control.immutable = True
+    return response
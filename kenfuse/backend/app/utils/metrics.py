@@ -0,0 +1,72 @@
+import threading
+import time
+from contextlib import contextmanager
+
+class MetricsRegistry:
+    """Thread-safe, process-local counters, gauges and timings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, seconds):
+        """Record one duration sample in seconds"""
+        with self._lock:
+            stat = self._timings.get(name)
+            if stat is None:
+                stat = self._timings[name] = {'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0}
+            stat['count'] += 1
+            stat['total'] += seconds
+            stat['last'] = seconds
+            if seconds > stat['max']:
+                stat['max'] = seconds
+
+    @contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self, prefix=None):
+        with self._lock:
+            timings = {
+                name: {
+                    'count': stat['count'],
+                    'avg_ms': round(stat['total'] / stat['count'] * 1000, 3) if stat['count'] else 0.0,
+                    'max_ms': round(stat['max'] * 1000, 3),
+                    'last_ms': round(stat['last'] * 1000, 3)
+                }
+                for name, stat in self._timings.items()
+            }
+            data = {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'timings': timings
+            }
+
+        if prefix:
+            data = {
+                kind: {name: value for name, value in values.items() if name.startswith(prefix)}
+                for kind, values in data.items()
+            }
+        return data
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+
+metrics = MetricsRegistry()
@@ -0,0 +1,41 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+def encode_cursor(created_at, row_id):
+    """Opaque cursor for a (created_at, id) position"""
+    payload = json.dumps([created_at.isoformat() if created_at else None, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), str(row_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def keyset_page(query, model, cursor=None, limit=20):
+    """Newest-first page ordered on (created_at, id) without OFFSET or COUNT
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    A limit below 1 is treated as 1.
+    """
+    limit = max(limit, 1)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id)
+        ))
+
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
@@ -0,0 +1,111 @@
+"""Concurrent donations against one fundraiser, checking that no update is lost
+
+Runs the real /api/fundraisers/<id>/donate handler from many threads and
+then compares the fundraiser's current_amount with the sum of donations
+written. Uses a throwaway SQLite file unless --database-url points at a
+scratch PostgreSQL database (its tables are created and dropped).
+
+    python benchmarks/donation_concurrency.py --threads 32 --donations 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.config import config, TestingConfig
+from app.extensions import db
+from app.models import User, Fundraiser, FundraiserStatus, Donation
+
+def build_app(database_url):
+    config['benchmark'] = type('BenchmarkConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SQLALCHEMY_ENGINE_OPTIONS': {'pool_size': 64, 'max_overflow': 0} if database_url.startswith('postgresql') else {
+            'connect_args': {'timeout': 30, 'check_same_thread': False}
+        },
+        'RATELIMIT_ENABLED': False
+    })
+    return create_app('benchmark')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='Scratch database (default: temporary SQLite file)')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--donations', type=int, default=2000)
+    parser.add_argument('--amount', type=float, default=10.0)
+    args = parser.parse_args()
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'donations.db')
+    app = build_app(database_url)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        if db.engine.dialect.name == 'sqlite':
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql('PRAGMA journal_mode=WAL')
+        owner = User(email='owner@example.com', phone='+254700000001', first_name='Bench', last_name='Owner')
+        owner.password = 'benchmark'
+        db.session.add(owner)
+        db.session.flush()
+        # The target equals the full run, so the last donation must complete it
+        fundraiser = Fundraiser(
+            user_id=owner.id,
+            title='Benchmark',
+            description='Concurrent donations',
+            target_amount=args.donations * args.amount,
+            end_date=datetime.utcnow() + timedelta(days=30)
+        )
+        db.session.add(fundraiser)
+        db.session.commit()
+        fundraiser_id = fundraiser.id
+
+    payload = {'amount': args.amount, 'donor_name': 'Donor', 'donor_phone': '+254700000002', 'payment_method': 'mpesa'}
+    remaining = iter(range(args.donations))
+    lock = threading.Lock()
+    statuses = {}
+
+    def donor():
+        client = app.test_client()
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            status = client.post(f'/api/fundraisers/{fundraiser_id}/donate', json=payload).status_code
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=donor) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        fundraiser = db.session.get(Fundraiser, fundraiser_id)
+        donated = db.session.query(db.func.coalesce(db.func.sum(Donation.amount), 0)).filter_by(fundraiser_id=fundraiser_id).scalar()
+        accepted = Donation.query.filter_by(fundraiser_id=fundraiser_id).count()
+        lost = donated - fundraiser.current_amount
+        print(f'database        {db.engine.dialect.name}')
+        print(f'requests        {args.donations} from {args.threads} threads in {elapsed:.2f}s '
+              f'({args.donations / elapsed:.0f} donations/s)')
+        print(f'responses       {dict(sorted(statuses.items()))}')
+        print(f'donations       {accepted} rows, {donated:.2f} total')
+        print(f'current_amount  {fundraiser.current_amount:.2f}')
+        print(f'status          {fundraiser.status.value}')
+        print(f'lost updates    {lost:.2f}')
+        completed_ok = fundraiser.status == FundraiserStatus.COMPLETED if accepted == args.donations else True
+        if args.database_url:
+            db.drop_all()
+
+    return 0 if abs(lost) < 1e-6 and completed_ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
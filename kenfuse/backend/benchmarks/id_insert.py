@@ -0,0 +1,84 @@
+"""Insert throughput and primary key index size for random vs time-ordered ids
+
+Inserts the same rows into one table per id scheme, committing in
+batches like the app does, then reports rows/s and the size of each
+primary key index. Uses a throwaway SQLite file unless --database-url
+points at a scratch PostgreSQL database (where native uuid storage is
+measured too; the benchmark tables are dropped afterwards).
+
+    python benchmarks/id_insert.py --rows 200000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, create_engine, insert, text
+from sqlalchemy.dialects import postgresql
+
+from app.utils.ids import new_id
+
+def schemes(dialect_name):
+    yield 'uuid4 text', String(36), lambda: str(uuid.uuid4())
+    yield 'uuid7 text', String(36), new_id
+    if dialect_name == 'postgresql':
+        yield 'uuid7 native', postgresql.UUID(as_uuid=False), new_id
+
+def index_size(connection, table):
+    if connection.dialect.name == 'postgresql':
+        return connection.execute(text(f"SELECT pg_relation_size('{table.name}_pkey')")).scalar()
+    # SQLite names the primary key index sqlite_autoindex_<table>_1
+    return connection.execute(
+        text('SELECT SUM(pgsize) FROM dbstat WHERE name = :name'), {'name': f'sqlite_autoindex_{table.name}_1'}
+    ).scalar()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='Scratch database (default: temporary SQLite file)')
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--batch', type=int, default=100, help='Rows per transaction')
+    args = parser.parse_args()
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'ids.db')
+    engine = create_engine(database_url)
+    metadata = MetaData()
+    tables = []
+    for number, (name, id_type, generate) in enumerate(schemes(engine.dialect.name)):
+        table = Table(
+            f'bench_ids_{number}', metadata,
+            Column('id', id_type, primary_key=True),
+            Column('created_at', DateTime, nullable=False),
+            Column('payload', String(100), nullable=False)
+        )
+        tables.append((name, table, generate))
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+    print(f'{engine.dialect.name}, {args.rows} rows in batches of {args.batch}')
+    print(f'{"scheme":<14} {"rows/s":>10} {"pk index":>12}')
+    try:
+        for name, table, generate in tables:
+            started = time.perf_counter()
+            for offset in range(0, args.rows, args.batch):
+                rows = [
+                    {'id': generate(), 'created_at': datetime.utcnow(), 'payload': 'x' * 40}
+                    for _ in range(min(args.batch, args.rows - offset))
+                ]
+                with engine.begin() as connection:
+                    connection.execute(insert(table), rows)
+            elapsed = time.perf_counter() - started
+
+            with engine.connect() as connection:
+                size = index_size(connection, table)
+            print(f'{name:<14} {args.rows / elapsed:>10.0f} {size / (1024 * 1024):>10.1f}MB')
+    finally:
+        if args.database_url:
+            metadata.drop_all(engine)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Reconciliation throughput and peak memory against a synthetic statement
+
+Writes --payments donations with their payments, then an M-Pesa
+statement covering them in which a small share of lines are missing,
+altered, duplicated or lack a recorded receipt, and times a full
+reconciliation. --trace-memory reports peak Python memory, which
+should stay flat as --payments grows. Uses a throwaway SQLite file unless --database-url
+points at a scratch PostgreSQL database (its tables are created and
+dropped).
+
+    python benchmarks/reconciliation.py --payments 1000000
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+from app import create_app
+from app.config import config, TestingConfig
+from app.extensions import db
+from app.models import User, Fundraiser, Donation, Payment, PaymentMethod, PaymentStatus
+from app.services.reconciliation_service import reconcile
+from app.utils.ids import new_id
+
+def build_app(database_url):
+    config['benchmark'] = type('BenchmarkConfig', (TestingConfig,), {'SQLALCHEMY_DATABASE_URI': database_url})
+    return create_app('benchmark')
+
+def seed(payments, fundraisers, statement_path, batch=10_000):
+    """Insert donations and payments; write the statement; returns the number of lines written"""
+    owner = User(email='owner@example.com', phone='+254700000001', first_name='Bench', last_name='Owner')
+    owner.password = 'benchmark'
+    db.session.add(owner)
+    db.session.flush()
+    fundraiser_ids = []
+    for number in range(fundraisers):
+        fundraiser = Fundraiser(user_id=owner.id, title=f'Benchmark {number}', description='Reconciliation',
+                                target_amount=1e12, end_date=datetime.utcnow() + timedelta(days=30))
+        db.session.add(fundraiser)
+        db.session.flush()
+        fundraiser_ids.append(fundraiser.id)
+    db.session.commit()
+
+    random.seed(7)
+    started = datetime.utcnow() - timedelta(days=30)
+    totals = dict.fromkeys(fundraiser_ids, 0.0)
+    lines = 0
+    with open(statement_path, 'w', newline='') as statement:
+        writer = csv.writer(statement)
+        writer.writerow(['Receipt No.', 'Completion Time', 'Details', 'Transaction Status', 'Paid In', 'Withdrawn'])
+        for offset in range(0, payments, batch):
+            donations, rows = [], []
+            for number in range(offset, min(offset + batch, payments)):
+                created_at = started + timedelta(seconds=number * 2)
+                amount = float(random.choice((100, 250, 500, 1000, 2500)))
+                fundraiser_id = random.choice(fundraiser_ids)
+                donation_id = new_id()
+                receipt = f'R{number:09d}'
+                roll = random.random()
+                donations.append({
+                    'id': donation_id, 'fundraiser_id': fundraiser_id, 'amount': amount, 'payment_method': 'mpesa',
+                    'transaction_id': f'TXN{number}', 'donor_name': 'Donor', 'donor_phone': '0700000000',
+                    'is_anonymous': False, 'created_at': created_at
+                })
+                rows.append({
+                    'id': new_id(), 'amount': amount, 'currency': 'KES', 'payment_method': PaymentMethod.MPESA,
+                    'status': PaymentStatus.COMPLETED, 'donation_id': donation_id, 'created_at': created_at,
+                    'mpesa_receipt': None if roll < 0.01 else receipt  # Callback lost: matched by time
+                })
+                totals[fundraiser_id] += amount
+                if roll > 0.995:
+                    continue  # Never settled
+                settled_amount = amount - 1 if 0.99 < roll < 0.992 else amount
+                settled_at = (created_at + timedelta(seconds=30, hours=3)).strftime('%d/%m/%Y %H:%M:%S')
+                writer.writerow([receipt, settled_at, 'Donation', 'Completed', f'{settled_amount:,.2f}', ''])
+                lines += 1
+                if 0.992 < roll < 0.993:
+                    writer.writerow([receipt, settled_at, 'Donation', 'Completed', f'{settled_amount:,.2f}', ''])
+                    lines += 1
+            db.session.execute(insert(Donation), donations)
+            db.session.execute(insert(Payment), rows)
+            db.session.commit()
+
+    for fundraiser_id, total in totals.items():
+        db.session.get(Fundraiser, fundraiser_id).current_amount = total
+    db.session.commit()
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='Scratch database (default: temporary SQLite file)')
+    parser.add_argument('--payments', type=int, default=200_000)
+    parser.add_argument('--fundraisers', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--trace-memory', action='store_true', help='Report peak Python memory (slows the run)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    database_url = args.database_url or 'sqlite:///' + os.path.join(workdir, 'reconciliation.db')
+    statement_path = os.path.join(workdir, 'statement.csv')
+    app = build_app(database_url)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        try:
+            seeding = time.perf_counter()
+            lines = seed(args.payments, args.fundraisers, statement_path)
+            print(f'{db.engine.dialect.name}: seeded {args.payments} payments and {lines} statement lines '
+                  f'in {time.perf_counter() - seeding:.1f}s')
+
+            if args.trace_memory:
+                tracemalloc.start()
+            started = time.perf_counter()
+            with open(statement_path, newline='') as statement, open(os.devnull, 'w', newline='') as report:
+                run = reconcile({'mpesa': ('statement.csv', statement)}, report, batch_size=args.batch_size)
+            elapsed = time.perf_counter() - started
+
+            print(f'reconciled in {elapsed:.1f}s: {lines / elapsed:,.0f} lines/s')
+            if args.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f'peak Python memory {peak / (1024 * 1024):.1f}MB')
+            for kind, count in sorted(run.summary.items()):
+                print(f'  {kind}: {count}')
+        finally:
+            if args.database_url:
+                db.session.remove()
+                db.drop_all()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+KENFUSE live stream server
+
+Serves the fundraiser Server-Sent Event streams on gevent: each
+connection is a greenlet waiting on the event hub, so idle donor pages
+hold no thread. Every other route stays on the threaded API server;
+send /api/fundraisers/<id>/stream here (or point EventSource at this
+host). Donations recorded by the API processes reach these streams
+through the Redis bridge, so EVENT_HUB_URL or REDIS_URL must be set.
+"""
+
+from gevent import monkey
+monkey.patch_all()
+
+import os
+import re
+import sys
+
+# Add current directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+# Background work belongs to the API processes
+os.environ.setdefault('JOB_QUEUE_WORKERS', '0')
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+os.environ.setdefault('IMAGE_WORKERS', '0')
+# A waiting greenlet costs a few KB, not a thread
+os.environ.setdefault('SSE_MAX_CLIENTS', '5000')
+
+from gevent.pywsgi import WSGIServer
+from app import create_app
+
+STREAM_PATH = re.compile(r'^/api/fundraisers/[^/]+/stream$')
+
+# Same settings as the API service it runs beside (render.yaml sets FLASK_ENV)
+app = create_app(os.environ.get('FLASK_ENV', 'default'))
+
+def streams_only(environ, start_response):
+    if STREAM_PATH.match(environ.get('PATH_INFO', '')):
+        return app(environ, start_response)
+    start_response('404 Not Found', [('Content-Type', 'application/json')])
+    return [b'{"error": "Only fundraiser streams are served here"}']
+
+if __name__ == '__main__':
+    if not app.config['EVENT_HUB_URL'].startswith(('redis://', 'rediss://', 'unix://')):
+        app.logger.warning('EVENT_HUB_URL is not Redis; streams here will not see donations made through the API')
+    port = int(os.environ.get('PORT', 5001))
+    WSGIServer(('0.0.0.0', port), streams_only).serve_forever()
@@ -0,0 +1,81 @@
+import itertools
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app
+from app.config import config, TestingConfig
+from app.extensions import db, limiter
+from app.models import Fundraiser
+
+_phones = itertools.count(700000000)
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build an app from TestingConfig plus overrides, on a fresh SQLite file
+
+    Overrides are applied before the extensions start, so settings read in
+    init_app take effect. A file database (rather than :memory:) lets
+    worker threads use their own connections.
+    """
+    def make(**overrides):
+        settings = {
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "kenfuse.db"}',
+            'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+            'BLOB_STORE_FOLDER': str(tmp_path / 'media'),
+            'UPLOAD_SESSION_FOLDER': str(tmp_path / 'media-uploads'),
+            'IMAGE_INCOMING_FOLDER': str(tmp_path / 'incoming'),
+            **overrides
+        }
+        config['pytest'] = type('PytestConfig', (TestingConfig,), settings)
+        app = create_app('pytest')
+        with app.app_context():
+            db.create_all()
+        return app
+
+    yield make
+    config.pop('pytest', None)
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    limiter.enabled = False
+    yield app
+    limiter.enabled = True
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def register(client, role='family', **fields):
+    """Register a user through the API; returns the response JSON"""
+    number = next(_phones)
+    data = {
+        'email': f'user{number}@example.com',
+        'phone': f'+254{number}',
+        'first_name': 'Test',
+        'last_name': 'User',
+        'password': 'password123',
+        'role': role,
+        **fields
+    }
+    response = client.post('/api/register', json=data)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()
+
+def auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+@pytest.fixture
+def owner(client):
+    return register(client)
+
+@pytest.fixture
+def fundraiser_id(app, owner):
+    """An active fundraiser of owner's, with a target of 10,000 and a month to run"""
+    with app.app_context():
+        fundraiser = Fundraiser(user_id=owner['user']['id'], title='Funeral costs', description='For the send-off',
+                                target_amount=10000, end_date=datetime.utcnow() + timedelta(days=30))
+        db.session.add(fundraiser)
+        db.session.commit()
+        return fundraiser.id
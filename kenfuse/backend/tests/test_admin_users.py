@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+
+import pytest
+
+from app.models import User
+from app.utils.pagination import keyset_page
+from conftest import register, auth
+
+@pytest.fixture
+def admin(client):
+    return register(client, role='admin')
+
+@pytest.fixture
+def user_ids(client, admin):
+    """Every user's id, newest first as the listing orders them"""
+    for _ in range(6):
+        register(client)
+    body = client.get('/api/users?limit=200', headers=auth(admin['access_token'])).get_json()
+    return [user['id'] for user in body['users']]
+
+def test_cursor_pages_walk_every_user_once(client, admin, user_ids):
+    seen = []
+    cursor = ''
+    while True:
+        body = client.get(f'/api/users?limit=3&cursor={cursor}', headers=auth(admin['access_token'])).get_json()
+        assert body['count'] == len(body['users']) <= 3
+        seen += [user['id'] for user in body['users']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+
+    assert seen == user_ids and len(seen) == 7
+
+def test_filters_and_invalid_cursor(client, admin, user_ids):
+    body = client.get('/api/users?role=admin', headers=auth(admin['access_token'])).get_json()
+    assert [user['id'] for user in body['users']] == [admin['user']['id']]
+
+    assert client.get('/api/users?cursor=%%%', headers=auth(admin['access_token'])).status_code == 400
+    assert client.get('/api/users?role=owner', headers=auth(admin['access_token'])).status_code == 400
+
+@pytest.mark.parametrize('limit', ['0', '-1', 'many'])
+def test_limit_is_clamped(client, admin, user_ids, limit):
+    response = client.get(f'/api/users?limit={limit}', headers=auth(admin['access_token']))
+
+    assert response.status_code == 200
+    expected = 50 if limit == 'many' else 1
+    assert response.get_json()['count'] == min(expected, len(user_ids))
+
+def test_keyset_page_treats_a_non_positive_limit_as_one(app, user_ids):
+    with app.app_context():
+        rows, next_cursor = keyset_page(User.query, User, limit=0)
+
+    assert [row.id for row in rows] == user_ids[:1]
+    assert next_cursor is not None
+
+def test_ndjson_export_streams_every_user_oldest_first(client, admin, user_ids):
+    response = client.get('/api/users?format=ndjson', headers=auth(admin['access_token']))
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['Content-Disposition'].endswith('.ndjson')
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['id'] for row in rows] == user_ids[::-1]
+
+def test_csv_export_has_one_header_and_honours_filters(client, admin, user_ids):
+    response = client.get('/api/users?format=csv&role=family', headers=auth(admin['access_token']))
+
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert len(rows) == 6
+    assert {row['role'] for row in rows} == {'family'}
+
+def test_listing_is_for_admins(client, user_ids):
+    assert client.get('/api/users', headers=auth(register(client)['access_token'])).status_code == 403
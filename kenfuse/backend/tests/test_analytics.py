@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models import Donation, FundraiserHourlyStat
+from app.services.analytics_service import InvalidRange, donation_series, pick_bucket, top_donors
+from app.utils.ids import transaction_id
+from conftest import register, auth
+
+START = datetime(2024, 3, 1, 8, 0)
+
+def _donate(fundraiser_id, amount, at, name='Wairimu', phone='+254700000001', method='mpesa', anonymous=False):
+    donation = Donation(fundraiser_id=fundraiser_id, amount=amount, payment_method=method,
+                        transaction_id=transaction_id('DON'), donor_name=name, donor_phone=phone,
+                        is_anonymous=anonymous, created_at=at)
+    db.session.add(donation)
+    db.session.commit()
+    return donation
+
+def test_pick_bucket():
+    assert pick_bucket(START, START + timedelta(hours=10), 200)[0] == 'hour'
+    assert pick_bucket(START, START + timedelta(days=30), 200)[0] == '6h'
+    assert pick_bucket(START, START + timedelta(days=30), 10)[0] == 'week'
+    assert pick_bucket(START, START + timedelta(days=30), 200, bucket='day')[0] == 'day'
+    with pytest.raises(InvalidRange):
+        pick_bucket(START, START + timedelta(days=30), 10, bucket='hour')
+    with pytest.raises(InvalidRange):
+        pick_bucket(START, START + timedelta(days=1), 10, bucket='fortnight')
+
+def test_hourly_series_from_rollups(app, fundraiser_id):
+    with app.app_context():
+        _donate(fundraiser_id, 100, START + timedelta(minutes=5))
+        _donate(fundraiser_id, 250, START + timedelta(minutes=50), method='card')
+        _donate(fundraiser_id, 40, START + timedelta(hours=2, minutes=1))
+
+        result = donation_series(fundraiser_id, START, START + timedelta(hours=3), bucket='hour')
+
+        assert result['source'] == FundraiserHourlyStat.__tablename__
+        assert [point['count'] for point in result['series']] == [2, 0, 1, 0]
+        assert result['series'][0]['by_method'] == {'mpesa': {'count': 1, 'amount': 100.0}, 'card': {'count': 1, 'amount': 250.0}}
+        assert result['totals']['amount'] == 390.0
+        assert result['totals']['average_gift'] == 130.0
+
+def test_daily_series_and_deletes(app, fundraiser_id):
+    with app.app_context():
+        first = _donate(fundraiser_id, 100, START)
+        _donate(fundraiser_id, 300, START + timedelta(days=1, hours=3))
+        db.session.delete(first)
+        db.session.commit()
+
+        result = donation_series(fundraiser_id, START, START + timedelta(days=2), bucket='day')
+
+        assert result['source'] == 'fundraiser_daily_stats'
+        assert [point['amount'] for point in result['series']] == [0.0, 300.0, 0.0]
+        assert result['totals']['count'] == 1
+
+def test_top_donors_group_by_donor_and_skip_anonymous(app, fundraiser_id):
+    with app.app_context():
+        _donate(fundraiser_id, 100, START, name='Wairimu', phone='+254700000001')
+        _donate(fundraiser_id, 150, START, name='Wairimu', phone='+254700000001')
+        _donate(fundraiser_id, 200, START, name='Kip', phone='+254700000002')
+        _donate(fundraiser_id, 5000, START, name='Someone', phone='+254700000003', anonymous=True)
+
+        assert top_donors(fundraiser_id) == [
+            {'donor_name': 'Wairimu', 'count': 2, 'amount': 250.0},
+            {'donor_name': 'Kip', 'count': 1, 'amount': 200.0}
+        ]
+
+def test_endpoint_is_for_the_owner(app, client, owner, fundraiser_id):
+    with app.app_context():
+        _donate(fundraiser_id, 100, START + timedelta(hours=1))
+    url = f'/api/fundraisers/{fundraiser_id}/analytics'
+    query = {'from': START.isoformat() + 'Z', 'to': (START + timedelta(days=1)).isoformat() + 'Z', 'top': 1}
+
+    response = client.get(url, query_string=query, headers=auth(owner['access_token']))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['bucket'] == 'hour' and body['totals']['count'] == 1
+    assert len(body['top_donors']) == 1
+
+    stranger = register(client)
+    assert client.get(url, query_string=query, headers=auth(stranger['access_token'])).status_code == 404
+    bad = dict(query, **{'from': query['to'], 'to': query['from']})
+    assert client.get(url, query_string=bad, headers=auth(owner['access_token'])).status_code == 400
@@ -0,0 +1,113 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db, blob_store
+from app.models import MediaBlob
+from app.services.media_service import collect_garbage, register_blob
+
+DATA = b'the same bytes uploaded twice'
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+
+def _upload(data=DATA):
+    """What an upload does: store the bytes, then register the blob"""
+    blob_hash, size = blob_store.put_bytes(data)
+    with db.engine.begin() as connection:
+        register_blob(connection, blob_hash, size)
+    return blob_hash
+
+def _age(blob_hash, hours=2):
+    """Make a stored, registered blob look unused for hours"""
+    past = datetime.utcnow() - timedelta(hours=hours)
+    db.session.query(MediaBlob).filter_by(hash=blob_hash).update({'updated_at': past})
+    db.session.commit()
+    stamp = time.time() - hours * 3600
+    os.utime(blob_store.path(blob_hash), (stamp, stamp))
+
+def _registered(blob_hash):
+    db.session.expire_all()
+    return db.session.get(MediaBlob, blob_hash) is not None
+
+def test_collects_unused_blobs_only(ctx):
+    unused = _upload(b'unused')
+    referenced = _upload(b'referenced')
+    recent = _upload(b'recent')
+    _age(unused)
+    _age(referenced)
+    db.session.query(MediaBlob).filter_by(hash=referenced).update({'ref_count': 1})
+    db.session.commit()
+
+    assert collect_garbage(blob_store) == (1, len(b'unused'))
+
+    assert not blob_store.exists(unused) and not _registered(unused)
+    assert blob_store.exists(referenced) and _registered(referenced)
+    assert blob_store.exists(recent) and _registered(recent)
+    assert os.listdir(os.path.join(blob_store.root, 'tmp')) == []
+
+def test_reuse_just_before_collection_keeps_the_file(ctx):
+    blob_hash = _upload()
+    _age(blob_hash)
+
+    # Deduplicated against the existing file, but not registered yet
+    blob_store.put_bytes(DATA)
+    assert collect_garbage(blob_store) == (0, 0)
+
+    assert blob_store.exists(blob_hash) and _registered(blob_hash)
+
+def test_reuse_while_file_is_aside_keeps_the_row(ctx, monkeypatch):
+    blob_hash = _upload()
+    _age(blob_hash)
+
+    retire = blob_store.retire
+    def retire_then_upload(*args):
+        retired_path = retire(*args)
+        _upload()
+        return retired_path
+    monkeypatch.setattr(blob_store, 'retire', retire_then_upload)
+
+    assert collect_garbage(blob_store) == (0, 0)
+
+    assert blob_store.exists(blob_hash) and _registered(blob_hash)
+    assert os.listdir(os.path.join(blob_store.root, 'tmp')) == []
+
+def test_reuse_after_row_deleted_stores_a_fresh_copy(ctx, monkeypatch):
+    blob_hash = _upload()
+    _age(blob_hash)
+
+    purge = blob_store.purge
+    def upload_then_purge(*args):
+        # The row is gone and the file aside; the upload must not rely on either
+        _upload()
+        purge(*args)
+    monkeypatch.setattr(blob_store, 'purge', upload_then_purge)
+
+    collect_garbage(blob_store)
+
+    assert _registered(blob_hash)
+    with open(blob_store.path(blob_hash), 'rb') as stored:
+        assert stored.read() == DATA
+
+def test_missing_file_drops_the_row(ctx):
+    blob_hash = _upload()
+    _age(blob_hash)
+    os.remove(blob_store.path(blob_hash))
+
+    assert collect_garbage(blob_store)[0] == 1
+    assert not _registered(blob_hash)
+
+def test_scan_removes_unregistered_files(ctx):
+    orphan, _ = blob_store.put_bytes(b'never registered')
+    stamp = time.time() - 7200
+    os.utime(blob_store.path(orphan), (stamp, stamp))
+    fresh, _ = blob_store.put_bytes(b'still being registered')
+
+    collect_garbage(blob_store, scan=True)
+
+    assert not blob_store.exists(orphan)
+    assert blob_store.exists(fresh)
@@ -0,0 +1,120 @@
+import time
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.extensions import db, claims_revocations, limiter
+from app.models import User, UserRole, SubscriptionPlan
+from app.services import claims_service
+
+from conftest import register, auth
+
+@pytest.fixture(params=['memory://', 'database://'])
+def app(request, make_app):
+    app = make_app(CLAIMS_REVOCATION_URL=request.param)
+    limiter.enabled = False
+    yield app
+    limiter.enabled = True
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic time that tests can move forward"""
+    offset = [0.0]
+    monkeypatch.setattr(claims_service.time, 'monotonic', lambda: time.perf_counter() + offset[0])
+    return offset
+
+def _change_elsewhere(app, clock, user_id, **values):
+    """Commit a change from a session the app's listeners never see, like another worker would
+
+    Moves the clock past the version TTL, by when every worker has seen it.
+    """
+    with app.app_context(), Session(db.engine) as session:
+        user = session.get(User, user_id)
+        for name, value in values.items():
+            setattr(user, name, value)
+        session.commit()
+    clock[0] += claims_revocations.version_ttl + 1
+
+def _login(client, email):
+    response = client.post('/api/login', json={'email': email, 'password': 'password123'})
+    assert response.status_code == 200
+    return response.get_json()['access_token']
+
+def test_version_cache_is_the_default(make_app):
+    make_app()
+    assert claims_revocations.backend == 'memory'
+
+def test_demotion_in_another_worker_rejects_old_admin_token(app, client, clock):
+    user = register(client)['user']
+    _change_elsewhere(app, clock, user['id'], role=UserRole.ADMIN)
+    token = _login(client, user['email'])
+    assert client.get('/api/dashboard', headers=auth(token)).status_code == 200
+
+    _change_elsewhere(app, clock, user['id'], role=UserRole.FAMILY)
+
+    response = client.get('/api/dashboard', headers=auth(token))
+    assert response.status_code == 401
+    assert response.get_json()['code'] == 'claims_stale'
+
+    # A fresh login carries the new claims
+    assert client.get('/api/dashboard', headers=auth(_login(client, user['email']))).status_code == 403
+
+def test_plan_change_rejects_tokens_with_the_old_plan(app, client, clock):
+    user = register(client)
+    token = user['access_token']
+    assert client.get('/api/fundraisers/missing/analytics', headers=auth(token)).status_code == 404
+
+    _change_elsewhere(app, clock, user['user']['id'], subscription_plan=SubscriptionPlan.PREMIUM)
+
+    assert client.get('/api/fundraisers/missing/analytics', headers=auth(token)).status_code == 401
+
+def test_deleted_user_tokens_are_stale(app, client, clock):
+    user = register(client)
+    with app.app_context():
+        db.session.delete(db.session.get(User, user['user']['id']))
+        db.session.commit()
+
+    assert client.get('/api/fundraisers/missing/analytics', headers=auth(user['access_token'])).status_code == 401
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Count claims_version reads from the users table"""
+    calls = []
+    current_version = claims_revocations._current_version
+    monkeypatch.setattr(claims_revocations, '_current_version', lambda user_id: calls.append(user_id) or current_version(user_id))
+    return calls
+
+@pytest.mark.parametrize('app', ['memory://'], indirect=True)
+def test_cache_reads_each_user_once_per_ttl(app, client, clock, reads):
+    token = register(client)['access_token']
+    for _ in range(3):
+        assert client.get('/api/fundraisers/missing/analytics', headers=auth(token)).status_code == 404
+    assert len(reads) == 1
+
+    clock[0] += claims_revocations.version_ttl + 1
+    client.get('/api/fundraisers/missing/analytics', headers=auth(token))
+    assert len(reads) == 2
+
+@pytest.mark.parametrize('app', ['memory://'], indirect=True)
+def test_changes_committed_in_this_process_apply_at_once(app, client, clock, reads):
+    admin = register(client, role='admin')
+    target = register(client, role='admin')
+    assert client.get('/api/dashboard', headers=auth(target['access_token'])).status_code == 200
+
+    response = client.put(f"/api/users/{target['user']['id']}", json={'role': 'family'},
+                          headers=auth(admin['access_token']))
+    assert response.status_code == 200
+
+    # Still within the TTL of the cached version
+    assert client.get('/api/dashboard', headers=auth(target['access_token'])).status_code == 401
+
+@pytest.mark.parametrize('app', ['memory://'], indirect=True)
+def test_cached_versions_are_never_lowered(app):
+    with app.app_context():
+        claims_revocations.revoke('user-1', 3)
+        claims_revocations.revoke('user-1', 2)
+
+        assert claims_revocations.is_stale('user-1', 2)
+        assert not claims_revocations.is_stale('user-1', 3)
+        # Unknown users have no current version, so their tokens are stale
+        assert claims_revocations.is_stale('user-2', 0)
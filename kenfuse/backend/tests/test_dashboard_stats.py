@@ -0,0 +1,64 @@
+from datetime import date, datetime, timedelta
+
+from app.extensions import db
+from app.models import Donation, Fundraiser, FundraiserStatus, User, UserRole
+from app.services import stats_service
+from app.services.stats_service import get_dashboard_stats
+from app.utils.ids import transaction_id
+from conftest import register
+
+def test_counters_follow_inserts_updates_and_deletes(app, client):
+    owner = register(client)
+    register(client)
+    with app.app_context():
+        fundraiser = Fundraiser(user_id=owner['user']['id'], title='Fund', description='Fund',
+                                target_amount=1000, end_date=datetime.utcnow() + timedelta(days=7))
+        db.session.add(fundraiser)
+        db.session.flush()
+        donation = Donation(fundraiser_id=fundraiser.id, amount=100, payment_method='mpesa',
+                            transaction_id=transaction_id('DON'), donor_name='Wairimu', donor_phone='+254700000001')
+        db.session.add(donation)
+        db.session.commit()
+
+        stats = get_dashboard_stats()
+        assert stats['users']['total'] == 2
+        assert stats['users']['role'] == {'family': 2, 'vendor': 0, 'admin': 0}
+        assert stats['active_fundraisers'] == 1
+        assert stats['donations']['count'] == 1
+        assert stats['donations']['by_method'] == {'mpesa': {'count': 1, 'amount': 100.0}}
+
+        db.session.get(User, owner['user']['id']).role = UserRole.ADMIN
+        fundraiser.status = FundraiserStatus.CANCELLED
+        db.session.delete(donation)
+        db.session.commit()
+
+        stats = get_dashboard_stats()
+        assert stats['users']['role'] == {'family': 1, 'vendor': 0, 'admin': 1}
+        assert stats['active_fundraisers'] == 0
+        assert stats['fundraisers']['status']['cancelled'] == 1
+        assert stats['donations']['count'] == 0 and stats['donations']['amount'] == 0
+
+def test_rolled_back_writes_do_not_count(app, client):
+    register(client)
+    with app.app_context():
+        db.session.get(User, User.query.first().id).role = UserRole.VENDOR
+        db.session.flush()
+        db.session.rollback()
+
+        assert get_dashboard_stats()['users']['role']['family'] == 1
+
+def test_daily_window_is_in_utc_like_the_buckets(app, client, fundraiser_id, monkeypatch):
+    payload = {'amount': 100, 'donor_name': 'Achieng', 'donor_phone': '0712345678', 'payment_method': 'card'}
+    assert client.post(f'/api/fundraisers/{fundraiser_id}/donate', json=payload).status_code == 201
+
+    # A server clock in Nairobi just after local midnight is a day ahead of UTC
+    class NairobiDate(date):
+        @classmethod
+        def today(cls):
+            return datetime.utcnow().date() + timedelta(days=1)
+
+    monkeypatch.setattr(stats_service, 'date', NairobiDate)
+    with app.app_context():
+        by_day = get_dashboard_stats(days=1)['donations']['by_day']
+
+    assert [day['day'] for day in by_day] == [datetime.utcnow().date().isoformat()]
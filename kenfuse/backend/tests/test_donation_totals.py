@@ -0,0 +1,130 @@
+import itertools
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db, event_hub, response_cache
+from app.models import Fundraiser, FundraiserStatus, StatCounter
+from app.services.donation_service import FundraiserClosed, add_to_total
+from app.services.stats_service import COUNTER_SHARDS, counter, get_dashboard_stats
+from app.utils.metrics import metrics
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+
+@pytest.fixture
+def purges(monkeypatch):
+    """Tags purged from the response cache"""
+    purged = []
+    monkeypatch.setattr(response_cache, 'purge', lambda *tags: purged.extend(tags))
+    return purged
+
+def _fundraiser(fundraiser_id):
+    db.session.expire_all()
+    return db.session.get(Fundraiser, fundraiser_id)
+
+def _completed():
+    return metrics.snapshot('donations.completed_fundraisers')['counters'].get('donations.completed_fundraisers', 0)
+
+def test_sequential_donations_add_up(ctx, fundraiser_id):
+    assert add_to_total(fundraiser_id, 250) == (250, FundraiserStatus.ACTIVE)
+    db.session.commit()
+    assert add_to_total(fundraiser_id, 100.5) == (350.5, FundraiserStatus.ACTIVE)
+    db.session.commit()
+
+    assert _fundraiser(fundraiser_id).current_amount == 350.5
+
+def test_concurrent_donations_are_never_lost(app, ctx, fundraiser_id):
+    errors = []
+
+    def donate():
+        with app.app_context():
+            try:
+                for _ in range(5):
+                    add_to_total(fundraiser_id, 10)
+                    db.session.commit()
+            except Exception as error:
+                errors.append(error)
+
+    threads = [threading.Thread(target=donate) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert _fundraiser(fundraiser_id).current_amount == 400
+
+def test_reaching_the_target_completes_the_fundraiser(ctx, fundraiser_id):
+    active, completed, completions = counter('fundraisers.status.active'), counter('fundraisers.status.completed'), _completed()
+    add_to_total(fundraiser_id, 9000)
+    db.session.commit()
+    assert counter('fundraisers.status.completed') == completed
+
+    assert add_to_total(fundraiser_id, 1000) == (10000, FundraiserStatus.COMPLETED)
+    db.session.commit()
+
+    assert _fundraiser(fundraiser_id).status == FundraiserStatus.COMPLETED
+    assert counter('fundraisers.status.active') == active - 1
+    assert counter('fundraisers.status.completed') == completed + 1
+    assert _completed() == completions + 1
+
+    with pytest.raises(FundraiserClosed):
+        add_to_total(fundraiser_id, 1)
+
+def test_closed_fundraisers_take_no_donations(ctx, fundraiser_id):
+    fundraiser = _fundraiser(fundraiser_id)
+    fundraiser.end_date = datetime.utcnow() - timedelta(minutes=1)
+    db.session.commit()
+
+    with pytest.raises(FundraiserClosed):
+        add_to_total(fundraiser_id, 100)
+    with pytest.raises(FundraiserClosed):
+        add_to_total('missing', 100)
+
+    db.session.rollback()
+    assert _fundraiser(fundraiser_id).current_amount == 0
+
+def test_purge_and_progress_event_follow_the_commit(ctx, fundraiser_id, purges):
+    subscription = event_hub.subscribe(f'fundraiser:{fundraiser_id}')
+    with subscription:
+        add_to_total(fundraiser_id, 500)
+        db.session.rollback()
+        assert purges == [] and subscription.get(timeout=0) is None
+
+        add_to_total(fundraiser_id, 500)
+        assert purges == []
+        db.session.commit()
+
+        assert sorted(purges) == sorted([f'fundraiser:{fundraiser_id}', 'fundraisers'])
+        event = subscription.get(timeout=1)
+        assert event['type'] == 'progress'
+        assert event['data'] == {'current_amount': 500.0, 'target_amount': 10000.0,
+                                 'progress_percentage': 5.0, 'status': 'active'}
+
+def test_only_completion_moves_the_watermark(ctx, fundraiser_id):
+    before = counter('watermark.fundraisers')
+    add_to_total(fundraiser_id, 500)
+    db.session.commit()
+    assert counter('watermark.fundraisers') == before
+
+    add_to_total(fundraiser_id, 9500)
+    db.session.commit()
+    assert counter('watermark.fundraisers') == before + 1
+
+def test_counters_are_summed_over_shards(app, client, ctx, fundraiser_id, monkeypatch):
+    shards = itertools.cycle(range(COUNTER_SHARDS))
+    monkeypatch.setattr('app.services.stats_service._shard', lambda: next(shards))
+    payload = {'amount': 100, 'donor_name': 'Achieng', 'donor_phone': '0712345678', 'payment_method': 'card'}
+    for _ in range(3):
+        assert client.post(f'/api/fundraisers/{fundraiser_id}/donate', json=payload).status_code == 201
+
+    assert StatCounter.query.filter_by(name='donations.count').count() == 3
+    assert counter('donations.count') == 3
+    assert counter('donations.amount') == 300
+    donations = get_dashboard_stats()['donations']
+    assert donations['count'] == 3
+    assert [(day['payment_method'], day['count'], day['amount']) for day in donations['by_day']] == [('card', 3, 300)]
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from app.extensions import event_hub
+from app.services.event_hub import EventHub, EventHubFull
+
+@pytest.fixture
+def hub():
+    hub = EventHub()
+    hub.queue_size = 2
+    hub.history_size = 3
+    hub.max_subscribers = 2
+    return hub
+
+def test_fans_out_to_every_subscriber_of_the_channel(hub):
+    first = hub.subscribe('fundraiser:1')
+    second = hub.subscribe('fundraiser:1')
+    hub._deliver({'id': '1', 'channel': 'fundraiser:1', 'type': 'progress', 'data': {}})
+    hub._deliver({'id': '2', 'channel': 'fundraiser:2', 'type': 'progress', 'data': {}})
+
+    assert first.get(timeout=0)['id'] == '1'
+    assert second.get(timeout=0)['id'] == '1'
+    assert first.get(timeout=0) is None
+
+def test_slow_subscriber_is_dropped_and_replays_history(hub):
+    slow = hub.subscribe('fundraiser:1')
+    for event_id in '123':
+        hub._deliver({'id': event_id, 'channel': 'fundraiser:1', 'type': 'donation', 'data': {}})
+
+    assert slow.closed
+    assert hub.stats()['subscribers'] == 0
+
+    # Reconnecting with the last id it saw replays the rest
+    replay = hub.subscribe('fundraiser:1', last_event_id='1')
+    assert [replay.get(timeout=0)['id'] for _ in range(2)] == ['2', '3']
+
+def test_capacity_is_freed_by_closing(hub):
+    with hub.subscribe('fundraiser:1'):
+        hub.subscribe('fundraiser:2')
+        with pytest.raises(EventHubFull):
+            hub.subscribe('fundraiser:3')
+    hub.subscribe('fundraiser:3')
+    assert hub.stats()['subscribers'] == 2
+
+@pytest.fixture
+def app(make_app):
+    """Streams with short heartbeats, so tests see events promptly"""
+    return make_app(SSE_HEARTBEAT=0.01, SSE_MAX_DURATION=5)
+
+def _events(chunks):
+    for chunk in chunks:
+        text = chunk.decode()
+        if text.startswith('id:'):
+            lines = dict(line.split(': ', 1) for line in text.strip().split('\n'))
+            yield lines['event'], json.loads(lines['data'])
+
+def test_stream_sends_progress_then_donations(app, fundraiser_id):
+    client = app.test_client()
+    response = client.get(f'/api/fundraisers/{fundraiser_id}/stream', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    events = _events(response.response)
+
+    kind, data = next(events)
+    assert kind == 'progress' and data['current_amount'] == 0
+
+    event_hub.publish(f'fundraiser:{fundraiser_id}', 'progress', {'current_amount': 250})
+    assert next(events) == ('progress', {'current_amount': 250})
+
+    response.close()
+    assert event_hub.stats()['subscribers'] == 0
+
+@pytest.mark.parametrize('method', ['HEAD', 'GET'])
+def test_unread_streams_release_their_subscription(app, fundraiser_id, method):
+    client = app.test_client()
+    for _ in range(3):
+        # Closed before the body is read, as for HEAD or a client gone early
+        response = client.open(f'/api/fundraisers/{fundraiser_id}/stream', method=method, buffered=False)
+        assert response.status_code == 200
+        response.close()
+
+    assert event_hub.stats()['subscribers'] == 0
+
+def test_unknown_fundraiser_does_not_subscribe(app):
+    response = app.test_client().get('/api/fundraisers/missing/stream')
+
+    assert response.status_code == 404
+    assert event_hub.stats()['subscribers'] == 0
@@ -0,0 +1,81 @@
+import threading
+import time
+import uuid
+
+import pytest
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.utils import ids
+from app.utils.ids import GUID, new_id, transaction_id, ulid, uuid7
+
+def _ms(value):
+    return value.int >> 80
+
+def test_layout_follows_rfc_9562():
+    before = time.time_ns() // 1_000_000
+    value = uuid7()
+    after = time.time_ns() // 1_000_000
+
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+    assert before <= _ms(value) <= after + 1
+
+def test_ids_are_unique_and_sorted_within_a_process():
+    values = [new_id() for _ in range(20000)]
+
+    assert len(set(values)) == len(values)
+    assert values == sorted(values)
+
+def test_ids_stay_unique_across_threads():
+    results = [[] for _ in range(8)]
+
+    def make(bucket):
+        bucket.extend(new_id() for _ in range(2000))
+
+    threads = [threading.Thread(target=make, args=(bucket,)) for bucket in results]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    values = [value for bucket in results for value in bucket]
+    assert len(set(values)) == len(values)
+    for bucket in results:
+        assert bucket == sorted(bucket)
+
+def test_clock_stepping_back_keeps_order(monkeypatch):
+    first = uuid7()
+    monkeypatch.setattr(ids.time, 'time_ns', lambda: (_ms(first) - 5000) * 1_000_000)
+
+    later = [uuid7() for _ in range(10)]
+    assert [first] + later == sorted([first] + later)
+
+def test_counter_overflow_moves_to_the_next_millisecond(monkeypatch):
+    frozen = time.time_ns()
+    monkeypatch.setattr(ids.time, 'time_ns', lambda: frozen)
+
+    values = [uuid7() for _ in range(5000)]
+    assert values == sorted(values)
+    assert len(set(values)) == len(values)
+    assert _ms(values[-1]) > frozen // 1_000_000
+
+def test_ulid_is_26_sortable_crockford_characters():
+    values = [ulid() for _ in range(1000)]
+
+    assert all(len(value) == 26 and set(value) <= set(ids.CROCKFORD_ALPHABET) for value in values)
+    assert values == sorted(values)
+    assert transaction_id().startswith('TXN') and len(transaction_id()) == 29
+
+@pytest.fixture
+def native(monkeypatch):
+    monkeypatch.setattr(GUID, 'native', True)
+
+def test_guid_binds_text_unless_native_on_postgresql(native):
+    guid = GUID()
+    value = new_id()
+
+    assert guid.process_bind_param(value, sqlite.dialect()) == value
+    assert guid.process_bind_param(value.upper(), postgresql.dialect()) == value
+    # Malformed ids from URLs match nothing instead of raising
+    assert guid.process_bind_param('not-a-uuid', postgresql.dialect()) is None
+    assert isinstance(guid.load_dialect_impl(postgresql.dialect()), postgresql.UUID)
@@ -0,0 +1,94 @@
+import io
+import os
+from datetime import date
+
+import pytest
+from PIL import Image
+
+from app.extensions import db, blob_store, image_pipeline
+from app.models import MediaBlob, MediaReference, Memorial, MemorialPhoto
+from app.services import image_service
+from conftest import auth
+
+def _png(width=1200, height=900):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (120, 80, 40)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+@pytest.fixture
+def memorial_id(app, owner):
+    with app.app_context():
+        memorial = Memorial(user_id=owner['user']['id'], deceased_name='Baraka Mwangi',
+                            date_of_birth=date(1950, 1, 1), date_of_passing=date(2020, 1, 1))
+        db.session.add(memorial)
+        db.session.commit()
+        return memorial.id
+
+def _upload(client, owner, url, data, method='post'):
+    return getattr(client, method)(url, headers=auth(owner['access_token']), content_type='multipart/form-data',
+                                   data={'file': (io.BytesIO(data), 'photo.png'), 'caption': 'At home'})
+
+def _photos(app):
+    with app.app_context():
+        return MemorialPhoto.query.all()
+
+def test_upload_produces_variants_in_the_blob_store(app, client, owner, memorial_id):
+    response = _upload(client, owner, f'/api/memorials/{memorial_id}/photos', _png())
+
+    assert response.status_code == 202
+    (photo,) = _photos(app)
+    assert set(photo.photo_variants) == set(image_service.DEFAULT_VARIANTS)
+    assert photo.photo_variants['thumb']['width'] == 320 and photo.photo_variants['thumb']['height'] == 240
+    assert photo.photo_url == photo.photo_variants['full']['jpeg']
+    assert photo.to_dict()['processing'] is False
+
+    with app.app_context():
+        blobs = MediaBlob.query.all()
+        assert len(blobs) == 6
+        assert all(os.path.exists(blob_store.path(blob.hash)) for blob in blobs)
+        assert MediaReference.query.filter_by(owner_id=photo.id).count() == 6
+    assert os.listdir(image_pipeline.incoming_folder) == []
+
+def test_small_images_are_never_upscaled(app, client, owner, memorial_id):
+    _upload(client, owner, f'/api/memorials/{memorial_id}/photos', _png(300, 200))
+
+    (photo,) = _photos(app)
+    assert {variant['width'] for variant in photo.photo_variants.values()} == {300}
+    with app.app_context():
+        assert MediaBlob.query.count() == 2
+
+def test_invalid_image_is_rejected(app, client, owner, memorial_id):
+    response = _upload(client, owner, f'/api/memorials/{memorial_id}/photos', b'not an image')
+
+    assert response.status_code == 400
+    assert _photos(app) == []
+    assert os.listdir(image_pipeline.incoming_folder) == []
+
+@pytest.mark.parametrize('target', ['render_variants', 'put_bytes'])
+def test_failed_processing_removes_the_placeholder(app, client, owner, memorial_id, monkeypatch, target):
+    def fail(*args, **kwargs):
+        raise OSError('disk full')
+
+    if target == 'put_bytes':
+        monkeypatch.setattr(blob_store, 'put_bytes', fail)
+    else:
+        monkeypatch.setattr(image_service, target, fail)
+
+    response = _upload(client, owner, f'/api/memorials/{memorial_id}/photos', _png())
+
+    assert response.status_code == 202
+    assert _photos(app) == []
+    assert os.listdir(image_pipeline.incoming_folder) == []
+
+def test_failed_cover_keeps_the_previous_photo(app, client, owner, memorial_id, monkeypatch):
+    url = f'/api/memorials/{memorial_id}/photo'
+    _upload(client, owner, url, _png(), method='put')
+    with app.app_context():
+        before = db.session.get(Memorial, memorial_id).photo_url
+    assert before
+
+    monkeypatch.setattr(image_service, 'render_variants', lambda *args: 1 / 0)
+    assert _upload(client, owner, url, _png(), method='put').status_code == 202
+
+    with app.app_context():
+        assert db.session.get(Memorial, memorial_id).photo_url == before
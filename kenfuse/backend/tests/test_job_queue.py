@@ -0,0 +1,175 @@
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+from app.extensions import db, job_queue
+from app.models import Payment, PaymentMethod, PaymentStatus, QueuedJob, QueuedJobStatus
+from app.services import payment_service
+from app.services.job_queue import JobFailed
+
+@pytest.fixture
+def queue(app, monkeypatch):
+    """The app's queue, with test handlers that are dropped afterwards"""
+    monkeypatch.setattr(job_queue, '_handlers', dict(job_queue._handlers))
+    with app.app_context():
+        yield job_queue
+
+def _job(job_id):
+    db.session.expire_all()
+    return db.session.get(QueuedJob, job_id)
+
+def test_jobs_run_only_once_their_transaction_commits(queue):
+    ran = []
+    queue.register('test.echo', lambda value: ran.append(value))
+
+    queue.enqueue('test.echo', {'value': 'rolled back'})
+    db.session.rollback()
+    assert queue.work_once() == 0
+
+    job = queue.enqueue('test.echo', {'value': 'committed'}, reference='ref-1')
+    db.session.commit()
+    assert queue.work_once(limit=5) == 1
+    assert queue.work_once() == 0
+
+    assert ran == ['committed']
+    finished = _job(job.id)
+    assert finished.status == QueuedJobStatus.DONE and finished.attempts == 1
+    assert finished.locked_by is None and finished.finished_at is not None
+    assert queue.latest('ref-1').id == job.id
+
+def test_delayed_jobs_wait_for_run_at(queue):
+    queue.register('test.noop', lambda: None)
+    queue.enqueue('test.noop', delay=60)
+    db.session.commit()
+
+    assert queue.work_once() == 0
+
+def test_errors_are_retried_with_backoff_then_fail(queue):
+    failures = []
+
+    def flaky():
+        raise RuntimeError('provider busy')
+
+    queue.register('test.flaky', flaky, on_failure=lambda payload, error: failures.append(error), max_attempts=2)
+    job = queue.enqueue('test.flaky')
+    db.session.commit()
+
+    before = datetime.utcnow()
+    queue.work_once()
+    retried = _job(job.id)
+    assert retried.status == QueuedJobStatus.QUEUED and retried.attempts == 1
+    assert retried.last_error == 'RuntimeError: provider busy'
+    # retry_base * 2**0, with jitter between half and all of it
+    assert before + timedelta(seconds=0.9) <= retried.run_at <= datetime.utcnow() + timedelta(seconds=2)
+    assert failures == []
+
+    retried.run_at = datetime.utcnow()
+    db.session.commit()
+    queue.work_once()
+    assert _job(job.id).status == QueuedJobStatus.FAILED
+    assert failures == ['RuntimeError: provider busy']
+
+def test_job_failed_is_not_retried(queue):
+    failures = []
+
+    def reject():
+        raise JobFailed('rejected')
+
+    queue.register('test.reject', reject, on_failure=lambda payload, error: failures.append((payload, error)))
+    job = queue.enqueue('test.reject', {})
+    db.session.commit()
+    queue.work_once()
+
+    assert _job(job.id).status == QueuedJobStatus.FAILED
+    assert _job(job.id).attempts == 1
+    assert failures == [({}, 'rejected')]
+
+def test_stalled_jobs_are_reclaimed_and_the_old_holder_cannot_settle(queue):
+    ran = []
+    queue.register('test.slow', lambda: ran.append(1))
+    job = queue.enqueue('test.slow')
+    db.session.commit()
+
+    stalled = queue._claim('worker-a', 1)
+    assert queue._claim('worker-b', 1) == []
+    db.session.query(QueuedJob).update({'locked_until': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+    assert queue.work_once(holder='worker-b') == 1
+    assert _job(job.id).attempts == 2
+    # worker-a finally finishes, but the job is no longer its to settle
+    queue._execute(stalled[0], 'worker-a')
+    assert _job(job.id).status == QueuedJobStatus.DONE
+    assert ran == [1, 1]
+
+def test_prune_deletes_old_finished_jobs(queue):
+    queue.register('test.noop', lambda: None)
+    old = queue.enqueue('test.noop')
+    waiting = queue.enqueue('test.noop', delay=3600)
+    db.session.commit()
+    old_id, waiting_id = old.id, waiting.id
+    queue.work_once()
+
+    later = datetime.utcnow() + queue.retention + timedelta(minutes=1)
+    assert queue.prune(batch_size=1, now=later) == 1
+    assert _job(old_id) is None and _job(waiting_id) is not None
+    assert queue.stats()['kinds']['test.noop'] == {'queued': 1}
+
+@pytest.fixture
+def payment_id(queue):
+    payment = Payment(amount=100, payment_method=PaymentMethod.MPESA, status=PaymentStatus.PENDING)
+    db.session.add(payment)
+    db.session.flush()
+    payment_service.enqueue_stk_push(payment, '254712345678')
+    db.session.commit()
+    return payment.id
+
+def test_stk_push_job_records_the_checkout_request(queue, payment_id, monkeypatch):
+    monkeypatch.setattr(payment_service.MpesaService, '__init__', lambda self: None)
+    monkeypatch.setattr(payment_service.MpesaService, 'stk_push', lambda self, **kwargs: {
+        'CheckoutRequestID': 'ws_CO_1', 'MerchantRequestID': 'm-1', 'ResponseCode': '0'
+    })
+
+    assert queue.work_once() == 1
+    payment = db.session.get(Payment, payment_id)
+    assert payment.payment_metadata['checkout_request_id'] == 'ws_CO_1'
+    assert payment.status == PaymentStatus.PENDING
+
+def test_stk_push_read_timeout_fails_the_payment_without_retrying(queue, payment_id, monkeypatch):
+    def timeout(self, **kwargs):
+        raise requests.ReadTimeout('read timed out')
+
+    monkeypatch.setattr(payment_service.MpesaService, '__init__', lambda self: None)
+    monkeypatch.setattr(payment_service.MpesaService, 'stk_push', timeout)
+
+    queue.work_once()
+    db.session.expire_all()
+    payment = db.session.get(Payment, payment_id)
+    assert payment.status == PaymentStatus.FAILED
+    assert 'did not answer in time' in payment.payment_metadata['error']
+    assert queue.latest(payment_id).status == QueuedJobStatus.FAILED
+
+@pytest.mark.parametrize('amount', [0.4, 10.6])
+def test_mpesa_donations_must_be_whole_shillings(client, fundraiser_id, amount):
+    response = client.post(f'/api/fundraisers/{fundraiser_id}/donate', json={
+        'amount': amount, 'donor_name': 'Achieng', 'donor_phone': '0712345678', 'payment_method': 'mpesa'
+    })
+
+    assert response.status_code == 400
+    assert client.get(f'/api/fundraisers/{fundraiser_id}').get_json()['current_amount'] == 0
+
+def test_mpesa_donation_pushes_the_recorded_amount(app, client, fundraiser_id, monkeypatch):
+    pushed = []
+    monkeypatch.setattr(payment_service.MpesaService, '__init__', lambda self: None)
+    monkeypatch.setattr(payment_service.MpesaService, 'stk_push',
+                        lambda self, **kwargs: pushed.append(kwargs['amount']) or {'ResponseCode': '0'})
+
+    response = client.post(f'/api/fundraisers/{fundraiser_id}/donate', json={
+        'amount': 250, 'donor_name': 'Achieng', 'donor_phone': '0712345678', 'payment_method': 'mpesa'
+    })
+    assert response.status_code == 201
+    with app.app_context():
+        assert job_queue.work_once() == 1
+
+    assert pushed == [250]
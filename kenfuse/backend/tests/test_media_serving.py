@@ -0,0 +1,108 @@
+import gzip
+import json
+from datetime import date
+
+import pytest
+
+from app.extensions import db, blob_store
+from app.models import Memorial, MemorialVisibility
+from app.services.media_service import attach, register_blob
+from conftest import register, auth
+
+VIDEO = bytes(range(256)) * 40
+DOCUMENT = json.dumps([{'tribute': 'Rest well', 'index': index} for index in range(200)]).encode()
+
+def _store(app, user_id, data, content_type, visibility=MemorialVisibility.PUBLIC):
+    """Store data as media of a new memorial; returns the blob hash"""
+    with app.app_context():
+        memorial = Memorial(user_id=user_id, deceased_name='Baraka Mwangi', visibility=visibility,
+                            date_of_birth=date(1950, 1, 1), date_of_passing=date(2020, 1, 1))
+        db.session.add(memorial)
+        db.session.flush()
+        blob_hash, size = blob_store.put_bytes(data, content_type)
+        connection = db.session.connection()
+        register_blob(connection, blob_hash, size, content_type)
+        attach(connection, 'memorial', memorial.id, 'photo', [blob_hash], memorial.id)
+        db.session.commit()
+        return blob_hash
+
+@pytest.fixture
+def owner(client):
+    return register(client)
+
+@pytest.fixture
+def video(app, owner):
+    return _store(app, owner['user']['id'], VIDEO, 'video/mp4')
+
+def test_full_response_is_immutable_with_a_strong_etag(client, video):
+    response = client.get(f'/api/media/{video}/clip.mp4')
+
+    assert response.status_code == 200
+    assert response.data == VIDEO
+    assert response.headers['ETag'] == f'"{video}"'
+    assert response.cache_control.public and response.cache_control.immutable
+    assert response.cache_control.max_age == 365 * 24 * 3600
+
+def test_range_requests(client, video):
+    url = f'/api/media/{video}/clip.mp4'
+
+    response = client.get(url, headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == VIDEO[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(VIDEO)}'
+
+    assert client.get(url, headers={'Range': 'bytes=-10'}).data == VIDEO[-10:]
+    assert client.get(url, headers={'Range': f'bytes={len(VIDEO)}-'}).status_code == 416
+
+    # A stale If-Range gets the whole file rather than a mismatched slice
+    response = client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': '"somethingelse"'})
+    assert response.status_code == 200 and response.data == VIDEO
+
+def test_matching_etag_is_not_modified(client, video):
+    response = client.get(f'/api/media/{video}/clip.mp4', headers={'If-None-Match': f'"{video}"'})
+
+    assert response.status_code == 304
+    assert response.data == b''
+
+def test_precompressed_sibling_is_served_when_accepted(app, client, owner):
+    blob_hash = _store(app, owner['user']['id'], DOCUMENT, 'application/json')
+    url = f'/api/media/{blob_hash}/tributes.json'
+
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'] == f'"{blob_hash}-gzip"'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data) == DOCUMENT
+
+    plain = client.get(url)
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.data == DOCUMENT
+
+def test_private_media_needs_access(app, client, owner):
+    blob_hash = _store(app, owner['user']['id'], VIDEO, 'video/mp4', MemorialVisibility.PRIVATE)
+    url = f'/api/media/{blob_hash}/clip.mp4'
+
+    assert client.get(url).status_code in (401, 403, 404)
+    response = client.get(url, headers=auth(owner['access_token']))
+    assert response.status_code == 200
+    assert response.cache_control.private and not response.cache_control.public
+    assert 'Authorization' in response.headers['Vary']
+
+def test_unknown_or_malformed_hashes_are_not_found(client, video):
+    assert client.get('/api/media/../../etc/passwd').status_code == 404
+    assert client.get(f'/api/media/{"0" * 64}/clip.mp4').status_code == 404
+
+@pytest.mark.parametrize('offload, header', [('x-sendfile', 'X-Sendfile'), ('x-accel-redirect', 'X-Accel-Redirect')])
+def test_offload_leaves_the_body_to_the_front_server(make_app, offload, header):
+    app = make_app(MEDIA_OFFLOAD=offload)
+    client = app.test_client()
+    blob_hash = _store(app, register(client)['user']['id'], VIDEO, 'video/mp4')
+    url = f'/api/media/{blob_hash}/clip.mp4'
+
+    response = client.get(url)
+    assert response.data == b''
+    assert response.headers[header].endswith(blob_hash)
+    if offload == 'x-accel-redirect':
+        assert response.headers[header].startswith('/_protected/blobs/')
+
+    assert client.get(url, headers={'If-None-Match': f'"{blob_hash}"'}).status_code == 304
@@ -0,0 +1,93 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models import Donation, Fundraiser, Memorial, MemorialPhoto, MemorialVisibility, Tribute
+from app.routes.memorials import PAGE_SECTION_LIMITS
+from app.utils.ids import transaction_id
+from conftest import register, auth
+
+def _memorial(app, user_id, visibility=MemorialVisibility.PUBLIC, tributes=0, photos=0, donations=0):
+    """A memorial with a linked fundraiser and the given number of rows per section; returns its id"""
+    with app.app_context():
+        memorial = Memorial(user_id=user_id, deceased_name='Baraka Mwangi', visibility=visibility,
+                            date_of_birth=date(1950, 1, 1), date_of_passing=date(2020, 1, 1))
+        db.session.add(memorial)
+        db.session.flush()
+        fundraiser = Fundraiser(user_id=user_id, memorial_id=memorial.id, title='Funeral costs', description='For the send-off',
+                                target_amount=10000, end_date=datetime.utcnow() + timedelta(days=30))
+        db.session.add(fundraiser)
+        db.session.flush()
+        db.session.add_all(Tribute(memorial_id=memorial.id, user_id=user_id, message='Rest well', author_name='Kip')
+                           for _ in range(tributes))
+        db.session.add_all(MemorialPhoto(memorial_id=memorial.id, photo_url='/photo.jpg', uploaded_by=user_id)
+                           for _ in range(photos))
+        db.session.add_all(Donation(fundraiser_id=fundraiser.id, amount=100, payment_method='mpesa', transaction_id=transaction_id('DON'),
+                                    donor_name='Wairimu', donor_email='wairimu@example.com', donor_phone='+254700000001',
+                                    is_anonymous=index % 2 == 1)
+                           for index in range(donations))
+        db.session.commit()
+        return memorial.id
+
+@pytest.fixture
+def queries(app):
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', listener)
+
+def test_page_has_every_section(app, client, owner):
+    memorial_id = _memorial(app, owner['user']['id'], tributes=PAGE_SECTION_LIMITS['tributes'] + 1, photos=2, donations=2)
+
+    body = client.get(f'/api/memorials/{memorial_id}/page').get_json()
+
+    assert body['memorial']['id'] == memorial_id
+    assert len(body['tributes']) == PAGE_SECTION_LIMITS['tributes'] and body['has_more_tributes']
+    assert len(body['photos']) == 2 and body['videos'] == []
+    assert body['fundraiser']['title'] == 'Funeral costs'
+    assert len(body['fundraiser']['recent_donations']) == 2
+
+def test_donations_are_public_details_only(app, client, owner):
+    memorial_id = _memorial(app, owner['user']['id'], donations=2)
+
+    donations = client.get(f'/api/memorials/{memorial_id}/page').get_json()['fundraiser']['recent_donations']
+
+    assert all('donor_email' not in donation and 'donor_phone' not in donation for donation in donations)
+    assert sorted(donation['donor_name'] for donation in donations) == ['Anonymous', 'Wairimu']
+    assert [donation['is_anonymous'] for donation in donations if donation['donor_name'] == 'Anonymous'] == [True]
+
+def test_query_count_does_not_grow_with_the_page(app, client, owner, queries):
+    small = _memorial(app, owner['user']['id'], tributes=1, photos=1, donations=1)
+    large = _memorial(app, owner['user']['id'], tributes=30, photos=30, donations=15)
+
+    queries.clear()
+    client.get(f'/api/memorials/{small}/page')
+    small_count = len(queries)
+    queries.clear()
+    client.get(f'/api/memorials/{large}/page')
+
+    # The memorial with its fundraisers, then tributes, photos, videos and donations
+    assert len(queries) == small_count == 5
+
+def test_private_memorials_are_for_their_owner(app, client, owner):
+    memorial_id = _memorial(app, owner['user']['id'], visibility=MemorialVisibility.PRIVATE)
+    url = f'/api/memorials/{memorial_id}/page'
+
+    assert client.get(url).status_code == 403
+    assert client.get(url, headers=auth(register(client)['access_token'])).status_code == 403
+    assert client.get(url, headers=auth(owner['access_token'])).status_code == 200
+
+def test_family_memorials_need_a_login(app, client, owner):
+    memorial_id = _memorial(app, owner['user']['id'], visibility=MemorialVisibility.FAMILY_ONLY)
+    url = f'/api/memorials/{memorial_id}/page'
+
+    assert client.get(url).status_code == 401
+    assert client.get(url, headers=auth(register(client)['access_token'])).status_code == 200
+
+def test_unknown_memorial_is_not_found(client):
+    assert client.get('/api/memorials/missing/page').status_code == 404
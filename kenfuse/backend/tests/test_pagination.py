@@ -0,0 +1,84 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models import Memorial, MemorialVisibility
+from app.utils.pagination import decode_cursor, encode_cursor
+from conftest import register
+
+@pytest.fixture
+def memorial_ids(app, client):
+    """25 memorials, several sharing a created_at so ids break the tie"""
+    user_id = register(client)['user']['id']
+    start = datetime(2024, 1, 1)
+    with app.app_context():
+        memorials = [
+            Memorial(
+                user_id=user_id,
+                deceased_name=f'Person {index}',
+                date_of_birth=date(1950, 1, 1),
+                date_of_passing=date(2020, 1, 1),
+                visibility=MemorialVisibility.PRIVATE if index % 5 == 4 else MemorialVisibility.PUBLIC,
+                created_at=start + timedelta(minutes=index // 3)
+            )
+            for index in range(25)
+        ]
+        db.session.add_all(memorials)
+        db.session.commit()
+        ordered = sorted(memorials, key=lambda memorial: (memorial.created_at, memorial.id), reverse=True)
+        return [memorial.id for memorial in ordered if memorial.visibility == MemorialVisibility.PUBLIC]
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(created_at, 'abc')) == (created_at, 'abc')
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
+
+def test_cursor_pages_walk_every_row_once_in_order(client, memorial_ids):
+    seen = []
+    cursor = ''
+    while True:
+        response = client.get(f'/api/memorials?per_page=7&cursor={cursor}')
+        assert response.status_code == 200
+        body = response.get_json()
+        seen += [memorial['id'] for memorial in body['memorials']]
+        assert body['total'] == len(memorial_ids)
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+
+    assert seen == memorial_ids
+
+def test_new_rows_do_not_shift_later_pages(app, client, memorial_ids):
+    first = client.get('/api/memorials?per_page=5&cursor=').get_json()
+
+    with app.app_context():
+        db.session.add(Memorial(
+            user_id=db.session.get(Memorial, memorial_ids[0]).user_id,
+            deceased_name='Newest',
+            date_of_birth=date(1950, 1, 1),
+            date_of_passing=date(2020, 1, 1)
+        ))
+        db.session.commit()
+
+    second = client.get(f'/api/memorials?per_page=5&cursor={first["next_cursor"]}').get_json()
+    assert [memorial['id'] for memorial in second['memorials']] == memorial_ids[5:10]
+
+def test_page_mode_matches_cursor_order(client, memorial_ids):
+    body = client.get('/api/memorials?per_page=7&page=2').get_json()
+
+    assert [memorial['id'] for memorial in body['memorials']] == memorial_ids[7:14]
+    assert body['pages'] == 3
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get('/api/memorials?cursor=%%%').status_code == 400
+    assert client.get('/api/fundraisers?cursor=bm9wZQ').status_code == 400
+
+@pytest.mark.parametrize('listing', ['memorials', 'fundraisers'])
+@pytest.mark.parametrize('per_page', [0, -1])
+def test_non_positive_page_size_is_clamped(client, memorial_ids, listing, per_page):
+    for mode in ('cursor=', 'page=1'):
+        response = client.get(f'/api/{listing}?per_page={per_page}&{mode}')
+        assert response.status_code == 200
+        assert len(response.get_json()[listing]) == (1 if listing == 'memorials' else 0)
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from app.services.password_service import PasswordHasher, PasswordHasherBusy
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out waiting'
+        time.sleep(0.01)
+
+@pytest.fixture
+def pooled_hasher():
+    hasher = PasswordHasher()
+    hasher.rounds = 4
+    hasher.workers = 1
+    hasher.timeout = 0.1
+    yield hasher
+    hasher._reset_executor()
+
+def test_hash_and_verify_inline():
+    hasher = PasswordHasher()
+    hasher.rounds = 4
+    password_hash = hasher.hash('correct horse')
+
+    assert hasher.verify('correct horse', password_hash)
+    assert not hasher.verify('wrong', password_hash)
+    assert not hasher.verify('correct horse', 'not-a-bcrypt-hash')
+    assert not hasher.needs_rehash(password_hash)
+    hasher.rounds = 5
+    assert hasher.needs_rehash(password_hash)
+
+def test_hash_in_pool(pooled_hasher):
+    pooled_hasher.timeout = 10
+    password_hash = pooled_hasher.hash('secret')
+
+    assert pooled_hasher.verify('secret', password_hash)
+    assert pooled_hasher.stats()['queue_depth'] == 0
+
+def test_timed_out_job_holds_its_slot_until_it_finishes(pooled_hasher):
+    pooled_hasher.max_pending = 1
+
+    with pytest.raises(PasswordHasherBusy, match='timed out'):
+        pooled_hasher._run(_sleep, 0.5)
+
+    # The job is still running in the pool, so the queue is still full
+    assert pooled_hasher.stats()['queue_depth'] == 1
+    with pytest.raises(PasswordHasherBusy, match='full'):
+        pooled_hasher._run(_sleep, 0)
+
+    _wait_for(lambda: pooled_hasher.stats()['queue_depth'] == 0)
+    pooled_hasher.timeout = 10
+    assert pooled_hasher._run(_sleep, 0) == 0
+
+def test_queue_depth_counts_every_unfinished_job(pooled_hasher):
+    pooled_hasher.max_pending = 2
+
+    for _ in range(2):
+        with pytest.raises(PasswordHasherBusy, match='timed out'):
+            pooled_hasher._run(_sleep, 0.3)
+
+    assert pooled_hasher.stats()['queue_depth'] == 2
+    with pytest.raises(PasswordHasherBusy, match='full'):
+        pooled_hasher._run(_sleep, 0)
+    _wait_for(lambda: pooled_hasher.stats()['queue_depth'] == 0)
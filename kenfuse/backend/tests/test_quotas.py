@@ -0,0 +1,50 @@
+import pytest
+
+from conftest import register, auth
+
+@pytest.fixture
+def client(make_app):
+    app = make_app(ANONYMOUS_RATE_LIMITS={'read': '5 per minute', 'write': '3 per minute'})
+    return app.test_client()
+
+def _remaining(response):
+    return int(response.headers['RateLimit-Remaining'])
+
+def test_read_bucket_is_shared_across_endpoints(client):
+    assert _remaining(client.get('/api/memorials')) == 4
+    assert _remaining(client.get('/api/fundraisers')) == 3
+    assert _remaining(client.get('/api/memorials/search?q=x')) == 2
+    client.get('/api/fundraisers')
+    client.get('/api/memorials')
+
+    response = client.get('/api/fundraisers')
+    assert response.status_code == 429
+
+def test_write_bucket_is_separate_from_reads(client):
+    for _ in range(5):
+        client.get('/api/memorials')
+    assert client.get('/api/fundraisers').status_code == 429
+
+    response = client.post('/api/memorials', json={})
+    assert response.status_code != 429
+    assert _remaining(response) == 2
+
+def test_preflight_is_not_charged(client):
+    for _ in range(10):
+        response = client.options('/api/memorials', headers={
+            'Origin': 'http://localhost:3000',
+            'Access-Control-Request-Method': 'GET'
+        })
+        assert response.status_code != 429
+    assert _remaining(client.get('/api/memorials')) == 4
+
+def test_users_are_counted_apart_from_their_address(client):
+    for _ in range(5):
+        client.get('/api/memorials')
+    assert client.get('/api/memorials').status_code == 429
+
+    # Registration has its own limit rather than the plan quota
+    token = register(client)['access_token']
+    response = client.get('/api/memorials', headers=auth(token))
+    assert response.status_code == 200
+    assert int(response.headers['RateLimit-Limit']) > 5
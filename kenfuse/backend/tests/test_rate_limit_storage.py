@@ -0,0 +1,91 @@
+import sqlite3
+import time
+
+import pytest
+
+from app.services import rate_limit_storage
+from app.services.rate_limit_storage import SQLiteStorage
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+    def perf_counter(self):
+        return time.perf_counter()
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit_storage, 'time', clock)
+    return clock
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / 'ratelimits.sqlite3'
+
+def _rows(path, table):
+    with sqlite3.connect(path) as connection:
+        return connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+def test_moving_window_is_shared_between_processes(clock, path):
+    first = SQLiteStorage(f'sqlite:///{path}', sync_interval=0)
+    second = SQLiteStorage(f'sqlite:///{path}', sync_interval=0)
+
+    assert all(first.acquire_entry('user:1', 5, 60) for _ in range(3))
+    assert all(second.acquire_entry('user:1', 5, 60) for _ in range(2))
+    assert not first.acquire_entry('user:1', 5, 60)
+    assert second.get_moving_window('user:1', 5, 60)[1] == 5
+
+    clock.now += 61
+    assert first.acquire_entry('user:1', 5, 60)
+
+def test_moving_window_purges_keys_that_never_return(clock, path):
+    storage = SQLiteStorage(f'sqlite:///{path}', sync_interval=0)
+    for number in range(2000):
+        assert storage.acquire_entry(f'address:{number}', 10, 60)
+    assert _rows(path, 'ratelimit_events') == 2000
+
+    clock.now += 120
+    assert storage.acquire_entry('address:new', 10, 60)
+
+    assert _rows(path, 'ratelimit_events') == 1
+    assert list(storage._windows) == ['address:new']
+    assert not storage._pending_events.keys() - {'address:new'}
+
+def test_purge_keeps_events_inside_longer_windows(clock, path):
+    storage = SQLiteStorage(f'sqlite:///{path}', sync_interval=0)
+    assert storage.acquire_entry('daily', 100, 86400)
+    assert storage.acquire_entry('minute', 100, 60)
+
+    clock.now += 120
+    assert storage.acquire_entry('other', 100, 60)
+
+    assert storage.get_moving_window('daily', 100, 86400)[1] == 1
+    assert _rows(path, 'ratelimit_events') == 2
+
+def test_fixed_window_purges_expired_counters(clock, path):
+    storage = SQLiteStorage(f'sqlite:///{path}', sync_interval=0)
+    for number in range(500):
+        assert storage.incr(f'address:{number}', 60) == 1
+    assert _rows(path, 'ratelimit_counters') == 500
+
+    clock.now += 120
+    assert storage.incr('address:new', 60) == 1
+
+    assert _rows(path, 'ratelimit_counters') == 1
+    assert list(storage._counters) == ['address:new']
+
+def test_batched_hits_are_written_on_flush(clock, path):
+    storage = SQLiteStorage(f'sqlite:///{path}', sync_interval=10)
+    assert storage.acquire_entry('user:1', 10, 60)
+    for _ in range(3):
+        assert storage.acquire_entry('user:1', 10, 60)
+    assert _rows(path, 'ratelimit_events') == 1
+
+    storage.flush()
+
+    assert _rows(path, 'ratelimit_events') == 4
+    assert SQLiteStorage(f'sqlite:///{path}', sync_interval=0).get_moving_window('user:1', 10, 60)[1] == 4
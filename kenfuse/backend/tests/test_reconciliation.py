@@ -0,0 +1,200 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models import (
+    Donation, Fundraiser, FundraiserStatus, Payment, PaymentMethod, PaymentStatus, ReconciliationRun, SettlementLine
+)
+from app.services.reconciliation_service import StatementError, read_statement, reconcile
+from app.services.stats_service import counter
+from app.utils.ids import transaction_id
+
+# Payments are stored in UTC; M-Pesa statements are in EAT
+PAID = datetime(2024, 3, 1, 9, 0)
+MPESA_HEADER = 'Receipt No.,Completion Time,Details,Transaction Status,Paid In\n'
+
+def _mpesa_row(receipt, amount, at=PAID, status='Completed'):
+    return f'{receipt},{(at + timedelta(hours=3)):%Y-%m-%d %H:%M:%S},Donation,{status},"{amount:,.2f}"\n'
+
+def _mpesa(*rows):
+    preamble = 'Account Name,Kenfuse\nStatement Period,2024-03-01 - 2024-03-31\n\n'
+    return io.StringIO(preamble + MPESA_HEADER + ''.join(rows))
+
+def _report(output):
+    return list(csv.DictReader(io.StringIO(output.getvalue())))
+
+def _donation(fundraiser_id, amount, status=PaymentStatus.COMPLETED, receipt=None, at=PAID, link=True):
+    """A donation and its M-Pesa payment; returns (donation_id, payment_id)"""
+    donation = Donation(fundraiser_id=fundraiser_id, amount=amount, payment_method='mpesa',
+                        transaction_id=transaction_id('DON'), donor_name='Achieng', donor_phone='+254700000001')
+    db.session.add(donation)
+    db.session.flush()
+    payment = Payment(amount=amount, payment_method=PaymentMethod.MPESA, status=status, mpesa_receipt=receipt,
+                      donation_id=donation.id if link else None, created_at=at,
+                      payment_metadata={'donation_id': donation.id})
+    db.session.add(payment)
+    db.session.commit()
+    return donation.id, payment.id
+
+def test_read_statement_skips_the_preamble_and_reports_bad_rows():
+    stream = _mpesa(
+        _mpesa_row('QA1', 1500),
+        '\n',
+        'QA2,not a time,Donation,Completed,200\n',
+        _mpesa_row('QA3', 50, status='Failed'),
+        _mpesa_row('', 75)
+    )
+
+    lines = list(read_statement(stream, 'mpesa'))
+
+    assert [line.reference for line in lines] == ['QA1', 'QA2', 'QA3', '']
+    assert lines[0].amount == 1500.0 and lines[0].settled_at == PAID and lines[0].settled
+    assert lines[1].error and lines[1].amount is None
+    assert not lines[2].settled and lines[2].error is None
+    assert lines[3].error == 'missing reference'
+
+def test_read_statement_needs_a_header():
+    with pytest.raises(StatementError):
+        list(read_statement(io.StringIO('a,b,c\n1,2,3\n'), 'stripe'))
+
+def test_clean_statement_has_no_mismatches(app, fundraiser_id):
+    with app.app_context():
+        _donation(fundraiser_id, 1500, receipt='QA1')
+        _donation(fundraiser_id, 500, receipt='QA2', at=PAID + timedelta(hours=1))
+        db.session.get(Fundraiser, fundraiser_id).current_amount = 2000
+        db.session.commit()
+        report = io.StringIO()
+
+        run = reconcile({'mpesa': ('march.csv', _mpesa(
+            _mpesa_row('QA1', 1500), _mpesa_row('QA2', 500, PAID + timedelta(hours=1))
+        ))}, report)
+
+        assert _report(report) == []
+        assert run.summary == {'statement_lines': 2, 'matched': 2}
+        assert run.sources == {'mpesa': 'march.csv'} and run.finished_at is not None
+        # Staged lines are dropped once the run is over
+        assert db.session.query(SettlementLine).count() == 0
+
+def test_statement_mismatches_are_reported(app, fundraiser_id):
+    with app.app_context():
+        _, short_id = _donation(fundraiser_id, 1000, receipt='QA1')
+        _, pending_id = _donation(fundraiser_id, 300, status=PaymentStatus.PENDING, receipt='QA2')
+        _, unsettled_id = _donation(fundraiser_id, 700, receipt='QA3', at=PAID + timedelta(minutes=30))
+        _, window_id = _donation(fundraiser_id, 450, at=PAID + timedelta(minutes=2))
+        report = io.StringIO()
+
+        run = reconcile({'mpesa': ('march.csv', _mpesa(
+            _mpesa_row('QA1', 900),
+            _mpesa_row('QA2', 300),
+            _mpesa_row('QA9', 450, PAID + timedelta(minutes=5)),
+            _mpesa_row('QX1', 60),
+            _mpesa_row('QX1', 60),
+            _mpesa_row('QA4', 20, PAID + timedelta(hours=1))
+        ))}, report, batch_size=2)
+
+        rows = {(row['kind'], row['reference']): row for row in _report(report)}
+        assert rows[('amount_mismatch', 'QA1')]['payment_id'] == short_id
+        assert rows[('settled_not_completed', 'QA2')]['payment_id'] == pending_id
+        assert rows[('missing_reference', 'QA9')]['payment_id'] == window_id
+        assert rows[('unsettled_payment', 'QA3')]['payment_id'] == unsettled_id
+        assert rows[('duplicate_settlement', 'QX1')]['actual'] == '2'
+        assert ('unmatched_settlement', 'QA4') in rows
+        assert run.summary['unmatched_settlement'] == 3
+        assert run.summary['statement_lines'] == 6
+
+def test_payments_are_linked_and_donations_checked(app, fundraiser_id):
+    with app.app_context():
+        _, unlinked_id = _donation(fundraiser_id, 200, receipt='QA1', link=False)
+        orphan = Donation(fundraiser_id=fundraiser_id, amount=80, payment_method='mpesa',
+                          transaction_id=transaction_id('DON'), donor_name='Kip', donor_phone='+254700000002')
+        db.session.add(orphan)
+        db.session.commit()
+        report = io.StringIO()
+
+        run = reconcile({}, report)
+
+        assert db.session.get(Payment, unlinked_id).donation_id is not None
+        assert run.summary['linked_payments'] == 1
+        assert [row['donation_id'] for row in _report(report) if row['kind'] == 'donation_without_payment'] == [orphan.id]
+
+def test_fundraiser_totals_are_corrected_only_when_applied(app, fundraiser_id):
+    with app.app_context():
+        _donation(fundraiser_id, 1500, receipt='QA1')
+        _donation(fundraiser_id, 250, status=PaymentStatus.PENDING, receipt='QA2')
+        _donation(fundraiser_id, 999, status=PaymentStatus.FAILED)
+        db.session.get(Fundraiser, fundraiser_id).current_amount = 4000
+        db.session.commit()
+
+        def statement():
+            return {'mpesa': ('march.csv', _mpesa(_mpesa_row('QA1', 1500), _mpesa_row('QA2', 250)))}
+
+        dry = reconcile(statement(), io.StringIO())
+        assert dry.summary['fundraiser_total'] == 1 and not dry.applied
+        db.session.expire_all()
+        assert db.session.get(Fundraiser, fundraiser_id).current_amount == 4000
+
+        # The pending payment is settled on the statement, so it counts as received
+        applied = reconcile(statement(), io.StringIO(), apply=True)
+        assert applied.summary['fundraisers_corrected'] == 1 and applied.applied
+        db.session.expire_all()
+        assert db.session.get(Fundraiser, fundraiser_id).current_amount == 1750
+        assert db.session.query(ReconciliationRun).count() == 2
+
+def _donate(client, fundraiser_id, amount):
+    response = client.post(f'/api/fundraisers/{fundraiser_id}/donate', json={
+        'amount': amount, 'donor_name': 'Achieng', 'donor_phone': '0712345678', 'payment_method': 'mpesa'
+    })
+    assert response.status_code == 201
+
+def _total(fundraiser_id):
+    db.session.expire_all()
+    return db.session.get(Fundraiser, fundraiser_id).current_amount
+
+def test_pending_donations_outside_the_statements_keep_their_total(app, client, fundraiser_id):
+    for _ in range(3):
+        _donate(client, fundraiser_id, 500)
+
+    with app.app_context():
+        run = reconcile({'mpesa': ('empty.csv', _mpesa())}, io.StringIO(), apply=True)
+
+        assert 'fundraiser_total' not in run.summary
+        assert _total(fundraiser_id) == 1500
+
+def test_pending_donations_in_the_statement_period_are_missing(app, client, fundraiser_id):
+    for _ in range(3):
+        _donate(client, fundraiser_id, 500)
+
+    with app.app_context():
+        # One of the three prompts was paid; the statement ends after all of them were made
+        statement = _mpesa(_mpesa_row('QA1', 500, datetime.utcnow() + timedelta(minutes=1)))
+        run = reconcile({'mpesa': ('today.csv', statement)}, io.StringIO(), apply=True)
+
+        assert run.summary['missing_reference'] == 1
+        assert run.summary['fundraisers_corrected'] == 1
+        assert _total(fundraiser_id) == 500
+
+def test_corrections_recompute_the_status(app, fundraiser_id):
+    with app.app_context():
+        _donation(fundraiser_id, 10000, receipt='QA1')
+        active, completed = counter('fundraisers.status.active'), counter('fundraisers.status.completed')
+
+        reconcile({}, io.StringIO(), apply=True)
+
+        fundraiser = db.session.get(Fundraiser, fundraiser_id)
+        assert fundraiser.current_amount == 10000 and fundraiser.status == FundraiserStatus.COMPLETED
+        assert counter('fundraisers.status.active') == active - 1
+        assert counter('fundraisers.status.completed') == completed + 1
+
+        # A refund takes it back below the target while it is still running
+        db.session.query(Payment).update({'status': PaymentStatus.REFUNDED})
+        db.session.commit()
+        reconcile({'mpesa': ('march.csv', _mpesa(_mpesa_row('QA2', 20)))}, io.StringIO(), apply=True)
+
+        db.session.expire_all()
+        fundraiser = db.session.get(Fundraiser, fundraiser_id)
+        assert fundraiser.current_amount == 0 and fundraiser.status == FundraiserStatus.ACTIVE
+        assert counter('fundraisers.status.active') == active
+        assert counter('fundraisers.status.completed') == completed
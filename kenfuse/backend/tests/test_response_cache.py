@@ -0,0 +1,98 @@
+from datetime import date
+
+import pytest
+
+from app.extensions import db, response_cache
+from app.models import Memorial
+from app.services.response_cache import LocalBackend
+from conftest import register, auth
+
+def test_local_backend_is_bounded_by_body_bytes():
+    backend = LocalBackend(max_bytes=10)
+    backend.set('a', {}, b'1234', {'x'}, 60)
+    backend.set('b', {}, b'1234', {'y'}, 60)
+    backend.get('a')  # Recently used survives
+    backend.set('c', {}, b'1234', {'x'}, 60)
+
+    assert backend.get('a') is not None and backend.get('c') is not None
+    assert backend.get('b') is None
+    assert backend.size == 8
+
+    backend.purge({'x'})
+    assert backend.get('a') is None and backend.get('c') is None
+    assert backend.size == 0 and backend._tags == {}
+
+def test_expired_entries_are_misses():
+    backend = LocalBackend()
+    backend.set('a', {}, b'body', set(), -1)
+    assert backend.get('a') is None
+    assert backend.size == 0
+
+@pytest.fixture
+def memorial_id(app, client):
+    user_id = register(client)['user']['id']
+    with app.app_context():
+        memorial = Memorial(user_id=user_id, deceased_name='Grace Achieng',
+                            date_of_birth=date(1950, 1, 1), date_of_passing=date(2020, 1, 1))
+        db.session.add(memorial)
+        db.session.commit()
+        return memorial.id
+
+def test_anonymous_reads_hit_until_a_write_purges(app, client, memorial_id):
+    url = f'/api/memorials/{memorial_id}'
+    first = client.get(url)
+    assert first.headers['X-Cache'] == 'MISS'
+    hit = client.get(url)
+    assert hit.headers['X-Cache'] == 'HIT'
+    assert hit.get_json() == first.get_json()
+
+    with app.app_context():
+        db.session.get(Memorial, memorial_id).deceased_name = 'Grace Atieno'
+        db.session.commit()
+
+    fresh = client.get(url)
+    assert fresh.headers['X-Cache'] == 'MISS'
+    assert 'Atieno' in fresh.get_data(as_text=True)
+
+def test_rolled_back_writes_keep_entries(app, client, memorial_id):
+    client.get('/api/memorials')
+
+    with app.app_context():
+        db.session.get(Memorial, memorial_id).deceased_name = 'Never saved'
+        db.session.flush()
+        db.session.rollback()
+
+    assert client.get('/api/memorials').headers['X-Cache'] == 'HIT'
+
+def test_query_args_are_part_of_the_key(client, memorial_id):
+    client.get('/api/memorials?per_page=5&visibility=public')
+
+    assert client.get('/api/memorials?visibility=public&per_page=5').headers['X-Cache'] == 'HIT'
+    assert client.get('/api/memorials?per_page=6').headers['X-Cache'] == 'MISS'
+
+def test_authenticated_and_failed_requests_are_not_cached(client, memorial_id):
+    token = register(client)['access_token']
+    client.get('/api/memorials', headers=auth(token))
+    assert 'X-Cache' not in client.get('/api/memorials', headers=auth(token)).headers
+    assert client.get('/api/memorials').headers['X-Cache'] == 'MISS'
+
+    client.get('/api/fundraisers/missing')
+    assert client.get('/api/fundraisers/missing').headers['X-Cache'] == 'MISS'
+
+def test_hits_answer_conditional_requests(client, memorial_id):
+    url = f'/api/memorials/{memorial_id}'
+    etag = client.get(url).headers['ETag']
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['X-Cache'] == 'HIT'
+
+def test_purge_after_commit_covers_bulk_updates(app, client, memorial_id):
+    client.get('/api/memorials')
+
+    with app.app_context():
+        db.session.execute(db.update(Memorial).values(location='Kisumu'))
+        response_cache.purge_after_commit(db.session, 'memorials')
+        db.session.commit()
+
+    assert client.get('/api/memorials').headers['X-Cache'] == 'MISS'
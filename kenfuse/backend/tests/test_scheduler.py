@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db, scheduler
+from app.models import Fundraiser, FundraiserStatus, SchedulerLease, SubscriptionPlan, User
+from app.services.lifecycle_service import expire_fundraisers, lapse_subscriptions
+from app.services.scheduler import Scheduler
+from app.services.stats_service import counter
+from conftest import register, auth
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+
+@pytest.fixture
+def workers(app):
+    """Two schedulers with the same job, as in two worker processes"""
+    calls = []
+    pair = []
+    for _ in range(2):
+        worker = Scheduler()
+        worker.init_app(app)
+        worker.holder = f'worker-{len(pair)}'
+        worker.register('sweep', lambda: calls.append(1) or 3, interval=300)
+        pair.append(worker)
+    app.extensions['scheduler'] = scheduler
+    return pair, calls
+
+def test_only_one_worker_runs_a_job_at_a_time(ctx, workers):
+    (first, second), calls = workers
+    inner = []
+    first.register('sweep', lambda: inner.append(second.run('sweep', force=True)) or 1, interval=300)
+
+    run = first.run('sweep')
+
+    assert run.rows == 1 and run.holder == 'worker-0'
+    # The second worker could not take the lease while the first held it
+    assert inner == [None]
+    assert calls == []
+
+def test_interval_is_shared_between_workers(ctx, workers):
+    (first, second), calls = workers
+
+    assert first.run('sweep').rows == 3
+    assert second.run('sweep') is None
+    assert first.run('sweep') is None
+    assert second.run('sweep', force=True) is not None
+    assert len(calls) == 2
+
+def test_expired_lease_is_taken_over(ctx, workers):
+    (first, second), calls = workers
+    first.run('sweep')
+    # The first worker died mid-run: its lease is still held but has lapsed
+    db.session.query(SchedulerLease).filter_by(name='sweep').update({
+        'holder': 'worker-0',
+        'expires_at': datetime.utcnow() - timedelta(seconds=1),
+        'last_run_at': datetime.utcnow() - timedelta(hours=1)
+    })
+    db.session.commit()
+
+    assert second.run('sweep').holder == 'worker-1'
+    assert db.session.get(SchedulerLease, 'sweep').expires_at is None
+
+def test_failures_are_recorded_and_release_the_lease(ctx, workers):
+    (first, second), _ = workers
+    first.register('sweep', lambda: 1 / 0, interval=300)
+
+    run = first.run('sweep')
+
+    assert run.error.startswith('ZeroDivisionError')
+    assert second.run('sweep', force=True) is not None
+    assert [run.name for run in first.recent_runs('sweep')] == ['sweep', 'sweep']
+
+
+def test_expire_fundraisers_closes_ended_ones_in_batches(app, client):
+    user_id = register(client)['user']['id']
+    now = datetime.utcnow()
+    with app.app_context():
+        for days in (-3, -2, -1, 1):
+            db.session.add(Fundraiser(user_id=user_id, title='Fund', description='Fund',
+                                      target_amount=100, end_date=now + timedelta(days=days)))
+        db.session.commit()
+        active_before = counter('fundraisers.status.active')
+
+        assert expire_fundraisers(batch_size=2) == 3
+        assert expire_fundraisers(batch_size=2) == 0
+
+        statuses = [status for (status,) in db.session.query(Fundraiser.status)]
+        assert statuses.count(FundraiserStatus.COMPLETED) == 3
+        assert counter('fundraisers.status.active') == active_before - 3
+        assert counter('fundraisers.status.completed') == 3
+
+def test_lapse_subscriptions_downgrades_and_revokes_tokens(app, client):
+    data = register(client)
+    with app.app_context():
+        user = db.session.get(User, data['user']['id'])
+        user.subscription_plan = SubscriptionPlan.PREMIUM
+        user.subscription_expiry = datetime.utcnow() + timedelta(days=30)
+        db.session.commit()
+    token = client.post('/api/login', json={'email': data['user']['email'], 'password': 'password123'}).get_json()['access_token']
+    assert client.get('/api/me', headers=auth(token)).status_code == 200
+
+    with app.app_context():
+        assert lapse_subscriptions(now=datetime.utcnow() + timedelta(days=31)) == 1
+        assert db.session.get(User, data['user']['id']).subscription_plan == SubscriptionPlan.FREE
+        assert lapse_subscriptions(now=datetime.utcnow() + timedelta(days=31)) == 0
+
+    # The token still claims the premium plan
+    assert client.get('/api/fundraisers/missing/analytics', headers=auth(token)).status_code == 401
@@ -0,0 +1,91 @@
+from datetime import date
+
+import pytest
+
+from app.extensions import db
+from app.models import Memorial, MemorialVisibility
+from app.services.search_service import reindex
+from conftest import register, auth
+
+@pytest.fixture
+def owner(client):
+    return register(client)
+
+@pytest.fixture
+def add_memorial(app, owner):
+    def add(name, visibility=MemorialVisibility.PUBLIC, **fields):
+        with app.app_context():
+            memorial = Memorial(
+                user_id=owner['user']['id'],
+                deceased_name=name,
+                date_of_birth=date(1950, 1, 1),
+                date_of_passing=date(2020, 1, 1),
+                visibility=visibility,
+                **fields
+            )
+            db.session.add(memorial)
+            db.session.commit()
+            return memorial.id
+    return add
+
+def _names(client, query, headers=None):
+    response = client.get('/api/memorials/search', query_string={'q': query}, headers=headers)
+    assert response.status_code == 200
+    return [memorial['deceased_name'] for memorial in response.get_json()['memorials']]
+
+def test_matches_every_term_with_name_prefixes(client, add_memorial):
+    add_memorial('Wanjiru Kamau', location='Nyeri')
+    add_memorial('Otieno Kamande', location='Kisumu')
+    add_memorial('Akinyi Odhiambo', biography='Grew up near Kamau road')
+
+    names = _names(client, 'kama')
+    assert set(names) == {'Otieno Kamande', 'Wanjiru Kamau', 'Akinyi Odhiambo'}
+    # Names outrank the same word in a biography
+    assert names[-1] == 'Akinyi Odhiambo'
+    assert _names(client, 'kamau nyeri') == ['Wanjiru Kamau']
+
+def test_writes_keep_the_index_current(app, client, add_memorial):
+    memorial_id = add_memorial('Jane Muthoni')
+    assert _names(client, 'muthoni') == ['Jane Muthoni']
+
+    with app.app_context():
+        db.session.get(Memorial, memorial_id).deceased_name = 'Jane Njeri'
+        db.session.commit()
+    assert _names(client, 'muthoni') == []
+    assert _names(client, 'njeri') == ['Jane Njeri']
+
+    with app.app_context():
+        db.session.delete(db.session.get(Memorial, memorial_id))
+        db.session.commit()
+    assert _names(client, 'njeri') == []
+
+def test_visibility_follows_the_caller(client, owner, add_memorial):
+    add_memorial('Public Wambui')
+    add_memorial('Family Wambui', MemorialVisibility.FAMILY_ONLY)
+    add_memorial('Private Wambui', MemorialVisibility.PRIVATE)
+    stranger = register(client)
+
+    assert _names(client, 'wambui') == ['Public Wambui']
+    assert set(_names(client, 'wambui', auth(stranger['access_token']))) == {'Public Wambui', 'Family Wambui'}
+    assert set(_names(client, 'wambui', auth(owner['access_token']))) == {'Public Wambui', 'Family Wambui', 'Private Wambui'}
+
+def test_query_syntax_is_not_passed_through(client, add_memorial):
+    add_memorial('Chebet Kiprono')
+
+    for query in ['"chebet', '(chebet', 'chebet*)', 'kiprono -chebet', 'chebet: ^kiprono']:
+        assert _names(client, query) == ['Chebet Kiprono']
+    # Operators are plain words, and every word must match
+    assert _names(client, 'chebet OR') == []
+    assert client.get('/api/memorials/search?q=%20').status_code == 400
+
+def test_reindex_rebuilds_from_memorials(app, client, add_memorial):
+    add_memorial('Moraa Nyaboke')
+    with app.app_context():
+        db.session.execute(db.text('DELETE FROM memorial_search'))
+        db.session.commit()
+    assert _names(client, 'moraa') == []
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            assert reindex(connection) == 1
+    assert _names(client, 'moraa') == ['Moraa Nyaboke']
@@ -0,0 +1,83 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('gevent')
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in its own interpreter: stream_server monkey-patches the standard
+# library on import, which must not leak into the rest of the suite
+SMOKE = '''
+import json, sys, urllib.error, urllib.request
+
+import stream_server
+import gevent
+from gevent.pywsgi import WSGIServer
+from app.extensions import event_hub
+
+fundraiser_id, clients = sys.argv[1], int(sys.argv[2])
+server = WSGIServer(('127.0.0.1', 0), stream_server.streams_only, log=None)
+server.start()
+base = 'http://127.0.0.1:%d' % server.server_port
+
+def listen():
+    events = []
+    with urllib.request.urlopen(base + '/api/fundraisers/%s/stream' % fundraiser_id, timeout=10) as response:
+        for line in response:
+            if line.startswith(b'event: '):
+                events.append([line[7:].strip().decode()])
+            elif line.startswith(b'data: '):
+                events[-1].append(json.loads(line[6:]))
+                if len(events) == 2:
+                    return events
+
+def status(path):
+    try:
+        return urllib.request.urlopen(base + path, timeout=10).status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+listeners = [gevent.spawn(listen) for _ in range(clients)]
+with gevent.Timeout(10):
+    while event_hub.stats()['subscribers'] < clients:
+        gevent.sleep(0.01)
+event_hub.publish('fundraiser:' + fundraiser_id, 'progress', {'current_amount': 250})
+gevent.joinall(listeners, timeout=10, raise_error=True)
+
+print(json.dumps({
+    'events': [listener.value for listener in listeners],
+    'api': status('/api/fundraisers/' + fundraiser_id),
+    'missing': status('/api/fundraisers/missing/stream')
+}))
+server.stop()
+'''
+
+def test_streams_receive_published_events_under_gevent(app, fundraiser_id, tmp_path):
+    env = {
+        **os.environ,
+        'FLASK_ENV': 'production',
+        'DATABASE_URL': app.config['SQLALCHEMY_DATABASE_URI'],
+        'BLOB_STORE_FOLDER': str(tmp_path / 'media'),
+        'UPLOAD_SESSION_FOLDER': str(tmp_path / 'media-uploads'),
+        'IMAGE_INCOMING_FOLDER': str(tmp_path / 'incoming'),
+        'RATELIMIT_STORAGE_URI': 'memory://',
+    }
+    for name in ('REDIS_URL', 'EVENT_HUB_URL'):
+        env.pop(name, None)
+
+    result = subprocess.run([sys.executable, '-c', SMOKE, fundraiser_id, '3'], cwd=BACKEND, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+    output = json.loads(result.stdout.strip().splitlines()[-1])
+    # Every stream gets its snapshot, then the event published while all three were waiting
+    assert output['events'] == [[['progress', {'current_amount': 0.0, 'target_amount': 10000.0, 'progress_percentage': 0.0,
+                                               'status': 'active'}],
+                                 ['progress', {'current_amount': 250}]]] * 3
+    # Only streams are served here
+    assert output['api'] == 404
+    assert output['missing'] == 404
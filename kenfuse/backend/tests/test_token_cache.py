@@ -0,0 +1,164 @@
+import threading
+import time
+
+import pytest
+
+from app.extensions import provider_http, token_cache
+from app.services import token_cache as token_cache_module
+from app.services.payment_service import MpesaService
+from app.services.token_cache import TokenCache
+from app.utils.single_flight import SingleFlight
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(token_cache_module.time, 'time', clock)
+    return clock
+
+@pytest.fixture
+def cache(app, clock):
+    cache = TokenCache()
+    cache.init_app(app)
+    app.extensions['token_cache'] = token_cache
+    return cache
+
+class Provider:
+    """A token endpoint that hands out numbered tokens"""
+
+    def __init__(self, expires_in=3600, delay=0):
+        self.calls = 0
+        self.expires_in = expires_in
+        self.delay = delay
+        self.fail = False
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError('token endpoint down')
+        return f'token-{self.calls}', self.expires_in
+
+def test_token_is_reused_until_refresh_is_due(cache, clock):
+    provider = Provider()
+
+    assert cache.get('mpesa:174379', provider) == 'token-1'
+    clock.now += 3000
+    assert cache.get('mpesa:174379', provider) == 'token-1'
+    assert provider.calls == 1
+    # Expiry is pulled in by 30s and refresh starts 300s before that
+    assert cache.stats()['mpesa:174379'] == {'expires_in': 570.0, 'refresh_in': 270.0}
+
+def test_due_token_is_refreshed_and_kept_on_failure(cache, clock):
+    provider = Provider()
+    cache.get('mpesa:174379', provider)
+
+    clock.now += 3300
+    provider.fail = True
+    # The refresh fails, but the current token is still valid
+    assert cache.get('mpesa:174379', provider) == 'token-1'
+    provider.fail = False
+    assert cache.get('mpesa:174379', provider) == 'token-3'
+
+    clock.now += 3600
+    assert cache.get('mpesa:174379', provider) == 'token-4'
+
+def test_short_lived_tokens_refresh_halfway_through(cache, clock):
+    provider = Provider(expires_in=100)
+    cache.get('stripe', provider)
+
+    # Expiry is pulled in by 10% and refresh starts half the lifetime before that
+    assert cache.stats()['stripe'] == {'expires_in': 90.0, 'refresh_in': 40.0}
+
+def test_concurrent_misses_share_one_fetch(cache):
+    provider = Provider(delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('mpesa:174379', provider))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert provider.calls == 1
+    assert results == ['token-1'] * 8
+
+def test_invalidate_forgets_the_token(cache):
+    provider = Provider()
+    cache.get('mpesa:174379', provider)
+    cache.invalidate('mpesa:174379')
+
+    assert cache.get('mpesa:174379', provider) == 'token-2'
+
+def test_single_flight_shares_errors_and_forgets_finished_calls():
+    flight = SingleFlight(timeout=5)
+    started = threading.Event()
+    release = threading.Event()
+    outcomes = []
+
+    def leader():
+        started.set()
+        release.wait()
+        raise ValueError('boom')
+
+    def run(fn):
+        try:
+            outcomes.append(flight.do('key', fn))
+        except ValueError as e:
+            outcomes.append(str(e))
+
+    first = threading.Thread(target=run, args=(leader,))
+    first.start()
+    started.wait()
+    second = threading.Thread(target=run, args=(lambda: 'not called',))
+    second.start()
+    time.sleep(0.1)
+    release.set()
+    first.join()
+    second.join()
+
+    assert outcomes == ['boom', 'boom']
+    assert flight.in_flight() == 0
+    assert flight.do('key', lambda: 'fresh') == ('fresh', False)
+
+class Response:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f'{self.status_code} error')
+
+def test_stk_push_refetches_a_revoked_token_once(app, monkeypatch):
+    app.config.update(MPESA_CONSUMER_KEY='key', MPESA_CONSUMER_SECRET='secret', MPESA_SHORTCODE='174379', MPESA_PASSKEY='pass')
+    tokens = iter(['old', 'new'])
+    sent = []
+
+    def request(provider, method, url, **kwargs):
+        if url.endswith('/oauth/v1/generate'):
+            return Response(200, {'access_token': next(tokens), 'expires_in': '3599'})
+        sent.append(kwargs['headers']['Authorization'])
+        return Response(401 if len(sent) == 1 else 200, {'ResponseCode': '0'})
+
+    monkeypatch.setattr(provider_http, 'request', request)
+    with app.test_request_context():
+        token_cache.invalidate('mpesa:174379')
+        assert MpesaService().stk_push('254712345678', 100, 'REF', 'Donation') == {'ResponseCode': '0'}
+
+    assert sent == ['Bearer old', 'Bearer new']
+
+def test_provider_sessions_are_pooled_per_provider(app):
+    assert provider_http.session('mpesa') is provider_http.session('mpesa')
+    assert provider_http.session('mpesa') is not provider_http.session('stripe')
+    adapter = provider_http.session('mpesa').get_adapter('https://')
+    assert adapter.max_retries.connect == provider_http.connect_retries
+    assert adapter.max_retries.read == 0
@@ -0,0 +1,125 @@
+import hashlib
+import os
+
+import pytest
+
+from app.extensions import db, blob_store, resumable_uploads
+from app.models import MediaBlob, MemorialVideo, UploadSession
+from app.services import media_service
+from conftest import register, auth
+
+VIDEO = b'not really a video, ' * 1000
+
+@pytest.fixture
+def user(client):
+    token = register(client)['access_token']
+    response = client.post('/api/memorials', headers=auth(token), json={
+        'deceased_name': 'Jane Doe',
+        'date_of_birth': '1950-01-01',
+        'date_of_passing': '2020-01-01'
+    })
+    assert response.status_code == 201, response.get_json()
+    return token, response.get_json()['memorial']['id']
+
+def _start(client, user, data=VIDEO, **fields):
+    token, memorial_id = user
+    response = client.post(f'/api/memorials/{memorial_id}/videos/uploads', headers=auth(token),
+                           json={'filename': 'tribute.mp4', 'size': len(data), **fields})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['upload']['id']
+
+def _send(client, user, upload_id, data, offset=0):
+    return client.patch(f'/api/uploads/{upload_id}', headers={
+        **auth(user[0]),
+        'Content-Type': 'application/offset+octet-stream',
+        'Upload-Offset': str(offset)
+    }, data=data)
+
+def _complete(client, user, upload_id):
+    return client.post(f'/api/uploads/{upload_id}/complete', headers=auth(user[0]))
+
+def test_chunks_resume_from_the_reported_offset(client, user):
+    upload_id = _start(client, user)
+    assert _send(client, user, upload_id, VIDEO[:5000]).headers['Upload-Offset'] == '5000'
+
+    response = _send(client, user, upload_id, VIDEO[100:200], offset=100)
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == 5000
+
+    head = client.head(f'/api/uploads/{upload_id}', headers=auth(user[0]))
+    assert head.headers['Upload-Offset'] == '5000'
+    assert _send(client, user, upload_id, VIDEO[5000:], offset=5000).status_code == 200
+
+    response = _complete(client, user, upload_id)
+    assert response.status_code == 201
+    video = response.get_json()['video']
+    assert _complete(client, user, upload_id).get_json()['video']['id'] == video['id']
+
+    blob_hash = hashlib.sha256(VIDEO).hexdigest()
+    with open(blob_store.path(blob_hash), 'rb') as stored:
+        assert stored.read() == VIDEO
+    assert not os.path.exists(resumable_uploads.part_path(upload_id))
+
+def test_checksum_mismatch_discards_the_upload(client, user):
+    upload_id = _start(client, user, checksum='0' * 64)
+    _send(client, user, upload_id, VIDEO)
+
+    response = _complete(client, user, upload_id)
+    assert response.status_code == 400
+    assert client.head(f'/api/uploads/{upload_id}', headers=auth(user[0])).status_code == 404
+
+def test_retry_after_failed_commit(app, client, user, monkeypatch):
+    upload_id = _start(client, user)
+    _send(client, user, upload_id, VIDEO)
+
+    attach = media_service.attach
+    def fail_once(*args, **kwargs):
+        monkeypatch.setattr(media_service, 'attach', attach)
+        raise RuntimeError('database went away')
+    monkeypatch.setattr(media_service, 'attach', fail_once)
+
+    with app.app_context():
+        session = db.session.get(UploadSession, upload_id)
+        with pytest.raises(RuntimeError):
+            resumable_uploads.complete(session)
+        db.session.rollback()
+
+    # The part file has already moved into the blob store
+    assert not os.path.exists(resumable_uploads.part_path(upload_id))
+    response = _complete(client, user, upload_id)
+    assert response.status_code == 201
+
+    with app.app_context():
+        assert MemorialVideo.query.count() == 1
+        assert db.session.get(MediaBlob, hashlib.sha256(VIDEO).hexdigest()).ref_count == 1
+
+def test_concurrent_completions_make_one_video(app, client, user, monkeypatch):
+    upload_id = _start(client, user)
+    _send(client, user, upload_id, VIDEO)
+
+    put_file = blob_store.put_file
+    def complete_elsewhere_first(*args, **kwargs):
+        # Another request completes the same upload while this one is about to move the file
+        monkeypatch.setattr(blob_store, 'put_file', put_file)
+        with app.app_context():
+            other = db.session.get(UploadSession, upload_id)
+            complete_elsewhere_first.video_id = resumable_uploads.complete(other).id
+        return put_file(*args, **kwargs)
+    monkeypatch.setattr(blob_store, 'put_file', complete_elsewhere_first)
+
+    response = _complete(client, user, upload_id)
+    assert response.status_code == 201
+    assert response.get_json()['video']['id'] == complete_elsewhere_first.video_id
+
+    with app.app_context():
+        assert MemorialVideo.query.count() == 1
+        assert db.session.get(MediaBlob, hashlib.sha256(VIDEO).hexdigest()).ref_count == 1
+
+def test_missing_part_without_blob_is_rejected(app, client, user):
+    upload_id = _start(client, user)
+    _send(client, user, upload_id, VIDEO)
+    os.remove(resumable_uploads.part_path(upload_id))
+
+    response = _complete(client, user, upload_id)
+    assert response.status_code == 400
+    assert 'missing' in response.get_json()['error']
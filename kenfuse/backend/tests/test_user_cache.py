@@ -0,0 +1,104 @@
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app.extensions import db, user_cache
+from app.services import user_cache as user_cache_module
+from conftest import register, auth
+
+@pytest.fixture
+def user_id(app, client):
+    user_cache.clear()
+    return register(client)['user']['id']
+
+@pytest.fixture
+def queries(app):
+    """Statements run against the app's database"""
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', listener)
+
+def test_warm_lookups_do_not_query(app, user_id, queries):
+    with app.app_context():
+        assert user_cache.get(user_id).id == user_id
+    with app.app_context():
+        queries.clear()
+        user = user_cache.get(user_id)
+        assert user.email.startswith('user')
+        assert queries == []
+        # The copy belongs to the session like a loaded user
+        assert user in db.session
+
+def test_orm_update_evicts_the_user(app, user_id):
+    with app.app_context():
+        user_cache.get(user_id).first_name = 'Wanjiru'
+        db.session.commit()
+    with app.app_context():
+        assert user_cache.get(user_id).first_name == 'Wanjiru'
+
+def test_orm_delete_evicts_the_user(app, user_id):
+    with app.app_context():
+        db.session.delete(user_cache.get(user_id))
+        db.session.commit()
+    with app.app_context():
+        assert user_cache.get(user_id) is None
+
+def test_rolled_back_changes_keep_the_entry(app, user_id, queries):
+    with app.app_context():
+        user_cache.get(user_id).first_name = 'Never saved'
+        db.session.flush()
+        db.session.rollback()
+    with app.app_context():
+        queries.clear()
+        assert user_cache.get(user_id).first_name == 'Test'
+        assert queries == []
+
+def test_entries_expire_after_the_ttl(app, user_id, queries, monkeypatch):
+    with app.app_context():
+        user_cache.get(user_id)
+    later = time.monotonic() + user_cache.ttl + 1
+    monkeypatch.setattr(user_cache_module.time, 'monotonic', lambda: later)
+
+    with app.app_context():
+        queries.clear()
+        assert user_cache.get(user_id).id == user_id
+        assert len(queries) == 1
+
+def test_least_recently_used_entries_are_evicted(app, client, monkeypatch):
+    user_cache.clear()
+    monkeypatch.setattr(user_cache, 'maxsize', 2)
+    ids = [register(client)['user']['id'] for _ in range(3)]
+    with app.app_context():
+        for user_id in ids:
+            user_cache.get(user_id)
+
+    assert list(user_cache._entries) == ids[1:]
+
+def test_each_request_looks_a_user_up_once(app, user_id, monkeypatch):
+    lookups = []
+    lookup = user_cache._lookup
+    monkeypatch.setattr(user_cache, '_lookup', lambda key: lookups.append(key) or lookup(key))
+
+    with app.test_request_context():
+        first = user_cache.get(user_id)
+        assert user_cache.get(user_id) is first
+    with app.test_request_context():
+        user_cache.get(user_id)
+
+    assert lookups == [user_id, user_id]
+
+def test_admin_update_applies_on_the_next_request(client):
+    user = register(client)
+    token = user['access_token']
+    assert client.get('/api/me', headers=auth(token)).get_json()['user']['is_verified'] is False
+
+    admin = register(client, role='admin')
+    response = client.put(f"/api/users/{user['user']['id']}", json={'is_verified': True}, headers=auth(admin['access_token']))
+    assert response.status_code == 200
+
+    assert client.get('/api/me', headers=auth(token)).get_json()['user']['is_verified'] is True